@@ -4,6 +4,8 @@ from .base import Instance
 from .base import CustomPluginTemplate
 from .base import DistributedCustomCodePresets
 from .default import MqttSession as Session
+from .default import AsyncSession
+from .default import AmqpSession
 from .utils import load_dotenv
 from ._ver import __VER__ as version
 from ._ver import __VER__ as __version__
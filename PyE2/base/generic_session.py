@@ -1,9 +1,12 @@
+import asyncio
 import json
 import os
 import traceback
 from collections import deque
+from copy import deepcopy
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime as dt
-from threading import Lock, Thread
+from threading import Event, Lock, Thread
 from time import sleep
 from time import time as tm
 
@@ -13,10 +16,11 @@ from ..const import COMMANDS, ENVIRONMENT, HB, PAYLOAD_DATA, STATUS_TYPE
 from ..const import comms as comm_ct
 from ..io_formatter import IOFormatterWrapper
 from ..logging import Logger
-from ..utils import load_dotenv
-from .payload import Payload
+from ..utils import MessageQueue, TimerScheduler, load_dotenv, peek_json_string_field
+from .node_registry import NodeRegistry
+from .payload import LazyHeartbeat, Payload
 from .pipeline import Pipeline
-from .transaction import Transaction
+from .transaction import Transaction, TransactionsRegistry
 
 # TODO: add support for remaining commands from EE
 
@@ -72,6 +76,16 @@ class GenericSession(BaseDecentrAIObject):
                bc_engine=None,
                formatter_plugins_locations=['plugins.io_formatters'],
                root_topic="naeural",
+               message_queue_size=10000,
+               decode_workers=0,
+               send_queue_size=1000,
+               send_queue_policy='block',
+               command_coalescing_window=0,
+               lazy_heartbeats=False,
+               keep_heartbeat_heavy_fields=False,
+               heartbeat_history_size=0,
+               payload_keys=None,
+               consumer_group=None,
                **kwargs) -> None:
     """
     A Session is a connection to a communication server which provides the channel to interact with nodes from the Naeural network.
@@ -96,10 +110,17 @@ class GenericSession(BaseDecentrAIObject):
     config : dict, optional
         Configures the names of the channels this session will connect to.
         If using a Mqtt server, these channels are in fact topics.
+        A receive channel can also define a `NODE_TOPIC` template with a `{}` for the node address
+        (e.g. `{"PAYLOADS_CHANNEL": {"TOPIC": "{}/payloads", "NODE_TOPIC": "{}/payloads/{}"}}`), used when
+        `filter_workers` is set, if the nodes publish on per-node topics.
         Modify this if you are absolutely certain of what you are doing.
         By default {}
     filter_workers: list, optional
         If set, process the messages that come only from the nodes from this list.
+        The payloads and notifications channels with a `NODE_TOPIC` in `config` subscribe only to the topics
+        of these nodes, so the broker does not deliver the messages of other nodes. The heartbeats of all
+        the nodes are still received, so the online nodes are tracked.
+        The payloads and notifications from other nodes are dropped before being fully parsed.
         Defaults to None
     show_commands : bool
         If True, will print the commands that are being sent to the Naeural edge nodes.
@@ -132,6 +153,60 @@ class GenericSession(BaseDecentrAIObject):
     root_topic : str, optional
         This is the root of the topics used by the SDK. It is used to create the topics for the communication channels.
         Defaults to "naeural"
+    message_queue_size : int, optional
+        The maximum number of received messages buffered for each of the payload, notification and heartbeat
+        callback threads. When a buffer is full, new messages are dropped. If None, the buffers are unbounded.
+        Defaults to 10000
+    decode_workers : int, optional
+        If greater than 0, the parsing, decryption and formatting of received messages is done in a pool
+        of `decode_workers` threads, while the user callbacks are still called in the order the messages were received.
+        Useful when receiving bursts of large encrypted payloads. If 0, messages are decoded on the callback threads.
+        Defaults to 0
+    send_queue_size : int, optional
+        The maximum number of outgoing commands buffered by the communication layer and published by a dedicated
+        sender thread, so sending commands to many nodes does not block the caller and commands sent while
+        reconnecting are not lost. If 0, commands are published synchronously.
+        Defaults to 1000
+    send_queue_policy : str, optional
+        What happens when the outgoing buffer is full: 'block' waits until it drains, 'drop' discards the command,
+        'error' raises `ValueError`.
+        Defaults to 'block'
+    command_coalescing_window : float, optional
+        If greater than 0, the instance updates and instance commands sent to the same node within this
+        many seconds are merged into a single `BATCH_UPDATE_PIPELINE_INSTANCE` command, reducing the number
+        of messages and signatures. Each caller still gets its own transaction.
+        Defaults to 0 (disabled)
+    lazy_heartbeats : bool, optional
+        If True, the compressed part of the v2 heartbeats is decoded only when it is read (by the user callback,
+        `get_active_pipelines`, `get_allowed_nodes` etc.), and the pipelines of a node are synced from its last
+        heartbeat only when requested or when this session owns pipelines on that node.
+        Useful when listening to large fleets of nodes. In this mode, the heartbeats without `CONFIG_STREAMS`
+        are also passed to the `on_heartbeat` callback.
+        Defaults to False
+    keep_heartbeat_heavy_fields : bool, optional
+        If True, the last heartbeat kept for each node includes the bulky fields (logs, timers, pipelines configs),
+        capped to their last 100 elements. The heartbeat metrics are always kept.
+        Defaults to False
+    heartbeat_history_size : int, optional
+        If greater than 0, the metrics of the last `heartbeat_history_size` heartbeats of each node are kept
+        in memory and can be queried with `get_node_metric_history` and `get_node_metric_stat`.
+        Defaults to 0
+    payload_keys : list[str], optional
+        If set, the payloads passed to the user callbacks only contain these keys, along with the keys
+        identifying the sender (`EE_PAYLOAD_PATH`, `EE_SENDER`, `EE_ID`, `EE_EVENT_TYPE`, `EE_FORMATTER`,
+        `SESSION_ID`, `INITIATOR_ID`, `SIGNATURE`, `INSTANCE_ID`). Reduces the memory held by queued
+        or stored payloads when only a few fields are used. The transactions and the internal waits
+        (e.g. `wait_exec`) still get the full payloads.
+        Defaults to None
+    consumer_group : str, optional
+        If set, the payloads are load-balanced by the communication server between all the sessions
+        (processes or hosts) created with the same `consumer_group`: each payload is received by only one of them.
+        Heartbeats and notifications are still received by every session. As the payloads of a pipeline can reach
+        any member of the group, each member should attach its callbacks to the pipelines it processes.
+        With MQTT, this uses MQTT v5 shared subscriptions, which must be supported by the broker.
+        The members of a group should use the same `filter_workers`, otherwise the payloads are load-balanced
+        only between the members with the same filter.
+        Defaults to None
     """
 
     # TODO: maybe read config from file?
@@ -139,10 +214,11 @@ class GenericSession(BaseDecentrAIObject):
 
     if root_topic is not None:
       for key in self._config.keys():
-        if isinstance(self._config[key], dict) and 'TOPIC' in self._config[key]:
-          if isinstance(self._config[key]["TOPIC"], str) and self._config[key]["TOPIC"].startswith("{}"):
-            nr_empty = self._config[key]["TOPIC"].count("{}")
-            self._config[key]["TOPIC"] = self._config[key]["TOPIC"].format(root_topic, *(["{}"] * (nr_empty - 1)))
+        for topic_key in [comm_ct.TOPIC, comm_ct.NODE_TOPIC]:
+          if isinstance(self._config[key], dict) and topic_key in self._config[key]:
+            if isinstance(self._config[key][topic_key], str) and self._config[key][topic_key].startswith("{}"):
+              nr_empty = self._config[key][topic_key].count("{}")
+              self._config[key][topic_key] = self._config[key][topic_key].format(root_topic, *(["{}"] * (nr_empty - 1)))
     # end if root_topic
 
     self.log = log
@@ -152,12 +228,28 @@ class GenericSession(BaseDecentrAIObject):
     self.encrypt_comms = encrypt_comms
 
     self._dct_online_nodes_pipelines: dict[str, Pipeline] = {}
-    self._dct_online_nodes_last_heartbeat: dict[str, dict] = {}
-    self._dct_can_send_to_node: dict[str, bool] = {}
-    self._dct_node_last_seen_time = {}
-    self._dct_node_addr_name = {}
+    # last seen time, name, allowed flag and last heartbeat metrics of every node
+    self.__nodes_registry = NodeRegistry(
+      keep_heavy_fields=keep_heartbeat_heavy_fields,
+      history_size=heartbeat_history_size,
+    )
+    # (node_addr, pipeline_name) -> (hash of the last config synced from the heartbeats, local state after the sync)
+    self.__dct_pipeline_config_hash: dict[tuple[str, str], tuple] = {}
+    # node_addr -> last heartbeat not yet synced / not yet checked for the allowed nodes, see `lazy_heartbeats`
+    self.__lazy_heartbeats = lazy_heartbeats
+    self.__dct_unsynced_heartbeats: dict[str, dict] = {}
+    self.__dct_unchecked_heartbeats: dict[str, dict] = {}
+    self.__heartbeats_sync_lock = Lock()
     self.online_timeout = 60
     self.filter_workers = filter_workers
+    self.__payload_keys = None
+    if payload_keys is not None:
+      routing_keys = [
+        PAYLOAD_DATA.EE_PAYLOAD_PATH, PAYLOAD_DATA.EE_SENDER, PAYLOAD_DATA.EE_ID, PAYLOAD_DATA.EE_EVENT_TYPE,
+        PAYLOAD_DATA.EE_FORMATTER, PAYLOAD_DATA.SESSION_ID, PAYLOAD_DATA.INITIATOR_ID,
+        PAYLOAD_DATA.SIGNATURE, PAYLOAD_DATA.INSTANCE_ID,
+      ]
+      self.__payload_keys = list(dict.fromkeys(routing_keys + list(payload_keys)))
     self.__show_commands = show_commands
 
     pwd = pwd or kwargs.get('password', kwargs.get('pass', None))
@@ -170,7 +262,18 @@ class GenericSession(BaseDecentrAIObject):
     self.custom_on_notification = on_notification
 
     self.own_pipelines = []
-
+    self.__own_pipelines_nodes = set()
+    # routing index (node_addr, pipeline_name) -> Pipeline for the pipelines in `own_pipelines`
+    self.__own_pipelines_index: dict[tuple[str, str], Pipeline] = {}
+
+    self.__message_queue_size = message_queue_size
+    self._send_queue_size = send_queue_size or 0
+    self._send_queue_policy = send_queue_policy
+    self._consumer_group = consumer_group
+    self.__decode_workers = decode_workers or 0
+    self.__decode_pool = None
+    if self.__decode_workers > 0:
+      self.__decode_pool = ThreadPoolExecutor(max_workers=self.__decode_workers, thread_name_prefix=name + '_decode')
     self.__running_callback_threads = False
     self.__running_main_loop_thread = False
     self.__closed_everything = False
@@ -181,11 +284,29 @@ class GenericSession(BaseDecentrAIObject):
     self.__bc_engine = bc_engine
     self.__blockchain_config = blockchain_config
 
-    self.__open_transactions: list[Transaction] = []
-    self.__open_transactions_lock = Lock()
+    # open transactions, indexed by the notifications their responses wait for
+    self.__open_transactions = TransactionsRegistry()
+    # fires the transaction timeouts at their deadlines
+    self.__timers = TimerScheduler(name=name + '_timers')
+
+    # (worker, session_id) -> list of pending instance updates, see `command_coalescing_window`
+    self.__command_coalescing_window = command_coalescing_window or 0
+    self.__pending_instance_updates: dict[tuple[str, str], list[dict]] = {}
+    self.__pending_instance_updates_show = set()
+    self.__pending_instance_updates_lock = Lock()
+    # held while pending updates are sent, so a command sent after a flush cannot overtake them
+    self.__instance_updates_flush_lock = Lock()
+    # set when open transactions received messages, wakes up the main loop
+    self.__transactions_event = Event()
+
+    # list of (node, callback) called when the node is seen online
+    self.__node_online_waiters: list[tuple[str, callable]] = []
+    self.__node_online_waiters_lock = Lock()
 
     self.__create_user_callback_threads()
     super(GenericSession, self).__init__(log=log, DEBUG=not silent, create_logger=True)
+    # the logger is created by `BaseDecentrAIObject` if not provided
+    self.__timers.log = self.log
     return
 
   def startup(self):
@@ -212,24 +333,29 @@ class GenericSession(BaseDecentrAIObject):
   # Message callbacks
   if True:
     def __create_user_callback_threads(self):
-      self._payload_messages = deque()
+      # messages handed to the decode pool but not yet delivered to the callbacks, in order of arrival
+      self._payload_in_flight = deque()
+      self._notif_in_flight = deque()
+      self._hb_in_flight = deque()
+
+      self._payload_messages = MessageQueue(maxlen=self.__message_queue_size)
       self._payload_thread = Thread(
         target=self.__handle_messages,
-        args=(self._payload_messages, self.__on_payload),
+        args=(self._payload_messages, self._payload_in_flight, self.__on_payload, True),
         daemon=True
       )
 
-      self._notif_messages = deque()
+      self._notif_messages = MessageQueue(maxlen=self.__message_queue_size)
       self._notif_thread = Thread(
         target=self.__handle_messages,
-        args=(self._notif_messages, self.__on_notification),
+        args=(self._notif_messages, self._notif_in_flight, self.__on_notification, True),
         daemon=True
       )
 
-      self._hb_messages = deque()
+      self._hb_messages = MessageQueue(maxlen=self.__message_queue_size)
       self._hb_thread = Thread(
         target=self.__handle_messages,
-        args=(self._hb_messages, self.__on_heartbeat),
+        args=(self._hb_messages, self._hb_in_flight, self.__on_heartbeat),
         daemon=True
       )
 
@@ -239,6 +365,27 @@ class GenericSession(BaseDecentrAIObject):
       self._payload_thread.start()
       return
 
+    def __is_filtered_raw_message(self, message):
+      """
+      Check, without parsing the message, if it comes from a node not in `filter_workers`.
+      If the sender cannot be extracted cheaply, the message is not filtered here.
+
+      Parameters
+      ----------
+      message : str
+          The message received from the communication server
+
+      Returns
+      -------
+      bool
+          True if the message can be dropped.
+      """
+      if self.filter_workers is None or not isinstance(message, str):
+        return False
+      sender_addr = peek_json_string_field(message, PAYLOAD_DATA.EE_SENDER)
+      # if the sender found is not the top-level one, the message has no top-level sender and is ignored anyway
+      return sender_addr is not None and self.__maybe_ignore_message(sender_addr)
+
     def __parse_message(self, dict_msg: dict):
       """
       Get the formatter from the payload and decode the message
@@ -272,22 +419,27 @@ class GenericSession(BaseDecentrAIObject):
       else:
         return None
 
-    def __on_message_default_callback(self, message, message_callback) -> None:
+    def __decode_message(self, message):
       """
-      Default callback for all messages received from the communication server.
+      Parse, decrypt and format a message received from the communication server.
+      This method can be called from the decode pool threads.
 
       Parameters
       ----------
       message : str
           The message received from the communication server
-      message_callback : Callable[[dict, str, str, str, str], None]
-          The callback that will handle the message.
+
+      Returns
+      -------
+      tuple | None
+          The decoded message and its routing information (node address, pipeline, signature, instance),
+          or None if the message should be dropped.
       """
       dict_msg = json.loads(message)
       # parse the message
       dict_msg_parsed = self.__parse_message(dict_msg)
       if dict_msg_parsed is None:
-        return
+        return None
 
       try:
         msg_path = dict_msg.get(PAYLOAD_DATA.EE_PAYLOAD_PATH, [None] * 4)
@@ -296,35 +448,100 @@ class GenericSession(BaseDecentrAIObject):
         msg_node_addr = dict_msg.get(PAYLOAD_DATA.EE_SENDER, None)
       except:
         self.D("Message does not respect standard: {}".format(dict_msg), verbosity=2)
+        return None
+
+      return dict_msg_parsed, msg_node_addr, msg_pipeline, msg_signature, msg_instance
+
+    def __on_message_default_callback(self, message, message_callback) -> None:
+      """
+      Default callback for all messages received from the communication server.
+
+      Parameters
+      ----------
+      message : str
+          The message received from the communication server
+      message_callback : Callable[[dict, str, str, str, str], None]
+          The callback that will handle the message.
+      """
+      decoded = self.__decode_message(message)
+      if decoded is None:
+        return
+
+      message_callback(*decoded)
+      return
+
+    def __deliver_decoded_message(self, future, message_callback) -> None:
+      """
+      Wait for a message to be decoded by the decode pool and pass it to the callback.
+
+      Parameters
+      ----------
+      future : Future
+          The future returned by the decode pool.
+      message_callback : Callable[[dict, str, str, str, str], None]
+          The callback that will handle the message.
+      """
+      try:
+        decoded = future.result()
+      except Exception as e:
+        self.P("Error while decoding message: {}".format(e), color='r', verbosity=1)
+        return
+
+      if decoded is None:
         return
 
-      message_callback(dict_msg_parsed, msg_node_addr, msg_pipeline, msg_signature, msg_instance)
+      message_callback(*decoded)
       return
 
-    def __handle_messages(self, message_queue, message_callback):
+    def __handle_messages(self, message_queue: MessageQueue, in_flight: deque, message_callback, header_filter=False):
       """
       Handle messages from the communication server.
-      This method is called in a separate thread.
+      This method is called in a separate thread and blocks until a message is received or the queue is closed.
+      If the decode pool is used, the messages are decoded in parallel, but are passed
+      to the callback in the order they were received.
 
       Parameters
       ----------
-      message_queue : deque
+      message_queue : MessageQueue
           The queue of messages received from the communication server
+      in_flight : deque
+          The futures of the messages that are decoded in the decode pool, in order of arrival
       message_callback : Callable[[dict, str, str, str, str], None]
           The callback that will handle the message.
+      header_filter : bool, optional
+          If True, the messages from nodes not in `filter_workers` are dropped before decoding them.
       """
+      max_in_flight = 4 * self.__decode_workers
+
       while self.__running_callback_threads:
-        if len(message_queue) == 0:
-          sleep(0.01)
+        if self.__decode_pool is None:
+          has_msg, current_msg = message_queue.popleft()
+          if has_msg and not (header_filter and self.__is_filtered_raw_message(current_msg)):
+            self.__on_message_default_callback(current_msg, message_callback)
           continue
-        current_msg = message_queue.popleft()
-        self.__on_message_default_callback(current_msg, message_callback)
+        # end if no decode pool
+
+        # do not block waiting for new messages while there are messages to deliver
+        has_msg, current_msg = message_queue.popleft(timeout=0 if len(in_flight) > 0 else None)
+        if has_msg and header_filter and self.__is_filtered_raw_message(current_msg):
+          continue
+        if has_msg:
+          in_flight.append(self.__decode_pool.submit(self.__decode_message, current_msg))
+
+        # deliver the decoded messages, in order, while the oldest one is ready
+        # or if we cannot submit any more messages
+        while len(in_flight) > 0 and (in_flight[0].done() or not has_msg or len(in_flight) >= max_in_flight):
+          self.__deliver_decoded_message(in_flight.popleft(), message_callback)
+          has_msg = True
       # end while self.running
 
       # process the remaining messages before exiting
-      while len(message_queue) > 0:
-        current_msg = message_queue.popleft()
+      while len(in_flight) > 0:
+        self.__deliver_decoded_message(in_flight.popleft(), message_callback)
+      has_msg, current_msg = message_queue.popleft(timeout=0)
+      while has_msg:
         self.__on_message_default_callback(current_msg, message_callback)
+        has_msg, current_msg = message_queue.popleft(timeout=0)
       return
 
     def __maybe_ignore_message(self, node_addr):
@@ -353,8 +570,39 @@ class GenericSession(BaseDecentrAIObject):
       node_addr : str
           The address of the Naeural edge node that sent the message.
       """
-      self._dct_node_last_seen_time[node_addr] = tm()
-      self._dct_node_addr_name[node_addr] = node_id
+      self.__nodes_registry.seen(node_addr, node_id)
+      if len(self.__node_online_waiters) > 0:
+        self.__notify_node_online_waiters(node_addr, node_id)
+      return
+
+    def __notify_node_online_waiters(self, node_addr, node_id):
+      def _is_ready(waiter):
+        return waiter[0] is None or waiter[0] in (node_addr, node_id)
+
+      with self.__node_online_waiters_lock:
+        ready = [waiter for waiter in self.__node_online_waiters if _is_ready(waiter)]
+        if len(ready) == 0:
+          return
+        self.__node_online_waiters = [waiter for waiter in self.__node_online_waiters if not _is_ready(waiter)]
+      # end with
+      for _, callback in ready:
+        callback()
+      return
+
+    def __add_node_online_waiter(self, node, callback):
+      """
+      Register a callback called (once) when the node is seen online. If `node` is None, any node.
+      Returns the waiter that must be passed to `__remove_node_online_waiter` when not needed anymore.
+      """
+      waiter = (node, callback)
+      with self.__node_online_waiters_lock:
+        self.__node_online_waiters.append(waiter)
+      return waiter
+
+    def __remove_node_online_waiter(self, waiter):
+      with self.__node_online_waiters_lock:
+        if waiter in self.__node_online_waiters:
+          self.__node_online_waiters.remove(waiter)
       return
 
     def __track_allowed_node(self, node_addr, dict_msg):
@@ -371,7 +619,7 @@ class GenericSession(BaseDecentrAIObject):
       node_whitelist = dict_msg.get(HB.EE_WHITELIST, [])
       node_secured = dict_msg.get(HB.SECURED, False)
 
-      self._dct_can_send_to_node[node_addr] = not node_secured or self.bc_engine.address_no_prefix in node_whitelist or self.bc_engine.address == node_addr
+      self.__nodes_registry.set_allowed(node_addr, not node_secured or self.bc_engine.address_no_prefix in node_whitelist or self.bc_engine.address == node_addr)
       return
 
     def __on_heartbeat(self, dict_msg: dict, msg_node_addr, msg_pipeline, msg_signature, msg_instance):
@@ -394,52 +642,135 @@ class GenericSession(BaseDecentrAIObject):
       # extract relevant data from the message
 
       if dict_msg.get(HB.HEARTBEAT_VERSION) == HB.V2:
-        str_data = self.log.decompress_text(dict_msg[HB.ENCODED_DATA])
-        data = json.loads(str_data)
-        dict_msg = {**dict_msg, **data}
+        if self.__lazy_heartbeats:
+          dict_msg = LazyHeartbeat(dict_msg, self.__decode_heartbeat_data)
+        else:
+          dict_msg = {**dict_msg, **self.__decode_heartbeat_data(dict_msg[HB.ENCODED_DATA])}
 
-      self._dct_online_nodes_last_heartbeat[msg_node_addr] = dict_msg
+      self.__nodes_registry.update_heartbeat(msg_node_addr, dict_msg)
 
-      msg_node_id = dict_msg[PAYLOAD_DATA.EE_ID]
+      if isinstance(dict_msg, LazyHeartbeat):
+        msg_node_id = dict_msg.peek(PAYLOAD_DATA.EE_ID)
+      else:
+        msg_node_id = dict_msg[PAYLOAD_DATA.EE_ID]
       self.__track_online_node(msg_node_addr, msg_node_id)
 
-      msg_active_configs = dict_msg.get(HB.CONFIG_STREAMS)
-      if msg_active_configs is None:
-        return
-
-      # default action
-      if msg_node_addr not in self._dct_online_nodes_pipelines:
-        self._dct_online_nodes_pipelines[msg_node_addr] = {}
-      for config in msg_active_configs:
-        pipeline_name = config[PAYLOAD_DATA.NAME]
-        pipeline: Pipeline = self._dct_online_nodes_pipelines[msg_node_addr].get(pipeline_name, None)
-        if pipeline is not None:
-          pipeline._sync_configuration_with_remote({k.upper(): v for k, v in config.items()})
-        else:
-          self._dct_online_nodes_pipelines[msg_node_addr][pipeline_name] = self.__create_pipeline_from_config(
-            msg_node_addr, config)
+      if self.__lazy_heartbeats:
+        with self.__heartbeats_sync_lock:
+          self.__dct_unsynced_heartbeats[msg_node_addr] = dict_msg
+          self.__dct_unchecked_heartbeats[msg_node_addr] = dict_msg
+        if msg_node_addr in self.__own_pipelines_nodes:
+          self.__sync_pending_heartbeat(msg_node_addr)
+      else:
+        msg_active_configs = dict_msg.get(HB.CONFIG_STREAMS)
+        if msg_active_configs is None:
+          return
+        self.__sync_node_pipelines(msg_node_addr, msg_active_configs)
 
       # TODO: move this call in `__on_message_default_callback`
       if self.__maybe_ignore_message(msg_node_addr):
         return
 
       # pass the heartbeat message to open transactions
-      with self.__open_transactions_lock:
-        open_transactions_copy = self.__open_transactions.copy()
-      # end with
-      for transaction in open_transactions_copy:
-        transaction.handle_heartbeat(dict_msg)
+      if self.__open_transactions.handle_heartbeat(dict_msg):
+        self.__transactions_event.set()
 
       self.D("Received hb from: {}".format(msg_node_addr), verbosity=2)
 
-      self.__track_allowed_node(msg_node_addr, dict_msg)
+      if not self.__lazy_heartbeats:
+        self.__track_allowed_node(msg_node_addr, dict_msg)
 
       # call the custom callback, if defined
       if self.custom_on_heartbeat is not None:
+        if isinstance(dict_msg, LazyHeartbeat):
+          # user code gets the same plain dict as in the default mode
+          dict_msg = dict_msg.data
         self.custom_on_heartbeat(self, msg_node_addr, dict_msg)
 
       return
 
+    def __decode_heartbeat_data(self, encoded_data):
+      return json.loads(self.log.decompress_text(encoded_data))
+
+    def __sync_node_pipelines(self, node_addr, active_configs):
+      """
+      Sync the pipelines of a node with the configs from its heartbeat.
+      Pipelines whose config did not change since the last heartbeat are skipped, unless their
+      local state changed since they were synced.
+
+      Parameters
+      ----------
+      node_addr : str
+          The address of the Naeural edge node that sent the heartbeat.
+      active_configs : list[dict]
+          The `CONFIG_STREAMS` of the heartbeat.
+      """
+      node_pipelines = self._dct_online_nodes_pipelines.setdefault(node_addr, {})
+      for config in active_configs:
+        pipeline_name = config[PAYLOAD_DATA.NAME]
+        try:
+          config_hash = hash(json.dumps(config, sort_keys=True))
+        except (TypeError, ValueError):
+          config_hash = None
+        key = (node_addr, pipeline_name)
+        pipeline: Pipeline = node_pipelines.get(pipeline_name, None)
+        if pipeline is not None:
+          synced = self.__dct_pipeline_config_hash.get(key)
+          if (
+            config_hash is not None and synced is not None and synced[0] == config_hash and
+            self.__is_same_pipeline_state(synced[1], self.__get_pipeline_state(pipeline))
+          ):
+            continue
+          pipeline._sync_configuration_with_remote({k.upper(): v for k, v in config.items()})
+        else:
+          pipeline = node_pipelines[pipeline_name] = self.__create_pipeline_from_config(node_addr, config)
+        self.__dct_pipeline_config_hash[key] = (config_hash, self.__get_pipeline_state(pipeline))
+      # endfor
+      return
+
+    def __get_pipeline_state(self, pipeline: Pipeline):
+      """
+      The local state of a pipeline as the config dicts of the pipeline and of its instances.
+      Pipelines and instances replace their `config` dict on every change (updates, remote syncs),
+      so comparing the dicts by identity detects that the local state diverged from the synced one.
+      The dicts are kept (not their ids) so they cannot be reused by new dicts.
+      """
+      return pipeline.config, [(instance, instance.config) for instance in pipeline.lst_plugin_instances]
+
+    def __is_same_pipeline_state(self, state1, state2):
+      config1, instances1 = state1
+      config2, instances2 = state2
+      return config1 is config2 and len(instances1) == len(instances2) and all(
+        instance1 is instance2 and instance_config1 is instance_config2
+        for (instance1, instance_config1), (instance2, instance_config2) in zip(instances1, instances2)
+      )
+
+    def __sync_pending_heartbeat(self, node_addr):
+      """
+      Sync the pipelines of a node from its last heartbeat, if not already synced. Used in lazy heartbeats mode.
+      """
+      with self.__heartbeats_sync_lock:
+        dict_msg = self.__dct_unsynced_heartbeats.pop(node_addr, None)
+        if dict_msg is None:
+          return
+        msg_active_configs = dict_msg.get(HB.CONFIG_STREAMS)
+        if msg_active_configs is not None:
+          self.__sync_node_pipelines(node_addr, msg_active_configs)
+      # endwith
+      return
+
+    def __check_pending_allowed_nodes(self):
+      """
+      Update the allowed nodes from the heartbeats not checked yet. Used in lazy heartbeats mode.
+      """
+      with self.__heartbeats_sync_lock:
+        pending = self.__dct_unchecked_heartbeats
+        self.__dct_unchecked_heartbeats = {}
+      for node_addr, dict_msg in pending.items():
+        if not self.__maybe_ignore_message(node_addr):
+          self.__track_allowed_node(node_addr, dict_msg)
+      return
+
     def __on_notification(self, dict_msg: dict, msg_node_addr, msg_pipeline, msg_signature, msg_instance):
       """
       Handle a notification message received from the communication server.
@@ -478,19 +809,13 @@ class GenericSession(BaseDecentrAIObject):
              )
 
       # call the pipeline and instance defined callbacks
-      for pipeline in self.own_pipelines:
-        if msg_node_addr == pipeline.node_addr and msg_pipeline == pipeline.name:
-          pipeline._on_notification(msg_signature, msg_instance, Payload(dict_msg))
-          # since we found the pipeline, we can stop searching
-          # because the pipelines have unique names
-          break
+      pipeline = self.__own_pipelines_index.get((msg_node_addr, msg_pipeline), None)
+      if pipeline is not None:
+        pipeline._on_notification(msg_signature, msg_instance, Payload(dict_msg))
 
       # pass the notification message to open transactions
-      with self.__open_transactions_lock:
-        open_transactions_copy = self.__open_transactions.copy()
-      # end with
-      for transaction in open_transactions_copy:
-        transaction.handle_notification(dict_msg)
+      if self.__open_transactions.handle_notification(dict_msg):
+        self.__transactions_event.set()
       # call the custom callback, if defined
       if self.custom_on_notification is not None:
         self.custom_on_notification(self, msg_node_addr, Payload(dict_msg))
@@ -518,27 +843,26 @@ class GenericSession(BaseDecentrAIObject):
           The name of the instance that sent the message.
       """
       # extract relevant data from the message
-      msg_data = dict_msg
-
       if self.__maybe_ignore_message(msg_node_addr):
         return
 
+      # the user callbacks only get the `payload_keys`, the internal waits and transactions get the full payload
+      user_msg = dict_msg
+      if self.__payload_keys is not None:
+        user_msg = {k: dict_msg[k] for k in self.__payload_keys if k in dict_msg}
+
       # call the pipeline and instance defined callbacks
-      for pipeline in self.own_pipelines:
-        if msg_node_addr == pipeline.node_addr and msg_pipeline == pipeline.name:
-          pipeline._on_data(msg_signature, msg_instance, Payload(dict_msg))
-          # since we found the pipeline, we can stop searching
-          # because the pipelines have unique names
-          break
+      pipeline = self.__own_pipelines_index.get((msg_node_addr, msg_pipeline), None)
+      if pipeline is not None:
+        full_data = Payload(dict_msg)
+        user_data = full_data if user_msg is dict_msg else Payload(user_msg)
+        pipeline._on_data(msg_signature, msg_instance, user_data, full_data=full_data)
 
       # pass the payload message to open transactions
-      with self.__open_transactions_lock:
-        open_transactions_copy = self.__open_transactions.copy()
-      # end with
-      for transaction in open_transactions_copy:
-        transaction.handle_payload(dict_msg)
+      if self.__open_transactions.handle_payload(dict_msg):
+        self.__transactions_event.set()
       if self.custom_on_payload is not None:
-        self.custom_on_payload(self, msg_node_addr, msg_pipeline, msg_signature, msg_instance, Payload(msg_data))
+        self.custom_on_payload(self, msg_node_addr, msg_pipeline, msg_signature, msg_instance, Payload(user_msg))
 
       return
 
@@ -567,14 +891,15 @@ class GenericSession(BaseDecentrAIObject):
       self._main_loop_thread.start()
       return
 
-    def __handle_open_transactions(self):
-      with self.__open_transactions_lock:
-        solved_transactions = [i for i, transaction in enumerate(self.__open_transactions) if transaction.is_solved()]
-        solved_transactions.reverse()
+    def __on_transaction_timeout(self, transaction: Transaction):
+      # called from the timers thread
+      if self.__open_transactions.expire(transaction):
+        self.__transactions_event.set()
+      return
 
-        for idx in solved_transactions:
-          self.__open_transactions[idx].callback()
-          self.__open_transactions.pop(idx)
+    def __handle_open_transactions(self):
+      for transaction in self.__open_transactions.pop_solved():
+        transaction.callback()
       return
 
     @property
@@ -673,10 +998,17 @@ class GenericSession(BaseDecentrAIObject):
       Release all resources and close all threads
       """
       self.__running_callback_threads = False
+      self._payload_messages.close()
+      self._notif_messages.close()
+      self._hb_messages.close()
 
       self._payload_thread.join()
       self._notif_thread.join()
       self._hb_thread.join()
+
+      if self.__decode_pool is not None:
+        self.__decode_pool.shutdown(wait=True)
+      self.__timers.close()
       return
 
     def __main_loop(self):
@@ -688,10 +1020,14 @@ class GenericSession(BaseDecentrAIObject):
       while self.__running_main_loop_thread:
         self.__maybe_reconnect()
         self.__handle_open_transactions()
-        sleep(0.1)
+        # wake up early if the open transactions received messages
+        self.__transactions_event.wait(0.1)
+        self.__transactions_event.clear()
       # end while self.running
 
       self.P("Main loop thread exiting...", verbosity=2)
+      # send the instance updates still waiting for their coalescing window
+      self.__flush_instance_updates()
       self.__release_callback_threads()
 
       self.P("Comms closing...", verbosity=2)
@@ -907,8 +1243,10 @@ class GenericSession(BaseDecentrAIObject):
       str
           The address of the node.
       """
-      if node not in self.get_active_nodes():
-        node = next((key for key, value in self._dct_node_addr_name.items() if value == node), node)
+      if not self.__nodes_registry.is_active(node, self.online_timeout):
+        node_addr = self.__nodes_registry.get_address(node)
+        if node_addr is not None:
+          return node_addr
       return node
 
     def _send_command_to_box(self, command, worker, payload, show_command=False, session_id=None, **kwargs):
@@ -926,7 +1264,13 @@ class GenericSession(BaseDecentrAIObject):
       show_command : bool, optional
           If True, will print the complete command that is being sent, by default False
       """
+      if worker is not None:
+        # the coalesced instance updates issued before this command must reach the node first
+        self.__flush_instance_updates(worker=worker)
+      self.__send_command_to_box(command, worker, payload, show_command=show_command, session_id=session_id, **kwargs)
+      return
 
+    def __send_command_to_box(self, command, worker, payload, show_command=False, session_id=None, **kwargs):
       show_command = show_command or self.__show_commands
 
       if len(kwargs) > 0:
@@ -994,9 +1338,72 @@ class GenericSession(BaseDecentrAIObject):
         PAYLOAD_DATA.INSTANCE_ID: instance_id,
         PAYLOAD_DATA.INSTANCE_CONFIG: {k.upper(): v for k, v in instance_config.items()}
       }
+      if self.__command_coalescing_window > 0 and worker is not None:
+        self.__coalesce_instance_update(worker, payload, **kwargs)
+        return
       self._send_command_to_box(COMMANDS.UPDATE_PIPELINE_INSTANCE, worker, payload, **kwargs)
       return
 
+    def __coalesce_instance_update(self, worker, payload, session_id=None, show_command=False, **kwargs):
+      """
+      Add an instance update to the pending updates of the node. The first pending update schedules
+      the flush at the end of the coalescing window.
+      """
+      key = (worker, session_id)
+      with self.__pending_instance_updates_lock:
+        lst_pending = self.__pending_instance_updates.get(key)
+        schedule_flush = lst_pending is None
+        if schedule_flush:
+          lst_pending = self.__pending_instance_updates[key] = []
+        lst_pending.append(payload)
+        if show_command:
+          self.__pending_instance_updates_show.add(key)
+      # end with
+      if schedule_flush:
+        self.__timers.schedule(self.__command_coalescing_window, self.__flush_instance_updates, key)
+      return
+
+    def __flush_instance_updates(self, key=None, worker=None):
+      """
+      Send the pending instance updates of a (node, session_id), of all the sessions of `worker`
+      or of all of them if both `key` and `worker` are None.
+      A single update is sent as `UPDATE_PIPELINE_INSTANCE`, multiple as one `BATCH_UPDATE_PIPELINE_INSTANCE`.
+      Waits for any flush in progress, even if nothing is pending, so a command sent after it is not
+      sent before the updates being flushed.
+      """
+      with self.__instance_updates_flush_lock:
+        with self.__pending_instance_updates_lock:
+          if key is not None:
+            keys = [key]
+          elif worker is not None:
+            keys = [k for k in self.__pending_instance_updates if k[0] == worker]
+          else:
+            keys = list(self.__pending_instance_updates.keys())
+          lst_flush = []
+          for k in keys:
+            lst_pending = self.__pending_instance_updates.pop(k, None)
+            if lst_pending is not None:
+              lst_flush.append((k, lst_pending, k in self.__pending_instance_updates_show))
+              self.__pending_instance_updates_show.discard(k)
+          # end for
+        # end with
+
+        for (worker, session_id), lst_pending, show_command in lst_flush:
+          try:
+            if len(lst_pending) == 1:
+              self.__send_command_to_box(
+                COMMANDS.UPDATE_PIPELINE_INSTANCE, worker, lst_pending[0], show_command=show_command, session_id=session_id
+              )
+            else:
+              self.__send_command_to_box(
+                COMMANDS.BATCH_UPDATE_PIPELINE_INSTANCE, worker, lst_pending, show_command=show_command, session_id=session_id
+              )
+          except Exception as exc:
+            self.P("Failed sending {} coalesced instance updates to <{}>: {}".format(len(lst_pending), worker, exc), color='r')
+        # end for
+      # end with
+      return
+
     def _send_command_batch_update_instance_config(self, worker, lst_updates, **kwargs):
       for update in lst_updates:
         assert isinstance(update, dict), "All updates must be dicts"
@@ -1093,10 +1500,35 @@ class GenericSession(BaseDecentrAIObject):
         on_failure_callback=on_failure_callback,
       )
 
-      with self.__open_transactions_lock:
-        self.__open_transactions.append(transaction)
+      self.__open_transactions.add(transaction)
+      if timeout > 0:
+        timer = self.__timers.schedule(max(transaction.start_time + timeout - tm(), 0), self.__on_transaction_timeout, transaction)
+        # do not keep the transaction in the timers heap until its deadline once it is resolved
+        transaction.add_done_callback(lambda _: timer.cancel())
+      if len(transaction.lst_required_responses) == 0:
+        # already solved, no need to wait for the next main loop iteration
+        self.__transactions_event.set()
       return transaction
 
+    def __register_own_pipeline(self, pipeline: Pipeline):
+      """
+      Add a pipeline to the list of pipelines created by or attached to this session
+      and index it by (node address, pipeline name) for message routing.
+
+      Parameters
+      ----------
+      pipeline : Pipeline
+          The pipeline to register.
+      """
+      key = (pipeline.node_addr, pipeline.name)
+      if self.__own_pipelines_index.get(key, None) is pipeline:
+        # already registered
+        return
+      self.__own_pipelines_index[key] = pipeline
+      self.own_pipelines.append(pipeline)
+      self.__own_pipelines_nodes.add(pipeline.node_addr)
+      return
+
     def __create_pipeline_from_config(self, node_addr, config):
       pipeline_config = {k.lower(): v for k, v in config.items()}
       name = pipeline_config.pop('name', None)
@@ -1212,9 +1644,148 @@ class GenericSession(BaseDecentrAIObject):
           is_attached=False,
           **kwargs
       )
-      self.own_pipelines.append(pipeline)
+      self.__register_own_pipeline(pipeline)
       return pipeline
 
+    def deploy_many(self, *,
+                    nodes,
+                    name,
+                    data_source="Void",
+                    config={},
+                    plugins=[],
+                    on_data=None,
+                    on_notification=None,
+                    max_wait_time=0,
+                    timeout=10,
+                    max_workers=None,
+                    **kwargs) -> dict:
+      """
+      Create and deploy the same pipeline on multiple nodes.
+      The commands for all the nodes are built, encrypted and signed in parallel and all of them are sent
+      before waiting for any confirmation, so the total time is close to the slowest node round-trip.
+
+      Parameters
+      ----------
+      nodes : list[str]
+          Addresses or names of the Naeural edge nodes.
+      name : str
+          Name of the pipeline.
+      data_source, config, plugins, on_data, on_notification, **kwargs :
+          See `create_pipeline`.
+      max_wait_time : int, optional
+          The maximum time to wait for all the nodes to appear online, by default 0.
+      timeout : int, optional
+          The timeout of the deploy transactions of each node, by default 10
+      max_workers : int, optional
+          The number of threads used to prepare the commands. Defaults to min(32, len(nodes))
+
+      Returns
+      -------
+      dict
+          For each node, a dict with the keys:
+            - `status`: 'ok', 'failed', 'timeout', 'offline' or 'error'
+            - `latency`: the seconds between sending the commands and the confirmation, or None
+            - `error`: the failure reason, or None
+            - `pipeline`: the `Pipeline` object, or None if it could not be created
+      """
+      nodes = list(dict.fromkeys(nodes))
+      results = {
+        node: {'status': None, 'latency': None, 'error': None, 'pipeline': None}
+        for node in nodes
+      }
+      if len(nodes) == 0:
+        return results
+
+      # step 1: wait for the nodes one after the other, with a shared deadline so the total wait is `max_wait_time`
+      deadline = tm() + max_wait_time
+      for node in nodes:
+        self.wait_for_node(node, timeout=max(deadline - tm(), 0), verbose=False)
+
+      # step 2: create the pipelines (local objects only)
+      dct_pipelines = {}
+      for node in nodes:
+        try:
+          dct_pipelines[node] = self.create_pipeline(
+            node=node,
+            name=name,
+            data_source=data_source,
+            # each pipeline gets its own copy, as the configs are updated in place
+            config=deepcopy(config),
+            plugins=deepcopy(plugins),
+            on_data=on_data,
+            on_notification=on_notification,
+            max_wait_time=0,
+            **kwargs
+          )
+          results[node]['pipeline'] = dct_pipelines[node]
+        except Exception as exc:
+          results[node]['status'] = 'offline'
+          results[node]['error'] = str(exc)
+      # end for
+
+      # step 3: build, encrypt, sign and send the commands in parallel, without waiting for confirmations
+      def _deploy(node):
+        start_time = tm()
+        transactions = dct_pipelines[node].deploy(with_confirmation=True, wait_confirmation=False, timeout=timeout)
+        return start_time, transactions or []
+
+      dct_sent = {}
+      max_workers = max_workers or min(32, len(dct_pipelines)) or 1
+      with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.name + '_deploy') as executor:
+        dct_futures = {node: executor.submit(_deploy, node) for node in dct_pipelines}
+        for node, future in dct_futures.items():
+          try:
+            dct_sent[node] = future.result()
+          except Exception as exc:
+            results[node]['status'] = 'error'
+            results[node]['error'] = str(exc)
+        # end for
+      # end with
+
+      # step 4: record the time each node finished and wait for all of them
+      dct_finish_time = {}
+
+      def _on_finished(node):
+        def _callback(_):
+          dct_finish_time[node] = tm()
+          return
+        return _callback
+
+      all_transactions = []
+      for node, (_, transactions) in dct_sent.items():
+        if len(transactions) > 0:
+          self.__all_finished_future(transactions).add_done_callback(_on_finished(node))
+        all_transactions.extend(transactions)
+      # end for
+      self.wait_for_transactions(all_transactions)
+
+      # step 5: aggregate the results
+      for node, (start_time, transactions) in dct_sent.items():
+        fail_reasons = []
+        timed_out = False
+        for transaction in transactions:
+          for response in transaction.lst_required_responses:
+            if not response.is_solved():
+              timed_out = True
+            elif not response.is_good_response():
+              fail_reasons.append(str(response.fail_reason))
+          # end for
+        # end for
+        if timed_out:
+          results[node]['status'] = 'timeout'
+          results[node]['error'] = "No confirmation received in {}s".format(timeout)
+        elif len(fail_reasons) > 0:
+          results[node]['status'] = 'failed'
+          results[node]['error'] = "; ".join(fail_reasons)
+        else:
+          results[node]['status'] = 'ok'
+        results[node]['latency'] = dct_finish_time.get(node, tm()) - start_time
+      # end for
+
+      nr_ok = len([x for x in results.values() if x['status'] == 'ok'])
+      self.P("Pipeline <{}> deployed on {}/{} nodes".format(name, nr_ok, len(nodes)), color='g' if nr_ok == len(nodes) else 'r')
+      return results
+
     def get_node_name(self, node_addr):
       """
       Get the name of a node.
@@ -1229,7 +1800,41 @@ class GenericSession(BaseDecentrAIObject):
       str
           The name of the node.
       """
-      return self._dct_node_addr_name.get(node_addr, None)
+      return self.__nodes_registry.get_name(node_addr)
+
+    def get_message_queues_depth(self):
+      """
+      Get the number of received messages waiting to be processed by each callback thread,
+      the number of messages dropped because the buffers were full and the number of messages
+      currently being decoded in the decode pool.
+
+      Returns
+      -------
+      dict
+          A dictionary with the keys `payloads`, `notifications` and `heartbeats`,
+          each containing a dictionary with the keys `depth`, `maxlen`, `dropped` and `in_flight`.
+      """
+      queues = {
+        'payloads': (self._payload_messages, self._payload_in_flight),
+        'notifications': (self._notif_messages, self._notif_in_flight),
+        'heartbeats': (self._hb_messages, self._hb_in_flight),
+      }
+      return {
+        name: {
+          'depth': queue.depth,
+          'maxlen': queue.maxlen,
+          'dropped': queue.nr_dropped,
+          'in_flight': len(in_flight),
+        }
+        for name, (queue, in_flight) in queues.items()
+      }
+
+    @property
+    def decode_workers(self):
+      """
+      The number of threads used to decode the received messages. 0 if messages are decoded on the callback threads.
+      """
+      return self.__decode_workers
 
     def get_active_nodes(self):
       """
@@ -1241,7 +1846,7 @@ class GenericSession(BaseDecentrAIObject):
           List of names of all the Naeural edge nodes that are considered online
 
       """
-      return [k for k, v in self._dct_node_last_seen_time.items() if tm() - v < self.online_timeout]
+      return self.__nodes_registry.get_active_nodes(self.online_timeout)
 
     def get_allowed_nodes(self):
       """
@@ -1252,8 +1857,9 @@ class GenericSession(BaseDecentrAIObject):
       list[str]
           List of names of all the active Naeural edge nodes to whom this session can send messages
       """
-      active_nodes = self.get_active_nodes()
-      return [node for node in self._dct_can_send_to_node if self._dct_can_send_to_node[node] and node in active_nodes]
+      if self.__lazy_heartbeats:
+        self.__check_pending_allowed_nodes()
+      return self.__nodes_registry.get_allowed_nodes(self.online_timeout)
 
     def get_active_pipelines(self, node):
       """
@@ -1271,6 +1877,8 @@ class GenericSession(BaseDecentrAIObject):
 
       """
       node_address = self.__get_node_address(node)
+      if self.__lazy_heartbeats:
+        self.__sync_pending_heartbeat(node_address)
       return self._dct_online_nodes_pipelines.get(node_address, None)
 
     def get_active_supervisors(self):
@@ -1282,18 +1890,91 @@ class GenericSession(BaseDecentrAIObject):
       list
           List of names of all the active supervisors
       """
-      active_nodes = self.get_active_nodes()
+      return self.__nodes_registry.get_active_supervisors(self.online_timeout)
 
-      active_supervisors = []
-      for node in active_nodes:
-        last_hb = self._dct_online_nodes_last_heartbeat.get(node, None)
-        if last_hb is None:
-          continue
+    def get_active_nodes_metrics(self, metrics=None):
+      """
+      Get the metrics from the last heartbeat of all the active Naeural edge nodes.
+
+      Parameters
+      ----------
+      metrics : list[str], optional
+          The metrics to return, from `CPU_USED`, `AVAILABLE_MEMORY`, `MACHINE_MEMORY`, `PROCESS_MEMORY`,
+          `AVAILABLE_DISK`, `TOTAL_DISK`, `UPTIME`, `NR_INFERENCES`, `NR_PAYLOADS`, `NR_STREAMS_DATA`.
+          If None, all of them.
+
+      Returns
+      -------
+      tuple[list[str], dict[str, np.ndarray]]
+          The addresses of the active nodes and a dictionary metric -> array of values aligned with the addresses.
+          Missing values are NaN.
+      """
+      return self.__nodes_registry.get_metrics(timeout=self.online_timeout, metrics=metrics)
+
+    def get_node_last_heartbeat(self, node):
+      """
+      Get the last heartbeat received from a Naeural edge node, without the bulky fields
+      unless the session was created with `keep_heartbeat_heavy_fields=True`.
+
+      Parameters
+      ----------
+      node : str
+          Address or Name of the Naeural edge node
+
+      Returns
+      -------
+      dict
+          The last heartbeat, or None if no heartbeat was received from this node.
+      """
+      return self.__nodes_registry.get_last_heartbeat(self.__get_node_address(node))
+
+    def get_node_metric_history(self, node, metric, window=None):
+      """
+      Get the values of a heartbeat metric of a Naeural edge node, from the history kept in memory.
+      Requires the session to be created with `heartbeat_history_size` greater than 0.
+
+      Parameters
+      ----------
+      node : str
+          Address or Name of the Naeural edge node
+      metric : str
+          The metric, see `get_active_nodes_metrics`. `IN_KB` and `OUT_KB` are taken from `COMM_STATS`.
+      window : float, optional
+          If set, only the values received in the last `window` seconds. Defaults to None
+
+      Returns
+      -------
+      tuple[np.ndarray, np.ndarray]
+          The times the heartbeats were received and the values of the metric, in chronological order.
+      """
+      return self.__nodes_registry.get_history(self.__get_node_address(node), metric, window=window)
+
+    def get_node_metric_stat(self, node, metric, stat='mean', window=None, q=50):
+      """
+      Get an aggregate of a heartbeat metric of a Naeural edge node over the history kept in memory.
+      Requires the session to be created with `heartbeat_history_size` greater than 0.
 
-        if last_hb.get(PAYLOAD_DATA.IS_SUPERVISOR, False):
-          active_supervisors.append(node)
+      Parameters
+      ----------
+      node : str
+          Address or Name of the Naeural edge node
+      metric : str
+          The metric, see `get_node_metric_history`.
+      stat : str, optional
+          One of 'mean', 'min', 'max', 'last', 'percentile' and 'rate' (change per second, for counters
+          such as `NR_INFERENCES`). Defaults to 'mean'
+      window : float, optional
+          If set, only the values received in the last `window` seconds. Defaults to None
+      q : float, optional
+          The percentile, used when `stat` is 'percentile'. Defaults to 50
 
-      return active_supervisors
+      Returns
+      -------
+      float
+          The aggregate, or NaN if there are no values.
+      """
+      return self.__nodes_registry.get_history_stat(
+        self.__get_node_address(node), metric, stat=stat, window=window, q=q)
 
     def attach_to_pipeline(self, *,
                            node,
@@ -1367,8 +2048,10 @@ class GenericSession(BaseDecentrAIObject):
         raise Exception("Unable to attach to pipeline. Node does not exist")
 
       node_addr = self.__get_node_address(node)
+      if self.__lazy_heartbeats:
+        self.__sync_pending_heartbeat(node_addr)
 
-      if name not in self._dct_online_nodes_pipelines[node_addr]:
+      if name not in self._dct_online_nodes_pipelines.get(node_addr, {}):
         raise Exception("Unable to attach to pipeline. Pipeline does not exist")
 
       pipeline: Pipeline = self._dct_online_nodes_pipelines[node_addr][name]
@@ -1378,7 +2061,7 @@ class GenericSession(BaseDecentrAIObject):
       if on_notification is not None:
         pipeline._add_on_notification_callback(on_notification)
 
-      self.own_pipelines.append(pipeline)
+      self.__register_own_pipeline(pipeline)
 
       return pipeline
 
@@ -1477,10 +2160,31 @@ class GenericSession(BaseDecentrAIObject):
       transactions : list[Transaction]
           The transactions to wait for.
       """
-      while not self.are_transactions_finished(transactions):
-        sleep(0.1)
+      if transactions is None or len(transactions) == 0:
+        return
+      wait([transaction.future for transaction in transactions], return_when=ALL_COMPLETED)
       return
 
+    async def wait_for_transactions_async(self, transactions: list[Transaction]):
+      """
+      Wait for the transactions to be solved, without blocking the event loop.
+      The transactions resolve asyncio futures when they finish, so no polling is involved.
+
+      Parameters
+      ----------
+      transactions : list[Transaction]
+          The transactions to wait for.
+
+      Returns
+      -------
+      list[Transaction]
+          The finished transactions.
+      """
+      if transactions is None or len(transactions) == 0:
+        return []
+      loop = asyncio.get_running_loop()
+      return await asyncio.gather(*[transaction.asyncio_future(loop) for transaction in transactions])
+
     def are_transactions_finished(self, transactions: list[Transaction]):
       if transactions is None:
         return True
@@ -1495,9 +2199,10 @@ class GenericSession(BaseDecentrAIObject):
       lst_transactions : list[list[Transaction]]
           The list of sets of transactions to wait for.
       """
-      all_finished = False
-      while not all_finished:
-        all_finished = all([self.are_transactions_finished(transactions) for transactions in lst_transactions])
+      all_transactions = [
+        transaction for transactions in lst_transactions if transactions is not None for transaction in transactions
+      ]
+      self.wait_for_transactions(all_transactions)
       return
 
     def wait_for_any_set_of_transactions(self, lst_transactions: list[list[Transaction]]):
@@ -1509,11 +2214,36 @@ class GenericSession(BaseDecentrAIObject):
       lst_transactions : list[list[Transaction]]
           The list of sets of transactions to wait for.
       """
-      any_finished = False
-      while not any_finished:
-        any_finished = any([self.are_transactions_finished(transactions) for transactions in lst_transactions])
+      if len(lst_transactions) == 0:
+        return
+      wait([self.__all_finished_future(transactions) for transactions in lst_transactions], return_when=FIRST_COMPLETED)
       return
 
+    def __all_finished_future(self, transactions: list[Transaction]) -> Future:
+      """
+      Returns a future completed when all the transactions are finished.
+      """
+      future = Future()
+      if transactions is None or len(transactions) == 0:
+        future.set_result(transactions)
+        return future
+
+      lock = Lock()
+      nr_pending = len(transactions)
+
+      def _on_done(_):
+        nonlocal nr_pending
+        with lock:
+          nr_pending -= 1
+          all_done = nr_pending == 0
+        if all_done:
+          future.set_result(transactions)
+        return
+
+      for transaction in transactions:
+        transaction.future.add_done_callback(_on_done)
+      return future
+
     def wait_for_any_node(self, timeout=15, verbose=True):
       """
       Wait for any node to appear online.
@@ -1532,11 +2262,15 @@ class GenericSession(BaseDecentrAIObject):
         self.P("Waiting for any node to appear online...")
 
       _start = tm()
-      found = len(self.get_active_nodes()) > 0
-      while (tm() - _start) < timeout and not found:
-        sleep(0.1)
+      node_online = Event()
+      waiter = self.__add_node_online_waiter(None, node_online.set)
+      try:
         found = len(self.get_active_nodes()) > 0
-      # end while
+        if not found and timeout > 0:
+          found = node_online.wait(timeout)
+      finally:
+        self.__remove_node_online_waiter(waiter)
+      # end try
 
       if verbose:
         if found:
@@ -1566,11 +2300,71 @@ class GenericSession(BaseDecentrAIObject):
         self.P("Waiting for node '{}' to appear online...".format(node))
 
       _start = tm()
-      found = self.check_node_online(node)
-      while (tm() - _start) < timeout and not found:
-        sleep(0.1)
+      node_online = Event()
+      waiter = self.__add_node_online_waiter(node, node_online.set)
+      try:
         found = self.check_node_online(node)
-      # end while
+        if not found and timeout > 0:
+          found = node_online.wait(timeout)
+      finally:
+        self.__remove_node_online_waiter(waiter)
+      # end try
+
+      if verbose:
+        if found:
+          self.P("Node '{}' is online.".format(node))
+        else:
+          self.P("Node '{}' did not appear online in {:.1f}s.".format(node, tm() - _start), color='r')
+      return found
+
+    async def wait_for_node_async(self, node, /, timeout=15, verbose=True):
+      """
+      Wait for a node to appear online, without blocking the event loop.
+      The wait is resolved by the heartbeat handler, so no polling is involved.
+
+      Parameters
+      ----------
+      node : str
+          The address or name of the Naeural edge node.
+      timeout : int, optional
+          The timeout, by default 15
+
+      Returns
+      -------
+      bool
+          True if the node is online, False otherwise.
+      """
+      if verbose:
+        self.P("Waiting for node '{}' to appear online...".format(node))
+
+      _start = tm()
+      loop = asyncio.get_running_loop()
+      future = loop.create_future()
+
+      def _set_result():
+        if not future.done():
+          future.set_result(True)
+        return
+
+      def _on_node_online():
+        try:
+          loop.call_soon_threadsafe(_set_result)
+        except RuntimeError:
+          # the event loop was closed meanwhile
+          pass
+        return
+
+      waiter = self.__add_node_online_waiter(node, _on_node_online)
+      try:
+        found = self.check_node_online(node)
+        if not found and timeout > 0:
+          try:
+            found = await asyncio.wait_for(future, timeout=timeout)
+          except asyncio.TimeoutError:
+            found = False
+      finally:
+        self.__remove_node_online_waiter(waiter)
+      # end try
 
       if verbose:
         if found:
@@ -1593,7 +2387,7 @@ class GenericSession(BaseDecentrAIObject):
       bool
           True if the node is online, False otherwise.
       """
-      return node in self.get_active_nodes() or node in self._dct_node_addr_name.values()
+      return self.__nodes_registry.is_active(node, self.online_timeout) or self.__nodes_registry.get_address(node) is not None
 
     def create_chain_dist_custom_job(
       self,
@@ -1708,12 +2502,15 @@ class GenericSession(BaseDecentrAIObject):
 
       lst_result_payload = [None] * len(instances)
       uid = self.log.get_uid()
+      responses_received = Event()
 
       def wait_payload_on_data(pos):
         def custom_func(pipeline, data):
           nonlocal lst_result_payload, pos
           if response_params_key in data and data[response_params_key].get("SDK_REQUEST") == uid:
             lst_result_payload[pos] = data
+            if require_responses_mode == "any" or all([x is not None for x in lst_result_payload]):
+              responses_received.set()
           return
         # end def custom_func
         return custom_func
@@ -1746,15 +2543,7 @@ class GenericSession(BaseDecentrAIObject):
       elif require_responses_mode == "any":
         self.wait_for_any_set_of_transactions(lst_instance_transactions)
 
-      start_time = tm()
-
-      condition_all = any([x is None for x in lst_result_payload]) and require_responses_mode == "all"
-      condition_any = all([x is None for x in lst_result_payload]) and require_responses_mode == "any"
-      while tm() - start_time < 3 and (condition_all or condition_any):
-        sleep(0.1)
-        condition_all = any([x is None for x in lst_result_payload]) and require_responses_mode == "all"
-        condition_any = all([x is None for x in lst_result_payload]) and require_responses_mode == "any"
-      # end while
+      responses_received.wait(3)
 
       for attachment, instance in lst_attachment_instance:
         instance.temporary_detach(attachment)
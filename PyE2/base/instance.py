@@ -1,6 +1,7 @@
 from ..const import PAYLOAD_DATA
 from .transaction import Transaction
 from .responses import PipelineOKResponse, PluginConfigOKResponse, PluginInstanceCommandOKResponse
+from threading import Event
 from time import time, sleep
 
 
@@ -64,7 +65,7 @@ class Instance():
 
   # Message handling
   if True:
-    def _on_data(self, pipeline, data):
+    def _on_data(self, pipeline, data, full_data=None):
       """
       Handle the data received from the instance.
 
@@ -73,12 +74,16 @@ class Instance():
       pipeline : Pipeline
           The pipeline that the instance is part of
       data : dict | Payload
-          The data received from the instance
+          The data received from the instance, as given to the user callbacks
+      full_data : dict | Payload, optional
+          The complete data, given to the temporary (internal) callbacks. If None, `data` is used
       """
       for callback in self.on_data_callbacks:
         callback(pipeline, data)
+      if full_data is None:
+        full_data = data
       for callback in self.temporary_on_data_callbacks.values():
-        callback(pipeline, data)
+        callback(pipeline, full_data)
       return
 
     def _on_notification(self, pipeline, data):
@@ -495,6 +500,45 @@ class Instance():
         return transactions
       return
 
+    async def send_instance_command_async(self, command, payload=None, command_params=None, session_id=None, timeout=10):
+      """
+      Awaitable version of `send_instance_command`. The confirmation resolves an asyncio future,
+      so the event loop is never blocked.
+
+      Example:
+      --------
+      ```python
+      await asyncio.gather(
+        instance1.send_instance_command_async('START'),
+        instance2.send_instance_command_async('START'),
+      )
+      ```
+      Parameters
+      ----------
+      command : str
+          The command to send
+      payload : dict, optional
+          The payload of the command, by default {}
+      command_params : dict, optional
+          The parameters of the command, by default {}
+      timeout : int, optional
+          The timeout for the transaction, by default 10
+
+      Returns
+      -------
+      list[Transaction]
+          The finished transactions.
+      """
+      transactions = self.send_instance_command(
+        command=command,
+        payload=payload,
+        command_params=command_params,
+        wait_confirmation=False,
+        session_id=session_id,
+        timeout=timeout,
+      )
+      return await self.pipeline.session.wait_for_transactions_async(transactions)
+
     def close(self):
       """
       Close the instance.
@@ -586,11 +630,13 @@ class Instance():
       """
       result_payload = None
       uid = self.log.get_uid()
+      payload_received = Event()
 
       def wait_payload_on_data(pipeline, data):
         nonlocal result_payload
         if response_params_key in data and data[response_params_key].get("SDK_REQUEST") == uid:
           result_payload = data
+          payload_received.set()
         return
 
       attachment = self.temporary_attach(on_data=wait_payload_on_data)
@@ -607,9 +653,7 @@ class Instance():
         timeout=timeout_command,
       )
 
-      start_time = time()
-      while time() - start_time < timeout_response_payload and result_payload is None:
-        sleep(0.1)
+      payload_received.wait(timeout_response_payload)
 
       self.temporary_detach(attachment)
 
@@ -0,0 +1,466 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time as tm
+
+import numpy as np
+
+from ..const import HB
+from .payload import LazyHeartbeat
+
+
+class MetricsRingBuffer(object):
+  """
+  Fixed-size history of metric vectors, backed by preallocated NumPy arrays.
+  When full, the oldest entries are overwritten.
+  """
+
+  def __init__(self, size, nr_metrics):
+    self._size = size
+    self._times = np.full(size, np.nan, dtype=np.float64)
+    self._values = np.full((size, nr_metrics), np.nan, dtype=np.float64)
+    self._pos = 0
+    self._count = 0
+    return
+
+  def __len__(self):
+    return self._count
+
+  def append(self, timestamp, values):
+    self._times[self._pos] = timestamp
+    self._values[self._pos] = values
+    self._pos = (self._pos + 1) % self._size
+    self._count = min(self._count + 1, self._size)
+    return
+
+  def get(self, window=None, now=None):
+    """
+    Returns the (times, values) entries in chronological order, copied.
+    If `window` is set, only the entries of the last `window` seconds.
+    """
+    if self._count < self._size:
+      order = np.arange(self._count)
+    else:
+      order = np.roll(np.arange(self._size), -self._pos)
+    times = self._times[order]
+    values = self._values[order]
+    if window is not None:
+      now = tm() if now is None else now
+      start = np.searchsorted(times, now - window, side='left')
+      times, values = times[start:], values[start:]
+    return times, values
+
+
+class NodeRegistry(object):
+  """
+  State of the nodes seen by a session, stored in NumPy columns indexed by node (one row per node address).
+
+  The scalar metrics of the last heartbeat of each node are kept in float columns, the last seen time,
+  the supervisor and allowed flags in their own columns, so the queries over the whole fleet
+  (active nodes, allowed nodes, supervisors, metrics) are vectorised.
+  The bulky fields of the heartbeats (logs, timers, pipelines configs) are not kept by default;
+  if they are, the lists are capped to their last `heavy_fields_max_len` elements.
+  If `history_size` is set, the metrics of the last `history_size` heartbeats of each node
+  are also kept in a `MetricsRingBuffer`.
+
+  The columns are reallocated when the capacity is exceeded, so they are only written, and read
+  across columns, while holding `_lock`.
+  """
+
+  METRICS = [
+    HB.CPU_USED,
+    HB.AVAILABLE_MEMORY,
+    HB.MACHINE_MEMORY,
+    HB.PROCESS_MEMORY,
+    HB.AVAILABLE_DISK,
+    HB.TOTAL_DISK,
+    HB.UPTIME,
+    HB.NR_INFERENCES,
+    HB.NR_PAYLOADS,
+    HB.NR_STREAMS_DATA,
+    # from `COMM_STATS`
+    HB.COMM_INFO.IN_KB,
+    HB.COMM_INFO.OUT_KB,
+  ]
+  COMM_STATS_METRICS = [HB.COMM_INFO.IN_KB, HB.COMM_INFO.OUT_KB]
+
+  HISTORY_STATS = ['mean', 'min', 'max', 'last', 'percentile', 'rate']
+
+  HEAVY_FIELDS = [
+    HB.TIMERS,
+    HB.DEVICE_LOG,
+    HB.ERROR_LOG,
+    HB.CONFIG_STREAMS,
+    HB.LOOPS_TIMINGS,
+    HB.ACTIVE_PLUGINS,
+    HB.ENCODED_DATA,
+  ]
+
+  def __init__(self, initial_capacity=64, keep_heavy_fields=False, heavy_fields_max_len=100, history_size=0):
+    """
+    Parameters
+    ----------
+    initial_capacity : int, optional
+        The initial number of rows, doubled when full. Defaults to 64
+    keep_heavy_fields : bool, optional
+        If True, the last heartbeat of each node is kept with its bulky fields. Defaults to False
+    heavy_fields_max_len : int, optional
+        The maximum number of elements kept from the list-like bulky fields. Defaults to 100
+    history_size : int, optional
+        The number of heartbeats whose metrics are kept for each node. If 0, no history is kept. Defaults to 0
+    """
+    self._keep_heavy_fields = keep_heavy_fields
+    self._heavy_fields_max_len = heavy_fields_max_len
+    self._history_size = history_size or 0
+    # row -> MetricsRingBuffer
+    self._dct_history = {}
+    self._lock = Lock()
+
+    self._dct_row = {}
+    # name -> address index
+    self._dct_name_addr = {}
+    # address -> row, ordered by last seen time (most recent last), so the active nodes are a suffix
+    self._recency = OrderedDict()
+    self._addresses = []
+    self._names = []
+    self._last_heartbeats = []
+    # rows whose lazy heartbeat was not decoded yet, see `LazyHeartbeat`
+    self._dct_pending_heartbeats = {}
+
+    self._capacity = 0
+    self._last_seen = np.zeros(0, dtype=np.float64)
+    self._is_supervisor = np.zeros(0, dtype=bool)
+    self._can_send = np.zeros(0, dtype=bool)
+    self._metrics = np.zeros((0, len(self.METRICS)), dtype=np.float64)
+    self.__grow(initial_capacity)
+    return
+
+  def __len__(self):
+    return len(self._addresses)
+
+  def __contains__(self, node_addr):
+    return node_addr in self._dct_row
+
+  def __grow(self, capacity):
+    # called with `_lock` held
+    nr_rows = len(self._addresses)
+
+    def _resized(column, fill_value):
+      new_column = np.full((capacity,) + column.shape[1:], fill_value, dtype=column.dtype)
+      new_column[:nr_rows] = column[:nr_rows]
+      return new_column
+
+    self._last_seen = _resized(self._last_seen, -np.inf)
+    self._is_supervisor = _resized(self._is_supervisor, False)
+    self._can_send = _resized(self._can_send, False)
+    self._metrics = _resized(self._metrics, np.nan)
+    self._capacity = capacity
+    return
+
+  def __get_or_add_row(self, node_addr):
+    row = self._dct_row.get(node_addr)
+    if row is None:
+      with self._lock:
+        row = self._dct_row.get(node_addr)
+        if row is None:
+          if len(self._addresses) == self._capacity:
+            self.__grow(max(self._capacity * 2, 1))
+          row = len(self._addresses)
+          self._addresses.append(node_addr)
+          self._names.append(None)
+          self._last_heartbeats.append(None)
+          self._dct_row[node_addr] = row
+      # endwith
+    return row
+
+  def __compact_heartbeat(self, heartbeat):
+    compact = {}
+    for key, value in heartbeat.items():
+      if key in self.HEAVY_FIELDS:
+        if not self._keep_heavy_fields:
+          continue
+        if isinstance(value, list):
+          value = value[-self._heavy_fields_max_len:]
+      compact[key] = value
+    return compact
+
+  def __extract_metrics(self, heartbeat):
+    comm_stats = heartbeat.get(HB.COMM_STATS)
+    if not isinstance(comm_stats, dict):
+      comm_stats = {}
+    values = np.full(len(self.METRICS), np.nan, dtype=np.float64)
+    for col, metric in enumerate(self.METRICS):
+      source = comm_stats if metric in self.COMM_STATS_METRICS else heartbeat
+      try:
+        values[col] = float(source.get(metric))
+      except (TypeError, ValueError):
+        pass
+    return values
+
+  def __apply_heartbeat(self, row, heartbeat, timestamp=None):
+    values = self.__extract_metrics(heartbeat)
+    is_supervisor = bool(heartbeat.get(HB.EE_IS_SUPER, False))
+    compact_heartbeat = self.__compact_heartbeat(heartbeat)
+    with self._lock:
+      self._metrics[row] = values
+      self._is_supervisor[row] = is_supervisor
+      self._last_heartbeats[row] = compact_heartbeat
+      if self._history_size > 0:
+        history = self._dct_history.get(row)
+        if history is None:
+          history = MetricsRingBuffer(self._history_size, len(self.METRICS))
+          self._dct_history[row] = history
+        history.append(tm() if timestamp is None else timestamp, values)
+    # endwith
+    return
+
+  def __apply_pending_heartbeats(self, rows=None):
+    if len(self._dct_pending_heartbeats) == 0:
+      return
+    with self._lock:
+      if rows is None:
+        rows = list(self._dct_pending_heartbeats.keys())
+      pending = [(row, self._dct_pending_heartbeats.pop(row, None)) for row in rows]
+    for row, heartbeat in pending:
+      if heartbeat is not None:
+        self.__apply_heartbeat(row, heartbeat)
+    return
+
+  def __active_rows(self, timeout):
+    # called with `_lock` held
+    oldest_active = tm() - timeout
+    rows = []
+    for row in reversed(self._recency.values()):
+      if self._last_seen[row] <= oldest_active:
+        break
+      rows.append(row)
+    rows.reverse()
+    return rows
+
+  def __active_addresses_where(self, timeout, column_name):
+    with self._lock:
+      rows = np.array(self.__active_rows(timeout), dtype=np.int64)
+      rows = rows[getattr(self, column_name)[rows]]
+      return [self._addresses[row] for row in rows]
+
+  # Updates
+  if True:
+    def seen(self, node_addr, node_id=None):
+      """
+      Mark the node as seen now.
+
+      Parameters
+      ----------
+      node_addr : str
+          The address of the node.
+      node_id : str, optional
+          The name of the node.
+      """
+      row = self.__get_or_add_row(node_addr)
+      with self._lock:
+        self._last_seen[row] = tm()
+        self._recency[node_addr] = row
+        self._recency.move_to_end(node_addr)
+        if node_id is not None and self._names[row] != node_id:
+          old_name = self._names[row]
+          if old_name is not None and self._dct_name_addr.get(old_name) == node_addr:
+            del self._dct_name_addr[old_name]
+          self._names[row] = node_id
+          self._dct_name_addr[node_id] = node_addr
+      # endwith
+      return
+
+    def update_heartbeat(self, node_addr, heartbeat):
+      """
+      Store the metrics of the last heartbeat of a node.
+      A `LazyHeartbeat` not decoded yet is only decoded when its metrics are queried,
+      unless the history is kept, in which case it is decoded now.
+
+      Parameters
+      ----------
+      node_addr : str
+          The address of the node.
+      heartbeat : dict
+          The heartbeat.
+      """
+      row = self.__get_or_add_row(node_addr)
+      if isinstance(heartbeat, LazyHeartbeat) and not heartbeat.is_decoded and self._history_size == 0:
+        with self._lock:
+          self._dct_pending_heartbeats[row] = heartbeat
+      else:
+        with self._lock:
+          self._dct_pending_heartbeats.pop(row, None)
+        self.__apply_heartbeat(row, heartbeat)
+      return
+
+    def set_allowed(self, node_addr, allowed):
+      """
+      Set if the session can send messages to the node.
+      """
+      row = self.__get_or_add_row(node_addr)
+      with self._lock:
+        self._can_send[row] = bool(allowed)
+      return
+
+  # Queries
+  if True:
+    def get_name(self, node_addr):
+      row = self._dct_row.get(node_addr)
+      return self._names[row] if row is not None else None
+
+    def get_address(self, node_name):
+      """
+      Returns the address of the node with this name, or None.
+      """
+      return self._dct_name_addr.get(node_name)
+
+    def is_active(self, node_addr, timeout):
+      """
+      Returns True if the node was seen in the last `timeout` seconds.
+      """
+      row = self._dct_row.get(node_addr)
+      return row is not None and (tm() - self._last_seen[row]) < timeout
+
+    def get_names(self):
+      """
+      Returns a dict address -> name of all the nodes ever seen.
+      """
+      return {addr: name for addr, name in zip(self._addresses, self._names)}
+
+    def get_last_seen(self, node_addr):
+      row = self._dct_row.get(node_addr)
+      return float(self._last_seen[row]) if row is not None else None
+
+    def get_last_heartbeat(self, node_addr):
+      """
+      Returns the last heartbeat of the node, without the bulky fields unless `keep_heavy_fields` is set.
+      """
+      row = self._dct_row.get(node_addr)
+      if row is None:
+        return None
+      self.__apply_pending_heartbeats([row])
+      return self._last_heartbeats[row]
+
+    def get_active_nodes(self, timeout):
+      """
+      Returns the addresses of the nodes seen in the last `timeout` seconds.
+      """
+      with self._lock:
+        return [self._addresses[row] for row in self.__active_rows(timeout)]
+
+    def get_allowed_nodes(self, timeout):
+      """
+      Returns the addresses of the active nodes this session can send messages to.
+      """
+      return self.__active_addresses_where(timeout, '_can_send')
+
+    def get_active_supervisors(self, timeout):
+      """
+      Returns the addresses of the active supervisor nodes.
+      """
+      self.__apply_pending_heartbeats()
+      return self.__active_addresses_where(timeout, '_is_supervisor')
+
+    def get_metrics(self, timeout=None, metrics=None):
+      """
+      Returns the last heartbeat metrics of the nodes.
+
+      Parameters
+      ----------
+      timeout : float, optional
+          If set, only the nodes seen in the last `timeout` seconds are returned.
+      metrics : list[str], optional
+          The metrics to return, a subset of `NodeRegistry.METRICS`. If None, all of them.
+
+      Returns
+      -------
+      tuple[list[str], dict[str, np.ndarray]]
+          The addresses of the nodes and a dict metric -> column of values, aligned with the addresses.
+          Missing values are NaN.
+      """
+      self.__apply_pending_heartbeats()
+      if metrics is None:
+        metrics = self.METRICS
+      with self._lock:
+        if timeout is None:
+          rows = np.arange(len(self._addresses))
+        else:
+          rows = np.array(self.__active_rows(timeout), dtype=np.int64)
+        addresses = [self._addresses[row] for row in rows]
+        columns = {
+          metric: self._metrics[rows, self.METRICS.index(metric)]
+          for metric in metrics
+        }
+      # endwith
+      return addresses, columns
+
+    def get_history(self, node_addr, metric, window=None):
+      """
+      Returns the history of a metric of a node.
+
+      Parameters
+      ----------
+      node_addr : str
+          The address of the node.
+      metric : str
+          One of `NodeRegistry.METRICS`.
+      window : float, optional
+          If set, only the values received in the last `window` seconds.
+
+      Returns
+      -------
+      tuple[np.ndarray, np.ndarray]
+          The receive times and the values, in chronological order. Empty if no history is kept.
+      """
+      col = self.METRICS.index(metric)
+      row = self._dct_row.get(node_addr)
+      with self._lock:
+        history = self._dct_history.get(row)
+        if history is None:
+          return np.zeros(0), np.zeros(0)
+        times, values = history.get(window=window)
+      return times, values[:, col]
+
+    def get_history_stat(self, node_addr, metric, stat='mean', window=None, q=50):
+      """
+      Returns an aggregate of the history of a metric of a node.
+
+      Parameters
+      ----------
+      node_addr : str
+          The address of the node.
+      metric : str
+          One of `NodeRegistry.METRICS`.
+      stat : str, optional
+          One of `NodeRegistry.HISTORY_STATS`. 'rate' is the change per second between the first
+          and the last value of the window, useful for counters. Defaults to 'mean'
+      window : float, optional
+          If set, only the values received in the last `window` seconds.
+      q : float, optional
+          The percentile, used when `stat` is 'percentile'. Defaults to 50
+
+      Returns
+      -------
+      float
+          The aggregate, NaN if there are no values.
+      """
+      if stat not in self.HISTORY_STATS:
+        raise ValueError("Unknown stat {}, expected one of {}".format(stat, self.HISTORY_STATS))
+      times, values = self.get_history(node_addr, metric, window=window)
+      valid = ~np.isnan(values)
+      times, values = times[valid], values[valid]
+      if len(values) == 0:
+        return float('nan')
+      if stat == 'mean':
+        return float(values.mean())
+      if stat == 'min':
+        return float(values.min())
+      if stat == 'max':
+        return float(values.max())
+      if stat == 'last':
+        return float(values[-1])
+      if stat == 'percentile':
+        return float(np.percentile(values, q))
+      # rate
+      if len(values) < 2 or times[-1] == times[0]:
+        return float('nan')
+      return float((values[-1] - values[0]) / (times[-1] - times[0]))
@@ -1 +1,2 @@
 from .payload import Payload
+from .lazy_heartbeat import LazyHeartbeat
@@ -0,0 +1,55 @@
+from collections import UserDict
+from threading import Lock
+
+from ...const import HB
+
+
+class LazyHeartbeat(UserDict):
+  """
+  A v2 heartbeat whose compressed `ENCODED_DATA` is decoded only when a key is first read.
+  Used by sessions created with `lazy_heartbeats=True`, so the heartbeats of nodes
+  that nobody looks at are never decompressed.
+  """
+
+  def __init__(self, envelope: dict, decode_func: callable):
+    """
+    Parameters
+    ----------
+    envelope : dict
+        The received heartbeat, containing `ENCODED_DATA`.
+    decode_func : Callable[[str], dict]
+        Decodes the `ENCODED_DATA` string into a dict.
+    """
+    # `UserDict.__init__` is not called as it would set `data`
+    self._envelope = envelope
+    self._decode_func = decode_func
+    self._decoded = None
+    self._decode_lock = Lock()
+    return
+
+  @property
+  def data(self):
+    if self._decoded is None:
+      with self._decode_lock:
+        if self._decoded is None:
+          decoded = self._decode_func(self._envelope[HB.ENCODED_DATA]) or {}
+          self._decoded = {**self._envelope, **decoded}
+      # endwith
+    return self._decoded
+
+  @data.setter
+  def data(self, value):
+    self._decoded = value
+    return
+
+  @property
+  def is_decoded(self) -> bool:
+    return self._decoded is not None
+
+  def peek(self, key, default=None):
+    """
+    Get a value from the envelope without decoding the heartbeat (if not already decoded).
+    """
+    if self._decoded is not None:
+      return self._decoded.get(key, default)
+    return self._envelope.get(key, default)
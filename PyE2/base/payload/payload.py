@@ -1,6 +1,7 @@
 import base64
 import io
 from collections import UserDict
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
@@ -11,25 +12,82 @@ class Payload(UserDict):
   helpful methods to process the payloads received from Naeural edge nodes.
   """
 
-  def get_images_as_np(self, key='IMG') -> list:
+  IMAGE_BACKENDS = ['pil', 'cv2']
+
+  def get_images_as_np(self, key='IMG', backend='pil', num_workers=None, use_cache=True, read_only=False) -> list:
     """
     Extract the image from the payload.
     The image is returned as a numpy array.
 
+    The decoded images are cached on the payload, so calling this method again for the same key
+    does not decode them again. By default a writable copy of the cached arrays is returned.
+    With `read_only=True` the cached arrays themselves are returned, without copying them: they are
+    shared by all the callers (the same payload is given to several callbacks), so they are read-only.
+
     Parameters
     ----------
     key : str, optional
         The key from which to extract the image, by default 'IMG'.
         Can be modified if the user wants to extract an image from a different key
+    backend : str, optional
+        The library used to decode the images: 'pil' or 'cv2'. 'cv2' decodes straight into a numpy array,
+        without the intermediate PIL image, and returns the color images as RGB(A), like 'pil'.
+        Palette images are returned as indices by 'pil' and as colors by 'cv2'.
+        By default 'pil'
+    num_workers : int, optional
+        If greater than 1 and the key holds a list of images, the images are decoded in parallel
+        by this many threads. By default None
+    use_cache : bool, optional
+        If False, the images are decoded again and the cache is not used nor updated.
+        By default True
+    read_only : bool, optional
+        If True and `use_cache` is True, return the shared read-only cached arrays instead of writable copies.
+        By default False
 
     Returns
     -------
     NDArray[Any] | None
         The image if it was found or None otherwise.
     """
-    images = self.get_images_as_PIL(key)
-    images = [np.array(image) if image is not None else None for image in images]
-    return images
+    if backend not in self.IMAGE_BACKENDS:
+      raise ValueError("Unknown image backend {}, expected one of {}".format(backend, self.IMAGE_BACKENDS))
+
+    base64_img = self.data.get(key, None)
+    if base64_img is None:
+      return [None]
+
+    cache = self.__dict__.setdefault('_np_images_cache', {})
+    if use_cache:
+      cached_source, cached_backend, cached_images = cache.get(key, (None, None, None))
+      if cached_source is base64_img and cached_backend == backend:
+        return self.__images_from_cache(cached_images, read_only)
+    # endif use_cache
+
+    lst_b64 = base64_img if isinstance(base64_img, list) else [base64_img]
+    decode_func = self._np_image_from_b64_cv2 if backend == 'cv2' else self._np_image_from_b64
+
+    def _decode(b64):
+      return decode_func(b64) if b64 is not None else None
+
+    if num_workers is not None and num_workers > 1 and len(lst_b64) > 1:
+      with ThreadPoolExecutor(max_workers=min(num_workers, len(lst_b64))) as executor:
+        images = list(executor.map(_decode, lst_b64))
+    else:
+      images = [_decode(b64) for b64 in lst_b64]
+
+    if not use_cache:
+      return images
+
+    for image in images:
+      if image is not None:
+        image.setflags(write=False)
+    cache[key] = (base64_img, backend, images)
+    return self.__images_from_cache(images, read_only)
+
+  def __images_from_cache(self, cached_images, read_only):
+    if read_only:
+      return list(cached_images)
+    return [image.copy() if image is not None else None for image in cached_images]
 
   def get_images_as_PIL(self, key='IMG') -> list:
     """
@@ -62,5 +120,27 @@ class Payload(UserDict):
       base64_decoded = base64.b64decode(base64_img)
       image = Image.open(io.BytesIO(base64_decoded))
     except ModuleNotFoundError:
-      raise "This functionality requires the PIL library. To use this feature, please install it using 'pip install pillow'"
+      raise ModuleNotFoundError("This functionality requires the PIL library. To use this feature, please install it using 'pip install pillow'")
+    return image
+
+  def _np_image_from_b64(self, base64_img):
+    image = self._image_from_b64(base64_img)
+    # decode once, then copy the pixels into the array
+    image.load()
+    return np.array(image)
+
+  def _np_image_from_b64_cv2(self, base64_img):
+    try:
+      import cv2
+    except ModuleNotFoundError:
+      raise ModuleNotFoundError("The 'cv2' image backend requires OpenCV. To use this feature, please install it using 'pip install opencv-python'")
+
+    buffer = np.frombuffer(base64.b64decode(base64_img), dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    if image is None:
+      raise ValueError("Could not decode the image")
+    if image.ndim == 3 and image.shape[2] == 3:
+      cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    elif image.ndim == 3 and image.shape[2] == 4:
+      cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA, dst=image)
     return image
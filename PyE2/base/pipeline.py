@@ -1,6 +1,8 @@
 # TODO: for custom plugin, do the plugin verification locally too
 
+import asyncio
 import os
+from threading import Event
 from time import sleep, time
 
 from ..code_cheker.base import BaseCodeChecker
@@ -117,6 +119,8 @@ class Pipeline(BaseCodeChecker):
       self.on_notification_callbacks.append(on_notification)
 
     self.lst_plugin_instances: list[Instance] = []
+    # routing index (signature, instance_id) -> Instance for the instances in `lst_plugin_instances`
+    self.__dct_instances: dict[tuple[str, str], Instance] = {}
 
     self.__init_plugins(plugins, is_attached)
     return
@@ -141,9 +145,37 @@ class Pipeline(BaseCodeChecker):
                                 on_notification=on_notification,
                                 is_attached=is_attached
                                 )
-      self.lst_plugin_instances.append(instance)
+      self.__add_instance(instance)
       return instance
 
+    def __add_instance(self, instance: Instance):
+      """
+      Add an instance to the list of instances of this pipeline and index it by (signature, instance_id).
+
+      Parameters
+      ----------
+      instance : Instance
+          The instance to add.
+      """
+      self.lst_plugin_instances.append(instance)
+      self.__dct_instances[(instance.signature, instance.instance_id)] = instance
+      return
+
+    def __discard_instance(self, instance: Instance):
+      """
+      Remove an instance from the list of instances of this pipeline and from the index.
+
+      Parameters
+      ----------
+      instance : Instance
+          The instance to remove.
+      """
+      self.lst_plugin_instances.remove(instance)
+      key = (instance.signature, instance.instance_id)
+      if self.__dct_instances.get(key, None) is instance:
+        del self.__dct_instances[key]
+      return
+
     def __init_plugins(self, plugins, is_attached):
       """
       Initialize the plugins list. This method is called at the creation of the pipeline and is used to create the instances of the plugins that are part of the pipeline.
@@ -434,10 +466,7 @@ class Pipeline(BaseCodeChecker):
       Instance
           The instance object.
       """
-      for instance in self.lst_plugin_instances:
-        if instance.signature == signature and instance.instance_id == instance_id:
-          return instance
-      return None
+      return self.__dct_instances.get((signature, instance_id), None)
 
     def __set_last_operation_successful(self):
       """
@@ -518,7 +547,7 @@ class Pipeline(BaseCodeChecker):
                "Most likely the instance deletion used `with_confirmation=False`".format(
                    instance.signature, instance.instance_id), color="r")
 
-      self.lst_plugin_instances.append(instance)
+      self.__add_instance(instance)
       return
 
     def __apply_staged_config(self, verbose=False):
@@ -546,7 +575,7 @@ class Pipeline(BaseCodeChecker):
 
       for instance in self.__staged_remove_instances:
         instance.config = None
-        self.lst_plugin_instances.remove(instance)
+        self.__discard_instance(instance)
 
       self.__staged_remove_instances = []
       return
@@ -664,9 +693,47 @@ class Pipeline(BaseCodeChecker):
 
       return self.code_to_base64(plain_code, verbose=False)
 
+    def __create_rest_custom_exec_instance(self, custom_code, instance_config, on_result):
+      """
+      Create a REST-like custom execution instance that calls `on_result(result, error)` when the
+      execution result is received.
+      """
+      b64code = self._get_base64_code(custom_code)
+
+      def on_data(pipeline, data):
+        if 'REST_EXECUTION_RESULT' in data and 'REST_EXECUTION_ERROR' in data:
+          on_result(data['REST_EXECUTION_RESULT'], data['REST_EXECUTION_ERROR'])
+        return
+
+      instance_id = self.name + "_rest_custom_exec_synchronous_" + self.log.get_unique_id()
+      instance_config = {
+          'REQUEST': {
+              'DATA': {
+                  'CODE': b64code,
+              },
+              'TIMESTAMP': self.log.time_to_str()
+          },
+          'RESULT_KEY': 'REST_EXECUTION_RESULT',
+          'ERROR_KEY': 'REST_EXECUTION_ERROR',
+          **instance_config
+      }
+
+      prop_config = self.__get_proposed_pipeline_config()
+      if prop_config['TYPE'] == 'Void':
+        instance_config['ALLOW_EMPTY_INPUTS'] = True
+        instance_config['RUN_WITHOUT_IMAGE'] = True
+
+      self.create_plugin_instance(
+          signature='REST_CUSTOM_EXEC_01',
+          instance_id=instance_id,
+          config=instance_config,
+          on_data=on_data
+      )
+      return
+
   # Message handling
   if True:
-    def _on_data(self, signature, instance_id, data):
+    def _on_data(self, signature, instance_id, data, full_data=None):
       """
       Handle the data received from the Naeural edge node. This method is called by the Session object when a message is received from the Naeural edge node.
       This method will call all the `on_data` callbacks of the pipeline and the instance that received the message.
@@ -678,14 +745,16 @@ class Pipeline(BaseCodeChecker):
       instance_id : str
           The name of the instance that sent the message.
       data : dict | Payload
-          The payload of the message.
+          The payload of the message, as given to the user callbacks.
+      full_data : dict | Payload, optional
+          The complete payload, given to the internal callbacks, if `data` only has some of its keys.
       """
       # call all self callbacks
       for callback in self.on_data_callbacks:
         callback(self, signature, instance_id, data)
 
       # call all instance callbacks
-      self.__call_instance_on_data_callbacks(signature, instance_id, data)
+      self.__call_instance_on_data_callbacks(signature, instance_id, data, full_data=full_data)
       return
 
     def _on_notification(self, signature, instance_id, data):
@@ -747,7 +816,7 @@ class Pipeline(BaseCodeChecker):
       self.on_notification_callbacks = []
       return
 
-    def __call_instance_on_data_callbacks(self, signature, instance_id, data):
+    def __call_instance_on_data_callbacks(self, signature, instance_id, data, full_data=None):
       """
       Call all the `on_data` callbacks of the instance that sent the message.
 
@@ -759,10 +828,12 @@ class Pipeline(BaseCodeChecker):
           The name of the instance that sent the payload.
       data : dict | Payload
           The payload of the payload.
+      full_data : dict | Payload, optional
+          The complete payload, see `_on_data`.
       """
-      for instance in self.lst_plugin_instances:
-        if instance.signature == signature and instance.instance_id == instance_id:
-          instance._on_data(self, data)
+      instance = self.__dct_instances.get((signature, instance_id), None)
+      if instance is not None:
+        instance._on_data(self, data, full_data=full_data)
       return
 
     def __call_instance_on_notification_callbacks(self, signature, instance_id, data):
@@ -778,9 +849,9 @@ class Pipeline(BaseCodeChecker):
       data : dict | Payload
           The payload of the notification.
       """
-      for instance in self.lst_plugin_instances:
-        if instance.signature == signature and instance.instance_id == instance_id:
-          instance._on_notification(self, data)
+      instance = self.__dct_instances.get((signature, instance_id), None)
+      if instance is not None:
+        instance._on_notification(self, data)
       return
 
   # API
@@ -837,9 +908,8 @@ class Pipeline(BaseCodeChecker):
         plugin_template = signature
         str_signature = plugin_template.signature.upper()
 
-      for instance in self.lst_plugin_instances:
-        if instance.instance_id == instance_id and instance.signature == str_signature:
-          raise Exception("plugin {} with instance {} already exists".format(str_signature, instance_id))
+      if (str_signature, instance_id) in self.__dct_instances:
+        raise Exception("plugin {} with instance {} already exists".format(str_signature, instance_id))
 
       # create the new instance and add it to the list
       config = {**config, **kwargs}
@@ -858,10 +928,10 @@ class Pipeline(BaseCodeChecker):
       if instance is None:
         raise Exception("The provided instance is None. Please provide a valid instance")
 
-      if instance not in self.lst_plugin_instances:
+      if self.__dct_instances.get((instance.signature, instance.instance_id), None) is not instance:
         raise Exception("plugin  <{}/{}> does not exist on this pipeline".format(instance.signature, instance.instance_id))
 
-      self.lst_plugin_instances.remove(instance)
+      self.__discard_instance(instance)
       return
 
     def remove_plugin_instance(self, instance):
@@ -1040,6 +1110,26 @@ class Pipeline(BaseCodeChecker):
         return transactions
       return
 
+    async def deploy_async(self, timeout=10, verbose=False):
+      """
+      Awaitable version of `deploy`. The confirmations from the Naeural edge node resolve asyncio futures,
+      so a single event loop can drive many concurrent deployments.
+
+      Parameters
+      ----------
+      timeout : int, optional
+          The timeout of the deploy transactions, by default 10
+      verbose : bool, optional
+          Print the proposed changes, by default False
+
+      Returns
+      -------
+      list[Transaction]
+          The finished transactions.
+      """
+      transactions = self.deploy(with_confirmation=True, wait_confirmation=False, timeout=timeout, verbose=verbose)
+      return await self.session.wait_for_transactions_async(transactions)
+
     def wait_exec(self, *, custom_code: callable, instance_config={}, timeout=10):
       """
       Create a new REST-like custom execution instance, with a given configuration. This instance is attached to this pipeline, 
@@ -1068,54 +1158,70 @@ class Pipeline(BaseCodeChecker):
           Plugin instance already exists. 
       """
 
-      b64code = self._get_base64_code(custom_code)
-
-      finished = False
+      finished = Event()
       result = None
       error = None
 
-      def on_data(pipeline, data):
-        nonlocal finished
+      def on_result(exec_result, exec_error):
         nonlocal result
         nonlocal error
 
-        if 'REST_EXECUTION_RESULT' in data and 'REST_EXECUTION_ERROR' in data:
-          result = data['REST_EXECUTION_RESULT']
-          error = data['REST_EXECUTION_ERROR']
-          finished = True
+        result = exec_result
+        error = exec_error
+        finished.set()
         return
 
-      instance_id = self.name + "_rest_custom_exec_synchronous_" + self.log.get_unique_id()
-      instance_config = {
-          'REQUEST': {
-              'DATA': {
-                  'CODE': b64code,
-              },
-              'TIMESTAMP': self.log.time_to_str()
-          },
-          'RESULT_KEY': 'REST_EXECUTION_RESULT',
-          'ERROR_KEY': 'REST_EXECUTION_ERROR',
-          **instance_config
-      }
+      self.__create_rest_custom_exec_instance(custom_code, instance_config, on_result)
 
-      prop_config = self.__get_proposed_pipeline_config()
-      if prop_config['TYPE'] == 'Void':
-        instance_config['ALLOW_EMPTY_INPUTS'] = True
-        instance_config['RUN_WITHOUT_IMAGE'] = True
+      self.deploy()
 
-      self.create_plugin_instance(
-          signature='REST_CUSTOM_EXEC_01',
-          instance_id=instance_id,
-          config=instance_config,
-          on_data=on_data
-      )
+      finished.wait(timeout)
 
-      self.deploy()
+      return result, error
 
-      start_time = time()
-      while not finished and time() - start_time < timeout:
-        sleep(0.1)
+    async def wait_exec_async(self, *, custom_code: callable, instance_config={}, timeout=10):
+      """
+      Awaitable version of `wait_exec`. The deploy confirmation and the execution result
+      resolve asyncio futures, so the event loop is never blocked.
 
+      Parameters
+      ----------
+      custom_code : Callable[[CustomPluginTemplate], Any], optional
+          A string containing the entire code, a path to a file containing the code as a string or a function with the code.
+      instance_config : dict, optional
+          parameters used to customize the functionality, by default {}
+      timeout : int, optional
+          The maximum time to wait for the result, by default 10
+
+      Returns
+      -------
+      Tuple[Any, Any]
+          a tuple containing the result of the execution and the error, if any.
+      """
+      loop = asyncio.get_running_loop()
+      future = loop.create_future()
+
+      def _set_result(exec_result, exec_error):
+        if not future.done():
+          future.set_result((exec_result, exec_error))
+        return
+
+      def on_result(exec_result, exec_error):
+        try:
+          loop.call_soon_threadsafe(_set_result, exec_result, exec_error)
+        except RuntimeError:
+          # the event loop was closed meanwhile
+          pass
+        return
+
+      self.__create_rest_custom_exec_instance(custom_code, instance_config, on_result)
+
+      await self.deploy_async()
+
+      try:
+        result, error = await asyncio.wait_for(future, timeout=timeout)
+      except asyncio.TimeoutError:
+        result, error = None, None
       return result, error
 
     def close(self, wait_confirmation=True, timeout=10):
@@ -1131,6 +1237,23 @@ class Pipeline(BaseCodeChecker):
         return transactions
       return
 
+    async def close_async(self, timeout=10):
+      """
+      Awaitable version of `close`.
+
+      Parameters
+      ----------
+      timeout : int, optional
+          The timeout of the close transactions, by default 10
+
+      Returns
+      -------
+      list[Transaction]
+          The finished transactions.
+      """
+      transactions = self._close(timeout=timeout)
+      return await self.session.wait_for_transactions_async(transactions)
+
     def P(self, *args, **kwargs):
       """
       Print info to stdout.
@@ -1185,11 +1308,7 @@ class Pipeline(BaseCodeChecker):
       else:
         plugin_template = signature
         str_signature = plugin_template.signature.upper()
-      found_instance = None
-      for instance in self.lst_plugin_instances:
-        if instance.instance_id == instance_id and instance.signature == str_signature.upper():
-          found_instance = instance
-          break
+      found_instance = self.__dct_instances.get((str_signature, instance_id), None)
 
       if found_instance is None:
         raise Exception(f"Unable to attach to instance. Instance <{str_signature}/{instance_id}> does not exist")
@@ -1438,7 +1557,8 @@ class Pipeline(BaseCodeChecker):
         # end for dct_instance
       # end for dct_signature_instances
 
-      for instance in self.lst_plugin_instances:
+      active_plugins = set(active_plugins)
+      for instance in list(self.lst_plugin_instances):
         if (instance.signature, instance.instance_id) not in active_plugins:
           self.__remove_plugin_instance(instance)
       # end for instance
@@ -47,6 +47,16 @@ class Response():
   def is_good_response(self) -> bool:
     return self.__is_good
 
+  def get_index_keys(self) -> list[tuple]:
+    """
+    Returns the keys (node, pipeline, signature, instance_id, notification_code) of the notifications
+    this response waits for, used to route only the matching notifications to this response.
+    Pipeline-level responses use None for the signature and instance_id.
+
+    If None, the response is not indexed and receives every payload, notification and heartbeat.
+    """
+    return None
+
   def handle_payload(self, payload: dict) -> None:
     # Implement this method and call self.success() or self.fail(fail_reason) if expected message is received
     return
@@ -71,6 +81,12 @@ class PipelineGenericNotificationResponse(Response):
     self.fail_code = fail_code
     return
 
+  def get_index_keys(self) -> list[tuple]:
+    return [
+      (self.node, self.pipeline_name, None, None, self.success_code),
+      (self.node, self.pipeline_name, None, None, self.fail_code),
+    ]
+
   def handle_notification(self, notification: dict) -> None:
     if self.is_solved():
       return
@@ -113,6 +129,13 @@ class InstanceGenericNotificationResponse(Response):
 
     return
 
+  def get_index_keys(self) -> list[tuple]:
+    signature = getattr(self, 'signature', None)
+    return [
+      (self.node, self.pipeline_name, signature, self.instance_id, self.success_code),
+      (self.node, self.pipeline_name, signature, self.instance_id, self.fail_code),
+    ]
+
   def handle_notification(self, notification: dict) -> None:
     if self.is_solved():
       return
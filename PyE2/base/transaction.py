@@ -1,4 +1,9 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+
 from PyE2.base.responses import Response
+from PyE2.const.payload import PAYLOAD_DATA
 # from .responses import Response
 from time import time, sleep
 
@@ -17,6 +22,10 @@ class Transaction():
     self.__is_solved = False
     self.__is_finished = False
 
+    self.__done_callbacks = []
+    self.__done_callbacks_lock = Lock()
+    self.__future = None
+
     self.start_time = time()
     for response in self.lst_required_responses:
       response.set_logger(log)
@@ -34,11 +43,17 @@ class Transaction():
     """
     return [response for response in self.lst_required_responses if not response.is_solved()]
 
-  def is_solved(self) -> bool:
+  def is_solved(self, timed_out: bool = False) -> bool:
     """
     Returns whether the transaction is solved or not.
     If the transaction is solved in this call, the resolved_callback is set to the appropriate callback function.
 
+    Parameters
+    ----------
+    timed_out : bool, optional
+        If True, the timeout of the transaction has already expired (e.g. reported by a timer),
+        so the elapsed time is not checked. Defaults to False
+
     Returns
     -------
     bool
@@ -71,7 +86,7 @@ class Transaction():
 
     # if the transaction is not solved, check if the transaction has timed out
     elapsed_time = time() - self.start_time
-    if self.timeout > 0 and elapsed_time > self.timeout:
+    if self.timeout > 0 and (timed_out or elapsed_time > self.timeout):
       # Timeout occurred
       self.__is_solved = True
 
@@ -149,9 +164,281 @@ class Transaction():
   def callback(self):
     """
     Calls the resolved_callback only if the transaction is solved.
+    After that, the callbacks added with `add_done_callback` are called.
     """
     if self.__is_solved:
       if self.resolved_callback:
         self.resolved_callback()
-      self.__is_finished = True
+      with self.__done_callbacks_lock:
+        self.__is_finished = True
+        done_callbacks = self.__done_callbacks
+        self.__done_callbacks = []
+      for done_callback in done_callbacks:
+        try:
+          done_callback(self)
+        except Exception as exc:
+          self.log.P("Exception in transaction done callback: {}".format(exc), color='r')
+    return
+
+  def add_done_callback(self, fn: callable) -> None:
+    """
+    Add a callback that will be called with this transaction as argument when the transaction finishes.
+    If the transaction is already finished, the callback is called immediately.
+    The callback is called from the thread that finishes the transaction (the session main loop),
+    so it should not block.
+
+    Parameters
+    ----------
+    fn : Callable[[Transaction], None]
+        The callback.
+    """
+    with self.__done_callbacks_lock:
+      if not self.__is_finished:
+        self.__done_callbacks.append(fn)
+        return
+    fn(self)
+    return
+
+  @property
+  def future(self) -> Future:
+    """
+    A `concurrent.futures.Future` completed with this transaction when the transaction finishes
+    (after its success/failure callback was called). It can be used with `concurrent.futures.wait`
+    and `as_completed` to compose waits without polling.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        The future.
+    """
+    with self.__done_callbacks_lock:
+      future = self.__future
+      if future is None:
+        future = self.__future = Future()
+        create_callback = True
+      else:
+        create_callback = False
+    if create_callback:
+      self.add_done_callback(self.__complete_future)
+    return future
+
+  def __complete_future(self, transaction):
+    future = self.__future
+    if future is not None and not future.done():
+      try:
+        future.set_result(transaction)
+      except Exception:
+        # cancelled meanwhile by the user
+        pass
+    return
+
+  def asyncio_future(self, loop: asyncio.AbstractEventLoop = None) -> asyncio.Future:
+    """
+    Returns an asyncio Future that is resolved with this transaction when the transaction finishes.
+
+    Parameters
+    ----------
+    loop : asyncio.AbstractEventLoop, optional
+        The event loop of the future. If None, the running loop is used.
+
+    Returns
+    -------
+    asyncio.Future
+        The future.
+    """
+    if loop is None:
+      loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _set_result(transaction):
+      if not future.done():
+        future.set_result(transaction)
+      return
+
+    def _on_done(transaction):
+      try:
+        loop.call_soon_threadsafe(_set_result, transaction)
+      except RuntimeError:
+        # the event loop was closed meanwhile
+        pass
+      return
+
+    self.add_done_callback(_on_done)
+    return future
+
+
+class TransactionsRegistry():
+  """
+  Holds the open transactions of a session and routes the received messages only to the
+  responses waiting for them.
+
+  The responses that provide index keys (see `Response.get_index_keys`) are indexed by
+  (node, pipeline, signature, instance_id, notification_code), so a notification only reaches
+  the matching responses. The transactions with responses that are not indexed receive every message.
+  A transaction is marked as ready the moment its last response is solved or when `expire` is called
+  for it (the registry does not track time).
+  """
+
+  def __init__(self) -> None:
+    self.__lock = Lock()
+    self.__open_transactions: dict[int, Transaction] = {}
+    # index key -> list of (response, transaction)
+    self.__responses_index: dict[tuple, list[tuple[Response, Transaction]]] = {}
+    # transactions with responses that are not indexed
+    self.__generic_transactions: dict[int, Transaction] = {}
+    # transactions solved by a message, waiting for their callback
+    self.__solved_transactions: list[Transaction] = []
+    return
+
+  def __len__(self):
+    return len(self.__open_transactions)
+
+  def add(self, transaction: Transaction) -> None:
+    """
+    Register an open transaction.
+
+    Parameters
+    ----------
+    transaction : Transaction
+        The transaction.
+    """
+    with self.__lock:
+      self.__open_transactions[id(transaction)] = transaction
+      for response in transaction.lst_required_responses:
+        keys = response.get_index_keys()
+        if keys is None:
+          self.__generic_transactions[id(transaction)] = transaction
+          continue
+        for key in set(keys):
+          self.__responses_index.setdefault(key, []).append((response, transaction))
+      # endfor
+      # transactions without required responses are solved right away
+      self.__mark_if_solved(transaction)
+    # endwith
+    return
+
+  def __remove(self, transaction: Transaction) -> None:
+    # must be called with the lock acquired
+    self.__open_transactions.pop(id(transaction), None)
+    self.__generic_transactions.pop(id(transaction), None)
+    for response in transaction.lst_required_responses:
+      keys = response.get_index_keys()
+      if keys is None:
+        continue
+      for key in set(keys):
+        lst_entries = self.__responses_index.get(key)
+        if lst_entries is None:
+          continue
+        lst_entries[:] = [entry for entry in lst_entries if entry[1] is not transaction]
+        if len(lst_entries) == 0:
+          del self.__responses_index[key]
+      # endfor
+    # endfor
     return
+
+  def __mark_if_solved(self, transaction: Transaction) -> bool:
+    # must be called with the lock acquired
+    if id(transaction) in self.__open_transactions and transaction.is_solved():
+      self.__remove(transaction)
+      self.__solved_transactions.append(transaction)
+      return True
+    return False
+
+  def __handle_generic(self, method_name: str, message: dict) -> bool:
+    if len(self.__generic_transactions) == 0:
+      return False
+    with self.__lock:
+      generic_transactions = list(self.__generic_transactions.values())
+    for transaction in generic_transactions:
+      getattr(transaction, method_name)(message)
+    nr_solved = 0
+    with self.__lock:
+      for transaction in generic_transactions:
+        nr_solved += self.__mark_if_solved(transaction)
+    return nr_solved > 0
+
+  def handle_notification(self, notification: dict) -> bool:
+    """
+    Route a notification to the matching responses.
+
+    Returns
+    -------
+    bool
+        True if some transactions were solved by this notification.
+    """
+    any_solved = False
+    payload_path = notification.get(PAYLOAD_DATA.EE_PAYLOAD_PATH)
+    if payload_path is not None and len(self.__responses_index) > 0:
+      node, pipeline, signature, instance_id = (list(payload_path) + [None] * 4)[:4]
+      if signature is not None:
+        signature = signature.upper()
+      code = notification.get("NOTIFICATION_CODE")
+      keys = {(node, pipeline, signature, instance_id, code), (node, pipeline, None, None, code)}
+
+      with self.__lock:
+        matches = [entry for key in keys for entry in self.__responses_index.get(key, [])]
+      for response, _ in matches:
+        response.handle_notification(notification)
+      if len(matches) > 0:
+        with self.__lock:
+          for response, transaction in matches:
+            if response.is_solved():
+              any_solved = self.__mark_if_solved(transaction) or any_solved
+          # endfor
+        # endwith
+    # endif indexed responses
+
+    any_solved = self.__handle_generic('handle_notification', notification) or any_solved
+    return any_solved
+
+  def handle_payload(self, payload: dict) -> bool:
+    """
+    Route a payload to the transactions with responses that are not indexed.
+
+    Returns
+    -------
+    bool
+        True if some transactions were solved by this payload.
+    """
+    return self.__handle_generic('handle_payload', payload)
+
+  def handle_heartbeat(self, heartbeat: dict) -> bool:
+    """
+    Route a heartbeat to the transactions with responses that are not indexed.
+
+    Returns
+    -------
+    bool
+        True if some transactions were solved by this heartbeat.
+    """
+    return self.__handle_generic('handle_heartbeat', heartbeat)
+
+  def expire(self, transaction: Transaction) -> bool:
+    """
+    Solve a transaction whose timeout expired, if it is still open.
+
+    Returns
+    -------
+    bool
+        True if the transaction was still open and is now solved.
+    """
+    with self.__lock:
+      if id(transaction) not in self.__open_transactions:
+        return False
+      transaction.is_solved(timed_out=True)
+      return self.__mark_if_solved(transaction)
+
+  def pop_solved(self) -> list[Transaction]:
+    """
+    Returns and unregisters the transactions that are solved, either by the received messages
+    or because they timed out (see `expire`).
+
+    Returns
+    -------
+    list[Transaction]
+        The solved transactions, in the order they were solved.
+    """
+    with self.__lock:
+      solved_transactions = self.__solved_transactions
+      self.__solved_transactions = []
+    return solved_transactions
@@ -5,9 +5,14 @@ import binascii
 import numpy as np
 import datetime
 
+import hashlib
+
 from hashlib import sha256, md5
+from functools import lru_cache
 from threading import Lock
 from copy import deepcopy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 from cryptography.hazmat.primitives import serialization
@@ -51,6 +56,72 @@ class VerifyMessage(_DotDict):
     self.message = None
     self.sender = None
     
+
+class _LRUCache:
+  """
+  Small thread-safe bounded LRU cache with hit/miss counters.
+  Used for caching expensive per-peer crypto objects (public keys, derived keys, etc).
+  """
+  def __init__(self, maxsize=1024):
+    self._maxsize = maxsize
+    self._data = OrderedDict()
+    self._lock = Lock()
+    self._hits = 0
+    self._misses = 0
+    return
+  
+  def __len__(self):
+    return len(self._data)
+  
+  @property
+  def maxsize(self):
+    return self._maxsize
+  
+  def get(self, key, default=None):
+    with self._lock:
+      if key in self._data:
+        self._data.move_to_end(key)
+        self._hits += 1
+        return self._data[key]
+      self._misses += 1
+    return default
+  
+  def put(self, key, value):
+    if self._maxsize is not None and self._maxsize <= 0:
+      return
+    with self._lock:
+      self._data[key] = value
+      self._data.move_to_end(key)
+      if self._maxsize is not None:
+        while len(self._data) > self._maxsize:
+          self._data.popitem(last=False)
+    return
+  
+  def invalidate(self, predicate=None):
+    """
+    Removes the entries for which `predicate(key)` is True or all entries if `predicate` is None.
+    Returns the number of removed entries.
+    """
+    with self._lock:
+      if predicate is None:
+        nr_removed = len(self._data)
+        self._data.clear()
+      else:
+        keys = [k for k in self._data if predicate(k)]
+        for k in keys:
+          del self._data[k]
+        nr_removed = len(keys)
+    return nr_removed
+  
+  def stats(self):
+    with self._lock:
+      return {
+        'size': len(self._data),
+        'maxsize': self._maxsize,
+        'hits': self._hits,
+        'misses': self._misses,
+      }
+
     
 NON_DATA_FIELDS = [BCct.HASH, BCct.SIGN, BCct.SENDER]
 
@@ -124,7 +195,9 @@ class _ComplexJsonEncoder(json.JSONEncoder):
       elif o == _neginf:
         text = 'null'
       else:
-        return repr(o).rstrip('0').rstrip('.') if '.' in repr(o) else repr(o)
+        # `float.__repr__` and not `repr` as numpy>=2 scalars (np.float64 is a float) repr as `np.float64(...)`
+        text = _repr(o)
+        return text.rstrip('0').rstrip('.') if '.' in text else text
 
       if not allow_nan:
         raise ValueError("Out of range float values are not JSON compliant: " + repr(o))
@@ -138,6 +211,79 @@ class _ComplexJsonEncoder(json.JSONEncoder):
     )
     return _iterencode(o, 0)
 
+
+class _NonCanonicalData(Exception):
+  """
+  Raised when some data cannot be prepared for the C json encoder so that the output is
+  identical with the one of `_ComplexJsonEncoder`
+  """
+  pass
+
+
+def _canonical_float(value):
+  """
+  Converts a float to a value that the C json encoder serializes exactly as `_ComplexJsonEncoder` does:
+  NaN/Inf become None and integral floats become int (`1.0` -> `1`).
+  """
+  if value != value or value in (np.inf, -np.inf):
+    return None
+  text = float.__repr__(value)
+  if '.' not in text:
+    return float(value)
+  canonical_text = text.rstrip('0').rstrip('.')
+  if canonical_text == text:
+    return float(value)
+  try:
+    int_value = int(canonical_text)
+  except ValueError:
+    # exponent notation with trailing zeros such as `1.2e+20`
+    raise _NonCanonicalData(text)
+  if str(int_value) != canonical_text:
+    # negative zero
+    raise _NonCanonicalData(text)
+  return int_value
+
+
+def _to_canonical_json_data(data, replace_nan=True, inplace=False):
+  """
+  Prepares (in a single pass) a dict/list for the C json encoder by normalizing the floats
+  and the numpy/datetime values the same way `_ComplexJsonEncoder` does. 
+  When `replace_nan` and `inplace` are both set the NaN/Inf values found in dicts 
+  are also replaced with None in the original data (as `replace_nan_inf` does).
+  
+  Raises `_NonCanonicalData` if the C encoder output would differ from the `_ComplexJsonEncoder` one.
+  """
+  mutate = replace_nan and inplace
+  
+  def _normalize(value):
+    if isinstance(value, str) or value is None or isinstance(value, (bool, int)):
+      return value
+    if isinstance(value, float):
+      return _canonical_float(value)
+    if isinstance(value, dict):
+      result = {}
+      for k, v in value.items():
+        if not (isinstance(k, str) or k is None or isinstance(k, (bool, int))):
+          raise _NonCanonicalData(repr(k))
+        new_v = _normalize(v)
+        if mutate and new_v is None and isinstance(v, float):
+          value[k] = None
+        result[k] = new_v
+      return result
+    if isinstance(value, (list, tuple)):
+      return [_normalize(v) for v in value]
+    if isinstance(value, np.integer):
+      return int(value)
+    if isinstance(value, np.floating):
+      return _canonical_float(float(value))
+    if isinstance(value, np.ndarray):
+      return _normalize(value.tolist())
+    if isinstance(value, datetime.datetime):
+      return value.strftime("%Y-%m-%d %H:%M:%S")
+    raise _NonCanonicalData(type(value).__name__)
+  
+  return _normalize(data)
+
 ## RIPEMD160
 
 # Message schedule indexes for the left path.
@@ -227,8 +373,8 @@ def compress(h0, h1, h2, h3, h4, block):
     return h1 + cl + dr, h2 + dl + er, h3 + el + ar, h4 + al + br, h0 + bl + cr
 
 
-def ripemd160(data):
-    """Compute the RIPEMD-160 hash of data."""
+def ripemd160_python(data):
+    """Compute the RIPEMD-160 hash of data (pure Python implementation)."""
     # Initialize state.
     state = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476, 0xc3d2e1f0)
     # Process full 64-byte blocks in the input.
@@ -242,6 +388,39 @@ def ripemd160(data):
         state = compress(*state, fin[64*b:64*(b+1)])
     # Produce output.
     return b"".join((h & 0xffffffff).to_bytes(4, 'little') for h in state)
+
+
+def ripemd160_hashlib(data):
+    """Compute the RIPEMD-160 hash of data using the OpenSSL backend of hashlib."""
+    return hashlib.new('ripemd160', data).digest()
+
+
+# known answer used to validate a backend before selecting it
+RIPEMD160_TEST_VECTOR = (b'abc', '8eb208f7e05d987a9b044a8e98c6b087f15a0bfc')
+
+
+def _select_ripemd160_backend():
+    """
+    Returns the name and the function of the fastest available RIPEMD-160 implementation.
+    `hashlib` depends on the OpenSSL build (OpenSSL 3 only provides it via the legacy provider)
+    so the pure Python implementation is used as fallback.
+    """
+    test_data, test_hexdigest = RIPEMD160_TEST_VECTOR
+    try:
+      if ripemd160_hashlib(test_data).hex() == test_hexdigest:
+        return 'hashlib', ripemd160_hashlib
+    except Exception:
+      pass
+    return 'python', ripemd160_python
+
+
+RIPEMD160_BACKEND, ripemd160 = _select_ripemd160_backend()
+
+
+@lru_cache(maxsize=4096)
+def _hash160(data : bytes):
+  """RIPEMD-160(SHA-256(data)) - cached as the same keys/addresses are hashed over and over."""
+  return ripemd160(sha256(data).digest())
   
 # END ## RIPEMD160  
 
@@ -264,12 +443,16 @@ class BaseBlockEngine:
     
   ensure_ascii_payloads: bool
     flag that controls if the payloads are encoded as ascii or not. Default `False` for JS compatibility.
+    
+  verify_cache_size: int
+    if > 0 the results of the signature verifications are cached by (sender, hash, signature) so that
+    duplicate or retransmitted messages are not verified again. Default `0` (no cache)
   
   """
   _lock: Lock = Lock()
   __instances = {}
   
-  def __new__(cls, name, config, log, ensure_ascii_payloads=False, verbosity=1):
+  def __new__(cls, name, config, log, ensure_ascii_payloads=False, verbosity=1, verify_cache_size=0):
     with cls._lock:
       if name not in cls.__instances:
         instance = super(BaseBlockEngine, cls).__new__(cls)
@@ -277,6 +460,7 @@ class BaseBlockEngine:
           name=name, log=log, config=config, 
           ensure_ascii_payloads=ensure_ascii_payloads,
           verbosity=verbosity,
+          verify_cache_size=verify_cache_size,
         )
         cls.__instances[name] = instance
       else:
@@ -290,6 +474,7 @@ class BaseBlockEngine:
       log=None, 
       ensure_ascii_payloads=False,
       verbosity=1,
+      verify_cache_size=0,
     ):
 
     self.__name = name
@@ -302,6 +487,7 @@ class BaseBlockEngine:
     self.__password = config.get(BCct.K_PASSWORD)    
     self.__config = config
     self.__ensure_ascii_payloads = ensure_ascii_payloads
+    self.__verify_cache = _LRUCache(maxsize=verify_cache_size) if verify_cache_size else None
     
     pem_name = config.get(BCct.K_PEM_FILE, '_pk.pem')
     pem_folder = config.get(BCct.K_PEM_LOCATION, 'data')
@@ -394,8 +580,7 @@ class BaseBlockEngine:
       hash_obj = sha256(data)
       result = hash_obj.digest(), hash_obj.hexdigest()
     elif method == 'HASH160':
-      hb_sha256 = sha256(data).digest()
-      hb_h160 = ripemd160(hb_sha256)
+      hb_h160 = _hash160(bytes(data))
       result = hb_h160, binascii.hexlify(hb_h160).decode()
     return result  
   
@@ -639,6 +824,21 @@ class BaseBlockEngine:
   
   
   def _dict_to_json(self, dct_data, replace_nan=True, inplace=True):
+    # fast path: normalize the data in one pass and use the C json encoder
+    # the output is identical with the one of `_ComplexJsonEncoder` (see tests/test_bc_json.py)
+    try:
+      dct_canonical_data = _to_canonical_json_data(dct_data, replace_nan=replace_nan, inplace=inplace)
+      str_data = json.dumps(
+        dct_canonical_data,
+        sort_keys=True,
+        separators=(',',':'),
+        ensure_ascii=self.__ensure_ascii_payloads,
+      )
+      return str_data
+    except _NonCanonicalData:
+      pass
+    
+    # slow path for the data that the C encoder cannot reproduce
     if replace_nan:
       dct_safe_data = replace_nan_inf(dct_data, inplace=inplace)
     else:
@@ -973,9 +1173,9 @@ class BaseBlockEngine:
         assert sender_address is not None, 'Sender address is NULL'
         assert signature is not None, 'Signature is NULL'
         
-        bsignature = self._text_to_binary(signature)
-        pk = self._address_to_pk(sender_address)
-        verify_msg = self._verify(public_key=pk, signature=bsignature, data=bdata)
+        verify_msg = self.__verify_signature(
+          sender_address=sender_address, signature=signature, bdata=bdata, hexdigest=hexdigest,
+        )
       except Exception as exc:
         verify_msg.message = str(exc)
         verify_msg.valid = False
@@ -1003,6 +1203,70 @@ class BaseBlockEngine:
     return result
   
   
+  def __verify_signature(self, sender_address: str, signature: str, bdata: bytes, hexdigest: str):
+    """
+    Verifies the signature of the data using the sender public key. 
+    If the verification cache is enabled the result is cached by (sender, hash, signature).
+    """
+    cache_key = (sender_address, hexdigest, signature)
+    if self.__verify_cache is not None:
+      cached = self.__verify_cache.get(cache_key)
+      if cached is not None:
+        verify_msg = VerifyMessage()
+        verify_msg.valid, verify_msg.message = cached
+        return verify_msg
+    #endif check cache
+    
+    bsignature = self._text_to_binary(signature)
+    pk = self._address_to_pk(sender_address)
+    verify_msg = self._verify(public_key=pk, signature=bsignature, data=bdata)
+    
+    if self.__verify_cache is not None:
+      self.__verify_cache.put(cache_key, (verify_msg.valid, verify_msg.message))
+    return verify_msg
+  
+  
+  def verify_many(self, lst_dct_data: list, max_workers: int = None, **kwargs) -> list:
+    """
+    Verifies the signatures of a batch of messages. 
+    The decoded public keys (and the verification results, if the cache is enabled) are 
+    reused between the messages of the same sender.
+
+    Parameters
+    ----------
+    lst_dct_data : list[dict]
+      the messages to be verified.
+      
+    max_workers : int, optional
+      if > 1 the verifications are spread on a pool of `max_workers` threads. Default `None` (sequential)
+      
+    **kwargs : 
+      the other parameters of `verify`, applied to all the messages
+
+    Returns
+    -------
+    list[bool / VerifyMessage]
+      the results of `verify` in the same order as `lst_dct_data`
+
+    """
+    if max_workers is None or max_workers <= 1 or len(lst_dct_data) <= 1:
+      return [self.verify(dct_data, **kwargs) for dct_data in lst_dct_data]
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      results = list(executor.map(lambda dct_data: self.verify(dct_data, **kwargs), lst_dct_data))
+    return results
+  
+  
+  def get_verify_cache_stats(self):
+    """
+    Returns the statistics (size, maxsize, hits, misses) of the signature verification cache 
+    or `None` if the cache is disabled.
+    """
+    if self.__verify_cache is None:
+      return None
+    return self.__verify_cache.stats()
+  
+  
   def is_allowed(self, sender_address: str):
     to_search_address = self._remove_prefix(sender_address)
     is_allowed = to_search_address in self.allowed_list or to_search_address == self._remove_prefix(self.address)
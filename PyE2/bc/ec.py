@@ -10,12 +10,20 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
-from .base import BaseBlockEngine, VerifyMessage, BCct
+from .base import BaseBlockEngine, VerifyMessage, BCct, _LRUCache
 
 
 
 class BaseBCEllipticCurveEngine(BaseBlockEngine):
   MAX_ADDRESS_VALUE = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+  # maximum number of peers for which the decoded public key and the derived shared keys are cached
+  PEER_KEYS_CACHE_SIZE = 1024
+  
+  def _init(self):
+    # the callback threads of a session share the same engine so the caches must be thread-safe
+    self.__pk_cache = _LRUCache(maxsize=self.PEER_KEYS_CACHE_SIZE)
+    self.__shared_keys_cache = _LRUCache(maxsize=self.PEER_KEYS_CACHE_SIZE)
+    return super(BaseBCEllipticCurveEngine, self)._init()
   
   def _get_pk(self, private_key : ec.EllipticCurvePrivateKey) -> ec.EllipticCurvePublicKey:
     """
@@ -226,11 +234,14 @@ class BaseBCEllipticCurveEngine(BaseBlockEngine):
 
     """
     simple_address = self._remove_prefix(address)
-    bpublic_key = self._text_to_binary(simple_address)
-    public_key = ec.EllipticCurvePublicKey.from_encoded_point(
-      curve=ec.SECP256K1(), 
-      data=bpublic_key
-    )
+    public_key = self.__pk_cache.get(simple_address)
+    if public_key is None:
+      bpublic_key = self._text_to_binary(simple_address)
+      public_key = ec.EllipticCurvePublicKey.from_encoded_point(
+        curve=ec.SECP256K1(), 
+        data=bpublic_key
+      )
+      self.__pk_cache.put(simple_address, public_key)
     return public_key
 
   def __derive_shared_key(self, peer_public_key : str, info : str = BCct.DEFAULT_INFO, debug : bool = False):
@@ -265,6 +276,66 @@ class BaseBCEllipticCurveEngine(BaseBlockEngine):
     if debug:
       print('derived-shared_key: ', base64.b64encode(derived_key))
     return derived_key
+  
+  def __get_shared_key(self, peer_address : str, info : str = BCct.DEFAULT_INFO, debug : bool = False):
+    """
+    Returns the shared key for a given peer, deriving it only if it is not already cached.
+
+    Parameters
+    ----------
+    peer_address : str
+        The peer's address.
+    
+    info : str
+        The HKDF info used for the derivation.
+    
+    Returns
+    -------
+    bytes
+        The derived shared key.
+    """
+    key = (self._remove_prefix(peer_address), info)
+    shared_key = None if debug else self.__shared_keys_cache.get(key)
+    if shared_key is None:
+      peer_pk = self._address_to_pk(peer_address)
+      shared_key = self.__derive_shared_key(peer_pk, info=info, debug=debug)
+      self.__shared_keys_cache.put(key, shared_key)
+    return shared_key
+  
+  def invalidate_peer_keys(self, address : str = None):
+    """
+    Removes the cached public key and shared keys of a given peer or of all peers.
+
+    Parameters
+    ----------
+    address : str, optional
+        The peer's address. If None, all the cached keys are removed. Default `None`
+
+    Returns
+    -------
+    int
+        The number of removed shared keys.
+    """
+    if address is None:
+      self.__pk_cache.invalidate()
+      return self.__shared_keys_cache.invalidate()
+    simple_address = self._remove_prefix(address)
+    self.__pk_cache.invalidate(lambda k: k == simple_address)
+    return self.__shared_keys_cache.invalidate(lambda k: k[0] == simple_address)
+  
+  def get_peer_keys_cache_stats(self):
+    """
+    Returns the statistics (size, maxsize, hits, misses) of the public keys and shared keys caches.
+
+    Returns
+    -------
+    dict
+        dict with the keys `public_keys` and `shared_keys`.
+    """
+    return {
+      'public_keys': self.__pk_cache.stats(),
+      'shared_keys': self.__shared_keys_cache.stats(),
+    }
 
   def encrypt(self, plaintext: str, receiver_address: str, info: str = BCct.DEFAULT_INFO, debug: bool = False):
     """
@@ -284,8 +355,7 @@ class BaseBCEllipticCurveEngine(BaseBlockEngine):
     str
         The base64 encoded nonce and ciphertext.
     """
-    receiver_pk = self._address_to_pk(receiver_address)
-    shared_key = self.__derive_shared_key(receiver_pk, info=info, debug=debug)
+    shared_key = self.__get_shared_key(receiver_address, info=info, debug=debug)
     aesgcm = AESGCM(shared_key)
     nonce = os.urandom(12)  # Generate a unique nonce for each encryption
     ciphertext = aesgcm.encrypt(nonce, plaintext.encode(), None)
@@ -311,11 +381,10 @@ class BaseBCEllipticCurveEngine(BaseBlockEngine):
 
     """
     try:
-      sender_pk = self._address_to_pk(sender_address)
       encrypted_data = base64.b64decode(encrypted_data_b64)  # Decode from base64
       nonce = encrypted_data[:12]  # Extract the nonce
       ciphertext = encrypted_data[12:]  # The rest is the ciphertext
-      shared_key = self.__derive_shared_key(sender_pk, info=info, debug=debug)
+      shared_key = self.__get_shared_key(sender_address, info=info, debug=debug)
       aesgcm = AESGCM(shared_key)
       plaintext = aesgcm.decrypt(nonce, ciphertext, None)
       result = plaintext.decode()
@@ -1,12 +1,23 @@
 # PIKA
 
+import hashlib
+import ssl
 import uuid
-from time import sleep
+from collections import OrderedDict, deque
+from threading import Condition, Event, Thread
 
 import pika
 
+from ..const import COLORS, COMMS, PAYLOAD_CT
 
-from ..const import COLORS, COMMS, BASE_CT, PAYLOAD_CT
+# the topic exchange used by the RabbitMQ MQTT plugin, where the MQTT topics are routing keys
+MQTT_TOPIC_EXCHANGE = 'amq.topic'
+# MQTT topic separator and wildcards -> AMQP routing key ones ('.' in a topic is mapped to '/' by the plugin)
+_TOPIC_TO_ROUTING_KEY = str.maketrans({'/': '.', '.': '/', '+': '*'})
+
+
+def topic_to_routing_key(topic):
+  return topic.translate(_TOPIC_TO_ROUTING_KEY)
 
 
 class AMQPWrapper(object):
@@ -19,16 +30,69 @@ class AMQPWrapper(object):
     recv_channel_name=None,
     comm_type=None,
     verbosity=1,
+    connection_name='AmqpWrapper',
+    consumer_group=None,
+    recv_nodes=None,
+    prefetch_count=100,
+    ack_batch_size=50,
+    ack_interval=0.05,
+    publisher_confirms=True,
+    connect_timeout=10,
     **kwargs
   ):
+    """
+    Parameters
+    ----------
+    recv_buff : deque-like, optional
+        The buffer where the received messages are appended. If its `append` returns False (e.g. a full
+        `MessageQueue`), the message is not acknowledged and is requeued by the broker.
+    send_channel_name : str, optional
+        The channel the messages are sent on.
+    recv_channel_name : str, optional
+        The channel this client consumes from.
+        The channels that define an `EXCHANGE` use it (with the `ROUTING_KEY` of the channel or of the config).
+        The others are MQTT channels defined by a `TOPIC`, that are mapped on the `amq.topic` exchange, so the
+        messages are exchanged with the MQTT clients of a RabbitMQ broker with the MQTT plugin.
+    consumer_group : str, optional
+        If set, the receive queue is named after the group instead of being unique to this client, so all the
+        clients of the group are competing consumers of the same queue and each message is delivered to only
+        one of them. The shared queue is not deleted on release.
+        The members of a group should use the same `recv_nodes`: the queue bound only for some nodes is named
+        after them, so the members with other nodes consume from another queue. Defaults to None
+    recv_nodes : list[str], optional
+        If set and the receive channel defines a `NODE_TOPIC`, the queue is bound only for these nodes.
+        Defaults to None
+    prefetch_count : int, optional
+        The maximum number of unacknowledged messages the broker pushes to this consumer. Defaults to 100
+    ack_batch_size : int, optional
+        The received messages are acknowledged together (`multiple=True`) every `ack_batch_size` messages
+        or every `ack_interval` seconds. Should be lower than `prefetch_count`. Defaults to 50
+    ack_interval : float, optional
+        See `ack_batch_size`. Defaults to 0.05
+    publisher_confirms : bool, optional
+        If True, the broker confirms the published messages asynchronously (usually several at once). The messages
+        not confirmed when the connection is lost or rejected by the broker are published again. Defaults to True
+    connect_timeout : float, optional
+        The maximum time, in seconds, to wait for the connection and the subscription. Defaults to 10
+    """
+    self.log = log
     self._config = config
     self._recv_buff = recv_buff
     self._send_to = None
     self._comm_type = comm_type
     self.__verbosity = verbosity
+    self._connection_name = connection_name
     self.send_channel_name = send_channel_name
     self.recv_channel_name = recv_channel_name
-    self._disconnected_log = []
+    self._disconnected_log = deque(maxlen=10)
+    self._consumer_group = consumer_group
+    self._recv_nodes = list(recv_nodes) if recv_nodes is not None else None
+    self._prefetch_count = prefetch_count
+    self._ack_batch_size = max(min(ack_batch_size, prefetch_count), 1) if prefetch_count else max(ack_batch_size, 1)
+    self._ack_interval = ack_interval
+    self._publisher_confirms = publisher_confirms
+    self._connect_timeout = connect_timeout
+    self.DEBUG = False
 
     if self.recv_channel_name is not None:
       assert self._recv_buff is not None
@@ -38,8 +102,24 @@ class AMQPWrapper(object):
 
     self._connection = None
     self._channel = None
-
-    super(AMQPWrapper, self).__init__(log=log, **kwargs)
+    self._io_thread = None
+    self.connected = False
+    self._channel_ready = Event()
+    self._subscribed = Event()
+    self._consumer_tag = None
+    self._closing = False
+
+    # consumer side, only used from the connection thread
+    self._last_delivery_tag = None
+    self._nr_unacked = 0
+
+    # publisher side: messages waiting to be published, and published but not confirmed yet
+    self._publish_queue = deque()
+    self._publish_cond = Condition()
+    self._drain_scheduled = False
+    self._unconfirmed = OrderedDict()
+    self._publish_seq = 0
+    self.__nr_nacked = 0
     return
 
   def P(self, s, color=None, verbosity=1, **kwargs):
@@ -47,9 +127,15 @@ class AMQPWrapper(object):
       return
     if color is None or (isinstance(color, str) and color[0] not in ['e', 'r']):
       color = COLORS.COMM
-    super().P(s, prefix=False, color=color, **kwargs)
+    comtype = self._comm_type[:7] if self._comm_type is not None else 'CUSTOM'
+    self.log.P("[AMQWRP][{}] {}".format(comtype, s), color=color, **kwargs)
     return
 
+  def D(self, s, t=False):
+    if self.DEBUG:
+      return self.log.P("[D] {}".format(s), show_time=t, color='yellow')
+    return -1
+
   @property
   def send_channel_name(self):
     return self._send_channel_name
@@ -73,7 +159,7 @@ class AMQPWrapper(object):
 
   @property
   def cfg_broker(self):
-    return self._config[COMMS.BROKER]
+    return self._config.get(COMMS.BROKER, self._config.get(COMMS.HOST))
 
   @property
   def cfg_user(self):
@@ -85,7 +171,7 @@ class AMQPWrapper(object):
 
   @property
   def cfg_vhost(self):
-    return self._config[COMMS.VHOST]
+    return self._config.get(COMMS.VHOST) or '/'
 
   @property
   def cfg_port(self):
@@ -99,19 +185,64 @@ class AMQPWrapper(object):
   def cfg_node_id(self):
     return self._config.get(COMMS.EE_ID, self._config.get(COMMS.SB_ID, None))
 
+  @property
+  def cfg_secured(self):
+    return self._config.get(COMMS.SECURED, 0)
+
+  @property
+  def is_secured(self):
+    val = self.cfg_secured
+    if isinstance(val, str):
+      val = val.upper() in ["1", "TRUE", "YES"]
+    return val
+
+  @property
+  def nr_nacked_messages(self):
+    """
+    The number of published messages rejected by the broker (and published again).
+    """
+    return self.__nr_nacked
+
+  @property
+  def send_queue_depth(self):
+    """
+    The number of outgoing messages waiting to be published or confirmed.
+    """
+    return len(self._publish_queue) + len(self._unconfirmed)
+
+  def __get_channel_def(self, channel_name, send_to=None):
+    cfg = self._config[channel_name].copy()
+    if COMMS.EXCHANGE in cfg:
+      exchange = cfg[COMMS.EXCHANGE]
+      routing_keys = [cfg.get(COMMS.ROUTING_KEY, self.cfg_routing_key)]
+    else:
+      exchange = MQTT_TOPIC_EXCHANGE
+      cfg[COMMS.EXCHANGE_TYPE] = 'topic'
+      node_topic = cfg.get(COMMS.NODE_TOPIC)
+      if send_to is None and self._recv_nodes is not None and node_topic is not None:
+        routing_keys = [topic_to_routing_key(node_topic).format(topic_to_routing_key(node)) for node in self._recv_nodes]
+      else:
+        routing_keys = [topic_to_routing_key(cfg[COMMS.TOPIC])]
+    # endif exchange or topic
+
+    if send_to is not None:
+      exchange = exchange.format(send_to) if "{}" in exchange else exchange
+      routing_keys = [
+        rk.format(topic_to_routing_key(send_to)) if "{}" in rk else rk
+        for rk in routing_keys
+      ]
+    cfg[COMMS.EXCHANGE] = exchange
+    cfg[COMMS.ROUTING_KEY] = routing_keys
+    return cfg
+
   @property
   def send_channel_def(self):
     if self.send_channel_name is None:
       return
 
-    cfg = self._config[self.send_channel_name].copy()
-    queue = cfg.get(COMMS.QUEUE, cfg[COMMS.EXCHANGE])
-    if self._send_to is not None and "{}" in queue:
-      queue = queue.format(self._send_to)
-
-    assert "{}" not in queue
-
-    cfg[COMMS.QUEUE] = queue
+    cfg = self.__get_channel_def(self.send_channel_name, send_to=self._send_to)
+    cfg[COMMS.ROUTING_KEY] = cfg[COMMS.ROUTING_KEY][0]
+    assert "{}" not in cfg[COMMS.EXCHANGE] and "{}" not in cfg[COMMS.ROUTING_KEY]
     return cfg
 
   @property
@@ -119,13 +250,28 @@ class AMQPWrapper(object):
     if self.recv_channel_name is None:
       return
 
-    cfg = self._config[self.recv_channel_name].copy()
-    queue = cfg.get(COMMS.QUEUE, cfg[COMMS.EXCHANGE])
+    cfg = self.__get_channel_def(self.recv_channel_name)
+    default_queue = topic_to_routing_key(cfg[COMMS.TOPIC]) if COMMS.TOPIC in cfg else cfg[COMMS.ROUTING_KEY][0]
+    queue = cfg.get(COMMS.QUEUE, default_queue or cfg[COMMS.EXCHANGE])
+    _queue_device_specific = cfg.pop(COMMS.QUEUE_DEVICE_SPECIFIC, self._consumer_group is None)
+    if _queue_device_specific and self.cfg_node_id is not None:
+      queue += '/{}'.format(self.cfg_node_id)
+    if self._consumer_group is not None:
+      # the same queue for all the consumers of the group, kept when they disconnect
+      queue += '/{}'.format(self._consumer_group)
+      if self._recv_nodes is not None and COMMS.NODE_TOPIC in cfg:
+        # the bindings of a durable queue outlive its consumers, so a queue is bound only to one set of nodes:
+        # otherwise the members with other `recv_nodes` would widen it for all the group
+        nodes_hash = hashlib.sha1('\n'.join(sorted(set(cfg[COMMS.ROUTING_KEY]))).encode('utf-8')).hexdigest()[:8]
+        queue += '/{}'.format(nodes_hash)
+      cfg.setdefault(COMMS.QUEUE_DURABLE, True)
+      cfg[COMMS.QUEUE_EXCLUSIVE] = False
+    else:
+      # a private queue, deleted by the broker when this client disconnects
+      queue += '/{}/{}'.format(self._connection_name, str(uuid.uuid4())[:8])
+      cfg.setdefault(COMMS.QUEUE_DURABLE, False)
+      cfg.setdefault(COMMS.QUEUE_EXCLUSIVE, True)
     cfg[COMMS.QUEUE] = queue
-    _queue_device_specific = cfg.pop(COMMS.QUEUE_DEVICE_SPECIFIC, True)
-    if _queue_device_specific:
-      cfg[COMMS.QUEUE] += '/{}'.format(self.cfg_node_id)
-    cfg[COMMS.QUEUE] += '/{}'.format(str(uuid.uuid4())[:8])
     return cfg
 
   @property
@@ -152,187 +298,423 @@ class AMQPWrapper(object):
   def send_exchange(self):
     return self._send_objects['exchange']
 
-  def server_connect(self, max_retries=5):
-    url = 'amqp://{}:{}@{}:{}/{}'.format(self.cfg_user, self.cfg_pass, self.cfg_broker, self.cfg_port, self.cfg_vhost)
-
-    nr_retry = 1
-    has_connection = False
-    exception = None
+  # Connection thread
+  if True:
+    def __get_connection_parameters(self):
+      ssl_options = None
+      if self.is_secured:
+        ssl_options = pika.SSLOptions(ssl.create_default_context(), server_hostname=self.cfg_broker)
+      return pika.ConnectionParameters(
+        host=self.cfg_broker,
+        port=self.cfg_port,
+        virtual_host=self.cfg_vhost,
+        credentials=pika.PlainCredentials(self.cfg_user, self.cfg_pass),
+        ssl_options=ssl_options,
+        client_properties={'connection_name': self._connection_name},
+      )
 
-    while nr_retry <= max_retries:
+    def __call_threadsafe(self, callback):
+      connection = self._connection
+      if connection is None:
+        return False
       try:
-        self._connection = pika.BlockingConnection(parameters=pika.URLParameters(url))
-        sleep(1)
-        self._channel = self._connection.channel()
-        has_connection = True
-      except Exception as e:
-        exception = e
-      # end try-except
+        connection.ioloop.add_callback_threadsafe(callback)
+      except Exception:
+        return False
+      return True
 
-      if has_connection:
-        break
+    def __on_connection_open(self, connection):
+      connection.channel(on_open_callback=self.__on_channel_open)
+      return
 
-      nr_retry += 1
-    # endwhile
+    def __on_connection_open_error(self, connection, error):
+      self._disconnected_log.append(str(error))
+      self._channel_ready.set()
+      connection.ioloop.stop()
+      return
 
-    if has_connection:
-      msg = 'AMQP (Pika) SERVER conn ok: {}{}'.format(self.cfg_broker, self.cfg_port)
-      msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_NORMAL
-    else:
-      msg = 'AMQP (Pika) SERVER connection could not be initialized after {} retries (reason:{})'.format(
-        max_retries, exception
-      )
-      msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_EXCEPTION
-    # endif
-
-    dct_ret = {
-      'has_connection': has_connection,
-      'msg': msg,
-      'msg_type': msg_type
-    }
-
-    return dct_ret
-
-  def establish_one_way_connection(self, channel_name, max_retries=5):
-    cfg = None
-    if channel_name.lower() == 'send':
-      cfg = self.send_channel_def
-    elif channel_name.lower() == 'recv':
-      cfg = self.recv_channel_def
-    # endif
+    def __on_connection_closed(self, connection, reason):
+      was_connected = self.connected
+      self.connected = False
+      self._channel = None
+      self._consumer_tag = None
+      # the delivery tags are scoped to the channel, the broker requeues the messages not acknowledged
+      self._nr_unacked = 0
+      self._last_delivery_tag = None
+      if not self._closing:
+        # allows the session to reconnect
+        self._connection = None
+      self._channel_ready.set()
+      if was_connected and not self._closing:
+        self._disconnected_log.append(str(reason))
+        self.P("Unexpected disconnect: {}".format(reason), color='r', verbosity=1)
+      # the messages not confirmed are published again after reconnecting
+      with self._publish_cond:
+        self._publish_queue.extendleft(reversed(list(self._unconfirmed.values())))
+        self._unconfirmed.clear()
+        self._drain_scheduled = False
+        self._publish_cond.notify_all()
+      connection.ioloop.stop()
+      return
 
-    if cfg is None:
+    def __on_channel_open(self, channel):
+      self._channel = channel
+      self._publish_seq = 0
+      # the delivery tags of a new channel start again from 1
+      self._nr_unacked = 0
+      self._last_delivery_tag = None
+      channel.add_on_close_callback(self.__on_channel_closed)
+      if self._publisher_confirms:
+        channel.confirm_delivery(ack_nack_callback=self.__on_confirm, callback=lambda frame: self.__on_channel_ready())
+      else:
+        self.__on_channel_ready()
       return
 
-    exchange = cfg[COMMS.EXCHANGE]
-    queue = cfg[COMMS.QUEUE]
-    exchange_type = cfg.get(COMMS.EXCHANGE_TYPE, 'fanout')
-    queue_durable = cfg.get(COMMS.QUEUE_DURABLE, True)
-    queue_exclusive = cfg.get(COMMS.QUEUE_EXCLUSIVE, False)
+    def __on_channel_ready(self):
+      self.connected = True
+      self._channel_ready.set()
+      self._connection.ioloop.call_later(self._ack_interval, self.__on_ack_timer)
+      self.__drain_publish_queue()
+      return
 
-    nr_retry = 1
-    has_connection = False
-    exception = None
+    def __on_channel_closed(self, channel, reason):
+      self._channel = None
+      if not self._closing:
+        self.P("Channel closed: {}".format(reason), color='r', verbosity=1)
+      connection = self._connection
+      if connection is not None and not (connection.is_closing or connection.is_closed):
+        connection.close()
+      return
 
-    while nr_retry <= max_retries:
+    def __io_loop(self, connection):
       try:
-        self._channel.exchange_declare(
-          exchange=exchange,
-          exchange_type=exchange_type
-        )
-        self._channel.queue_declare(
+        connection.ioloop.start()
+      except Exception as e:
+        self.P("Connection loop stopped with exception: {}".format(e), color='r', verbosity=1)
+      self.connected = False
+      return
+
+  # Consumer
+  if True:
+    def __on_delivery(self, channel, method, properties, body):
+      msg = body.decode('utf-8')
+      if self._recv_buff.append(msg) is False:
+        # the receive buffer is full: the message goes back to the broker (or to another consumer of the group),
+        # after acknowledging the ones received before it, as a multiple ack would cover this one too
+        self.__flush_acks()
+        channel.basic_nack(delivery_tag=method.delivery_tag, multiple=False, requeue=True)
+        return
+      self._last_delivery_tag = method.delivery_tag
+      self._nr_unacked += 1
+      if self._nr_unacked >= self._ack_batch_size:
+        self.__flush_acks()
+      return
+
+    def __flush_acks(self):
+      if self._nr_unacked == 0 or self._channel is None:
+        return
+      # acknowledges all the messages received up to the last one
+      self._channel.basic_ack(delivery_tag=self._last_delivery_tag, multiple=True)
+      self._nr_unacked = 0
+      return
+
+    def __on_ack_timer(self):
+      if not self.connected:
+        return
+      self.__flush_acks()
+      self._connection.ioloop.call_later(self._ack_interval, self.__on_ack_timer)
+      return
+
+    def __start_consuming(self, cfg):
+      channel = self._channel
+      exchange = cfg[COMMS.EXCHANGE]
+      queue = cfg[COMMS.QUEUE]
+      routing_keys = list(cfg[COMMS.ROUTING_KEY])
+
+      def _on_consume_ok(frame):
+        self._recv_objects = {'queue': queue, 'exchange': exchange}
+        self._subscribed.set()
+        return
+
+      def _on_qos_ok(frame):
+        self._consumer_tag = channel.basic_consume(
           queue=queue,
-          durable=queue_durable,
-          exclusive=queue_exclusive
+          on_message_callback=self.__on_delivery,
+          auto_ack=False,
+          callback=_on_consume_ok,
         )
-        self._channel.queue_bind(
+        return
+
+      def _bind_next(frame=None):
+        if len(routing_keys) == 0:
+          channel.basic_qos(prefetch_count=self._prefetch_count or 0, callback=_on_qos_ok)
+        else:
+          channel.queue_bind(queue=queue, exchange=exchange, routing_key=routing_keys.pop(0), callback=_bind_next)
+        return
+
+      def _declare_queue(frame=None):
+        channel.queue_declare(
           queue=queue,
+          durable=cfg[COMMS.QUEUE_DURABLE],
+          exclusive=cfg[COMMS.QUEUE_EXCLUSIVE],
+          auto_delete=self._consumer_group is None,
+          callback=_bind_next,
+        )
+        return
+
+      if exchange.startswith('amq.'):
+        # predefined exchanges cannot be declared with other arguments than the broker's ones
+        _declare_queue()
+      else:
+        channel.exchange_declare(
           exchange=exchange,
-          routing_key=self.cfg_routing_key
+          exchange_type=cfg.get(COMMS.EXCHANGE_TYPE, 'fanout'),
+          callback=_declare_queue,
         )
+      return
 
-        has_connection = True
-      except Exception as e:
-        exception = e
-      # end try-except
+  # Publisher
+  if True:
+    def __on_confirm(self, frame):
+      method = frame.method
+      is_ack = isinstance(method, pika.spec.Basic.Ack)
+      if method.multiple:
+        tags = []
+        for tag in self._unconfirmed:
+          if tag > method.delivery_tag:
+            break
+          tags.append(tag)
+      else:
+        tags = [method.delivery_tag]
+
+      with self._publish_cond:
+        nacked = [self._unconfirmed.pop(tag) for tag in tags if tag in self._unconfirmed]
+        if not is_ack:
+          self.__nr_nacked += len(nacked)
+          self._publish_queue.extendleft(reversed(nacked))
+        self._publish_cond.notify_all()
+      # endwith
+      if not is_ack:
+        self.P("{} messages rejected by the broker, publishing them again".format(len(nacked)), color='r', verbosity=1)
+        self.__drain_publish_queue()
+      return
+
+    def __drain_publish_queue(self):
+      with self._publish_cond:
+        self._drain_scheduled = False
+        channel = self._channel
+        if channel is None or not self.connected:
+          return
+        properties = pika.BasicProperties(content_type='application/json')
+        while len(self._publish_queue) > 0:
+          exchange, routing_key, message = self._publish_queue.popleft()
+          try:
+            channel.basic_publish(exchange=exchange, routing_key=routing_key, body=message, properties=properties)
+          except Exception as e:
+            self._publish_queue.appendleft((exchange, routing_key, message))
+            self.P("Could not publish message: {}".format(e), color='r', verbosity=1)
+            break
+          if self._publisher_confirms:
+            self._publish_seq += 1
+            self._unconfirmed[self._publish_seq] = (exchange, routing_key, message)
+        # endwhile
+        self._publish_cond.notify_all()
+      # endwith
+      return
+
+  # API
+  if True:
+    def server_connect(self, max_retries=5):
+      nr_retry = 1
+      has_connection = False
+      exception = None
+
+      while nr_retry <= max_retries:
+        try:
+          self._closing = False
+          self._channel_ready.clear()
+          self._connection = pika.SelectConnection(
+            parameters=self.__get_connection_parameters(),
+            on_open_callback=self.__on_connection_open,
+            on_open_error_callback=self.__on_connection_open_error,
+            on_close_callback=self.__on_connection_closed,
+          )
+          self._io_thread = Thread(
+            target=self.__io_loop,
+            args=(self._connection,),
+            name=self._connection_name + '_' + (self._comm_type or 'CUSTOM')[:7] + '_amqp',
+            daemon=True,
+          )
+          self._io_thread.start()
+          self._channel_ready.wait(timeout=self._connect_timeout)
+          has_connection = self.connected
+          if not has_connection and len(self._disconnected_log) > 0:
+            exception = self._disconnected_log[-1]
+        except Exception as e:
+          exception = e
+        # end try-except
+
+        if has_connection:
+          break
+
+        self.__stop_connection()
+        nr_retry += 1
+      # endwhile
 
       if has_connection:
-        break
+        msg = 'AMQP (Pika) SERVER conn ok: {}:{}'.format(self.cfg_broker, self.cfg_port)
+        msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_NORMAL
+        self.P(msg)
+      else:
+        msg = 'AMQP (Pika) SERVER connection could not be initialized after {} retries (reason:{})'.format(
+          max_retries, exception
+        )
+        msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_EXCEPTION
+        self.P(msg, color='r', verbosity=1)
+      # endif
 
-      sleep(1)
-      nr_retry += 1
-    # endwhile
+      dct_ret = {
+        'has_connection': has_connection,
+        'msg': msg,
+        'msg_type': msg_type
+      }
 
-    if has_connection:
-      msg = "AMQP (Pika) '{}' connection successfully established on exchange '{}', queue '{}'".format(
-        channel_name.lower(), exchange, queue,
-      )
-      msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_NORMAL
-    else:
-      msg = "AMQP (Pika) '{}' connection on exchange '{}', queue '{}' could not be initialized after {} retries (reason:{})".format(
-        channel_name.lower(), exchange, queue, max_retries, exception
-      )
-      msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_EXCEPTION
-    # endif
-
-    dct_objects = {'queue': queue, 'exchange': exchange}
-    if channel_name.lower() == 'send':
-      self._send_objects = dct_objects
-    elif channel_name.lower() == 'recv':
-      self._recv_objects = dct_objects
-    # endif
-
-    dct_ret = {
-      'has_connection': has_connection,
-      'msg': msg,
-      'msg_type': msg_type
-    }
-
-    return dct_ret
-
-  def receive(self):
-    method_frame, header_frame, body = self._channel.basic_get(queue=self.recv_queue)
-    if method_frame:
-      msg = body.decode('utf-8')
-      self._channel.basic_ack(method_frame.delivery_tag)
-      self._recv_buff.append(msg)
-    # endif
-    return
+      return dct_ret
 
-  def send(self, message):
-    properties = pika.BasicProperties(content_type='application/json')
-    self._channel.basic_publish(
-      exchange=self.send_exchange,
-      routing_key=self.cfg_routing_key,
-      body=message,
-      properties=properties
-    )
+    def subscribe(self, max_retries=5):
+      """
+      Declare the receive queue, bind it and start consuming (push delivery).
+      """
+      if self.recv_channel_name is None:
+        return
 
-    ####
-    self.D("Sent message '{}'".format(message))
-    ####
+      cfg = self.recv_channel_def
+      self._subscribed.clear()
+      has_connection = self.connected and self.__call_threadsafe(lambda: self.__start_consuming(cfg))
+      if has_connection:
+        has_connection = self._subscribed.wait(timeout=self._connect_timeout)
 
-    return
+      if has_connection:
+        msg = "AMQP (Pika) consuming from queue '{}' bound to exchange '{}' ({})".format(
+          cfg[COMMS.QUEUE], cfg[COMMS.EXCHANGE], ', '.join(cfg[COMMS.ROUTING_KEY]))
+        msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_NORMAL
+        self.P(msg)
+      else:
+        msg = "AMQP (Pika) could not consume from queue '{}'".format(cfg[COMMS.QUEUE])
+        msg_type = PAYLOAD_CT.STATUS_TYPE.STATUS_EXCEPTION
+        self.P(msg, color='r', verbosity=1)
+      # endif
+
+      dct_ret = {
+        'has_connection': has_connection,
+        'msg': msg,
+        'msg_type': msg_type
+      }
+      return dct_ret
+
+    def receive(self):
+      # messages are pushed by the broker to the receive buffer
+      return
 
-  def release(self):
-    msgs = []
+    def send(self, message, send_to=None):
+      """
+      Queue a message to be published by the connection thread. Can be called from any thread.
+      The messages sent while disconnected are published after reconnecting.
+
+      Parameters
+      ----------
+      message : str
+          The message.
+      send_to : str, optional
+          The receiver used to format the send routing key. If None, `_send_to` is used.
+      """
+      if send_to is None:
+        send_to = self._send_to
+      cfg = self.__get_channel_def(self.send_channel_name, send_to=send_to)
+      self._send_objects = {'queue': None, 'exchange': cfg[COMMS.EXCHANGE]}
+      with self._publish_cond:
+        self._publish_queue.append((cfg[COMMS.EXCHANGE], cfg[COMMS.ROUTING_KEY][0], message))
+        schedule = not self._drain_scheduled
+        self._drain_scheduled = True
+      # endwith
+      if schedule and not self.__call_threadsafe(self.__drain_publish_queue):
+        with self._publish_cond:
+          self._drain_scheduled = False
+      self.D("Queued message '{}'".format(message))
+      return
 
-    if self.recv_queue is not None:
-      try:
-        self._channel.queue_unbind(
-          queue=self.recv_queue,
-          exchange=self.recv_exchange,
-          routing_key=self.cfg_routing_key,
-        )
+    def stop_send_thread(self, flush=True, timeout=5):
+      """
+      Wait for the queued messages to be published and confirmed.
+
+      Parameters
+      ----------
+      flush : bool, optional
+          If False, the queued messages are discarded. Defaults to True
+      timeout : float, optional
+          The maximum time, in seconds, to wait. Defaults to 5
+
+      Returns
+      -------
+      int
+          The number of messages left unsent or unconfirmed.
+      """
+      with self._publish_cond:
+        if not flush:
+          self._publish_queue.clear()
+        elif self.connected:
+          self._publish_cond.wait_for(lambda: self.send_queue_depth == 0 or not self.connected, timeout=timeout)
+        return self.send_queue_depth
+
+    def __stop_connection(self):
+      connection = self._connection
+      if connection is not None:
+        def _close():
+          if not (connection.is_closing or connection.is_closed):
+            connection.close()
+          else:
+            connection.ioloop.stop()
+          return
+        try:
+          connection.ioloop.add_callback_threadsafe(_close)
+        except Exception:
+          pass
+      if self._io_thread is not None:
+        self._io_thread.join(timeout=self._connect_timeout)
+      self._connection = None
+      self._channel = None
+      self._io_thread = None
+      self.connected = False
+      return
+
+    def release(self):
+      msgs = []
+      self._closing = True
 
-        self._channel.queue_delete(queue=self.recv_queue)
-        msgs.append("AMQP (Pika) deleted queue '{}'".format(self.recv_queue))
+      def _stop_consuming():
+        self.__flush_acks()
+        channel = self._channel
+        if channel is not None and self._consumer_tag is not None:
+          channel.basic_cancel(self._consumer_tag)
+        return
+
+      if self.recv_queue is not None and self.__call_threadsafe(_stop_consuming):
+        # private queues are exclusive and auto-deleted by the broker on disconnect, shared ones are kept
+        msgs.append("AMQP (Pika) stopped consuming from queue '{}'".format(self.recv_queue))
+      # endif
+
+      try:
+        self.__stop_connection()
+        msgs.append('AMQP (Pika) disconnected')
       except Exception as e:
-        msgs.append("AMQP (Pika) exception when deleting queue '{}'".format(self.recv_queue))
+        msgs.append('AMQP (Pika) exception when disconnecting: `{}`'.format(str(e)))
       # end try-except
-    # endif
 
-    try:
-      self._channel.cancel()
-      self._channel.close()
-      del self._channel
-      self._channel = None
-      msgs.append('AMQP (Pika) closed channel')
-    except Exception as e:
-      msgs.append('AMQP (Pika) exception when closing channel: `{}`'.format(str(e)))
-    # end try-except
-
-    try:
-      self._connection.close()
-      del self._connection
-      self._connection = None
-      msgs.append('AMQP (Pika) disconnected')
-    except Exception as e:
-      msgs.append('AMQP (Pika) exception when disconnecting: `{}`'.format(str(e)))
-    # end try-except
+      for msg in msgs:
+        self.P(msg)
 
-    dct_ret = {
-      'msgs': msgs
-    }
+      dct_ret = {
+        'msgs': msgs
+      }
 
-    return dct_ret
+      return dct_ret
@@ -1,6 +1,5 @@
 # PAHO
 # TODO: implement config validation and base config format
-# TODO: add queue for to_send messages
 
 # TODO: adding a lock for accessing self._mqttc should solve some of the bugs, but it introduces a new one
 # basically, when a user thread calls send, they should acquire the lock for the self._mqttc object
@@ -10,7 +9,7 @@
 import os
 import traceback
 from collections import deque
-from threading import Lock
+from threading import Condition, Lock, Thread
 from time import sleep
 
 import paho.mqtt.client as mqtt
@@ -36,10 +35,61 @@ class MQTTWrapper(object):
                debug_errors=False,
                connection_name='MqttWrapper',
                verbosity=1,
+               send_queue_size=0,
+               send_queue_low_watermark=None,
+               send_queue_policy=COMMS.SEND_QUEUE_POLICY.BLOCK,
+               send_queue_block_timeout=10,
+               send_batch_size=64,
+               recv_nodes=None,
+               recv_nodes_channels=None,
+               consumer_group=None,
+               consumer_group_channels=None,
                **kwargs):
+    """
+    Parameters
+    ----------
+    recv_buff : deque-like or dict, optional
+        The buffer where the received messages are appended. When `recv_channel_name` is a list,
+        a dict {channel_name: buffer} used to demultiplex the messages by topic.
+    recv_channel_name : str or list[str], optional
+        The channel(s) this client subscribes to. A list allows a single connection to
+        receive the messages of multiple channels.
+    send_queue_size : int, optional
+        If greater than 0, `send` only queues the messages and a dedicated sender thread publishes them.
+        This is also the high watermark of the queue: when it is reached `send_queue_policy` is applied.
+        While the client is disconnected, with QoS > 0 the messages are handed off to paho that sends them
+        after reconnecting, while with QoS 0 they are kept in the queue until reconnecting.
+        If 0, `send` publishes synchronously. Defaults to 0
+    send_queue_low_watermark : int, optional
+        When the queue is full, blocked senders resume once the queue drains to this size.
+        Defaults to half of `send_queue_size`
+    send_queue_policy : str, optional
+        What `send` does when the queue is full: 'block' waits for the low watermark, 'drop' discards the
+        message (counted in `nr_dropped_sends`), 'error' raises `ValueError`. Defaults to 'block'
+    send_queue_block_timeout : float, optional
+        The maximum time, in seconds, `send` blocks with the 'block' policy before raising `ValueError`
+        (e.g. while the broker is down). If None, it waits until the queue drains. Defaults to 10
+    send_batch_size : int, optional
+        The maximum number of queued messages the sender thread takes out of the queue at once, so bursts of
+        commands are published back-to-back without contending with the senders for the queue. Defaults to 64
+    recv_nodes : list[str], optional
+        If set, the receive channels that define a `NODE_TOPIC` template are subscribed only for these nodes,
+        one topic per node, instead of their `TOPIC`, so the broker does not deliver the messages
+        of the other nodes. Defaults to None
+    recv_nodes_channels : list[str], optional
+        The receive channels `recv_nodes` applies to. If None, all of them. Defaults to None
+    consumer_group : str, optional
+        If set, the receive channels in `consumer_group_channels` use MQTT v5 shared subscriptions
+        (`$share/<consumer_group>/<topic>`): the broker delivers each message to only one of the
+        clients subscribed with the same group. The connection then uses MQTT v5. Defaults to None
+    consumer_group_channels : list[str], optional
+        The receive channels shared by the consumer group. If None, all of them. Defaults to None
+    """
     self.log = log
     self._config = config
     self._recv_buff = recv_buff
+    # topic -> recv buffer, used when multiple channels share this connection
+    self._dct_topic_recv_buff = {}
     self._mqttc = None
     self.debug_errors = debug_errors
     self._thread_name = None
@@ -52,6 +102,10 @@ class MQTTWrapper(object):
     self._comm_type = comm_type
     self.send_channel_name = send_channel_name
     self.recv_channel_name = recv_channel_name
+    self._recv_nodes = list(recv_nodes) if recv_nodes is not None else None
+    self._recv_nodes_channels = recv_nodes_channels
+    self._consumer_group = consumer_group
+    self._consumer_group_channels = consumer_group_channels
     self._disconnected_log = deque(maxlen=10)
     self._disconnected_counter = 0
     self._custom_on_message = on_message
@@ -59,10 +113,27 @@ class MQTTWrapper(object):
     self._connection_name = connection_name
     self.last_disconnect_log = ''
 
+    assert send_queue_policy in COMMS.SEND_QUEUE_POLICY.VALID, "Unknown send queue policy '{}'".format(send_queue_policy)
+    self._send_queue_size = send_queue_size or 0
+    if send_queue_low_watermark is None:
+      send_queue_low_watermark = self._send_queue_size // 2
+    self._send_queue_low_watermark = min(send_queue_low_watermark, max(self._send_queue_size - 1, 0))
+    self._send_queue_policy = send_queue_policy
+    self._send_queue_block_timeout = send_queue_block_timeout
+    self._send_batch_size = max(send_batch_size, 1)
+    self._send_queue = deque()
+    self._send_queue_cond = Condition()
+    self._send_thread = None
+    self._send_thread_stop = False
+    self.__nr_dropped_sends = 0
+
     self.DEBUG = False
 
     if self.recv_channel_name is not None and on_message is None:
       assert self._recv_buff is not None
+      if isinstance(self.recv_channel_name, list):
+        assert isinstance(self._recv_buff, dict), "A dict of buffers is required for multiple receive channels"
+        assert all(x in self._recv_buff for x in self.recv_channel_name), "Missing buffers for some receive channels"
 
     self.P(f"Initializing MQTTWrapper using Paho MQTT v{mqtt_version}")
     super(MQTTWrapper, self).__init__(**kwargs)
@@ -81,6 +152,20 @@ class MQTTWrapper(object):
   def nr_dropped_messages(self):
     return self.__nr_dropped_messages
 
+  @property
+  def nr_dropped_sends(self):
+    """
+    The number of outgoing messages dropped because the send queue was full.
+    """
+    return self.__nr_dropped_sends
+
+  @property
+  def send_queue_depth(self):
+    """
+    The number of outgoing messages waiting to be published.
+    """
+    return len(self._send_queue)
+
   def D(self, s, t=False):
     _r = -1
     if self.DEBUG:
@@ -161,13 +246,15 @@ class MQTTWrapper(object):
   def cfg_secured(self):
     return self._config.get(COMMS.SECURED, 0)  # TODO: make 1 later on
 
-  @property
-  def recv_channel_def(self):
-    if self.recv_channel_name is None:
-      return
+  def __get_channel_topics(self, channel_name):
+    node_topic = self._config[channel_name].get(COMMS.NODE_TOPIC)
+    per_node = self._recv_nodes is not None and (
+      self._recv_nodes_channels is None or channel_name in self._recv_nodes_channels
+    )
+    if per_node and node_topic is not None:
+      return [node_topic.format(node) for node in self._recv_nodes]
 
-    cfg = self._config[self.recv_channel_name].copy()
-    topic = cfg[COMMS.TOPIC]
+    topic = self._config[channel_name][COMMS.TOPIC]
     lst_topics = []
     if "{}" in topic:
       if self.cfg_node_id is not None:
@@ -176,6 +263,39 @@ class MQTTWrapper(object):
         lst_topics.append(topic.format(self.cfg_node_addr))
     else:
       lst_topics.append(topic)
+    return lst_topics
+
+  def __get_subscription_topics(self):
+    """
+    The topics to subscribe to, with the shared subscription prefix for the channels of the consumer group.
+    """
+    lst_channels = self.recv_channel_name if isinstance(self.recv_channel_name, list) else [self.recv_channel_name]
+    lst_topics = []
+    for channel_name in lst_channels:
+      is_shared = self._consumer_group is not None and (
+        self._consumer_group_channels is None or channel_name in self._consumer_group_channels
+      )
+      for topic in self.__get_channel_topics(channel_name):
+        if is_shared:
+          topic = "$share/{}/{}".format(self._consumer_group, topic)
+        lst_topics.append(topic)
+    # endfor
+    return lst_topics
+
+  @property
+  def recv_channel_def(self):
+    if self.recv_channel_name is None:
+      return
+
+    if isinstance(self.recv_channel_name, list):
+      cfg = {}
+      lst_topics = []
+      for channel_name in self.recv_channel_name:
+        lst_topics += self.__get_channel_topics(channel_name)
+    else:
+      cfg = self._config[self.recv_channel_name].copy()
+      cfg.pop(COMMS.NODE_TOPIC, None)
+      lst_topics = self.__get_channel_topics(self.recv_channel_name)
 
     if len(lst_topics) == 0:
       raise ValueError("ERROR! No topics to subscribe to")
@@ -183,21 +303,44 @@ class MQTTWrapper(object):
     cfg[COMMS.TOPIC] = lst_topics
     return cfg
 
-  @property
-  def send_channel_def(self):
+  def __get_recv_buff(self, topic):
+    if not isinstance(self._recv_buff, dict):
+      return self._recv_buff
+
+    recv_buff = self._dct_topic_recv_buff.get(topic)
+    if recv_buff is None:
+      # first message on this topic (the subscription may contain wildcards)
+      for channel_name in self.recv_channel_name:
+        for sub in self.__get_channel_topics(channel_name):
+          if topic == sub or mqtt.topic_matches_sub(sub, topic):
+            recv_buff = self._recv_buff[channel_name]
+            break
+        # endfor
+        if recv_buff is not None:
+          self._dct_topic_recv_buff[topic] = recv_buff
+          break
+      # endfor
+    # endif
+    return recv_buff
+
+  def __get_send_channel_def(self, send_to):
     if self.send_channel_name is None:
       return
 
     cfg = self._config[self.send_channel_name].copy()
     topic = cfg[COMMS.TOPIC]
-    if self._send_to is not None and "{}" in topic:
-      topic = topic.format(self._send_to)
+    if send_to is not None and "{}" in topic:
+      topic = topic.format(send_to)
 
     assert "{}" not in topic
 
     cfg[COMMS.TOPIC] = topic
     return cfg
 
+  @property
+  def send_channel_def(self):
+    return self.__get_send_channel_def(self._send_to)
+
   @property
   def connection(self):
     return self._mqttc
@@ -241,16 +384,21 @@ class MQTTWrapper(object):
 
   def __create_mqttc_object(self, comtype, client_uid):
     client_id = self._connection_name + '_' + comtype + '_' + client_uid
+    # shared subscriptions are part of MQTT v5, where the clean session flag is replaced by clean start
+    if self._consumer_group is not None:
+      session_kwargs = {'protocol': mqtt.MQTTv5}
+    else:
+      session_kwargs = {'clean_session': True}
     if mqtt_version.startswith('2'):
       mqttc = mqtt.Client(
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
         client_id=client_id,
-        clean_session=True,
+        **session_kwargs,
       )
     else:
       mqttc = mqtt.Client(
         client_id=client_id,
-        clean_session=True
+        **session_kwargs,
       )
 
     mqttc.username_pw_set(
@@ -337,7 +485,9 @@ class MQTTWrapper(object):
     else:
       try:
         msg = message.payload.decode('utf-8')
-        self._recv_buff.append(msg)
+        # a bounded buffer returns False when the message could not be queued
+        if self.__get_recv_buff(message.topic).append(msg) is False:
+          self.__nr_dropped_messages += 1
       except:
         # DEBUG TODO: enable here a debug show of the message.payload if
         # the number of dropped messages rises
@@ -456,6 +606,8 @@ class MQTTWrapper(object):
     has_connection = True
     exception = None
     lst_topics = self.recv_channel_def[COMMS.TOPIC]
+    if self._consumer_group is not None:
+      lst_topics = self.__get_subscription_topics()
     for topic in lst_topics:
       current_topic_connection = False
       while nr_retry <= max_retries:
@@ -498,26 +650,150 @@ class MQTTWrapper(object):
   def receive(self):
     return
 
-  def send(self, message):
+  def __publish(self, topic, message):
+    """
+    Returns
+    -------
+    tuple(int, bool)
+        The paho result code and whether paho accepted the message (sent it or stored it to be sent).
+    """
     mqttc = self._mqttc
     if mqttc is None:
-      return
+      return mqtt.MQTT_ERR_NO_CONN, False
 
     result = mqttc.publish(
-      topic=self.send_channel_def[COMMS.TOPIC],
+      topic=topic,
       payload=message,
       qos=self.cfg_qos
     )
+    # with QoS > 0 paho keeps the messages published while disconnected and sends them after reconnecting
+    accepted = result.rc == mqtt.MQTT_ERR_SUCCESS or (result.rc == mqtt.MQTT_ERR_NO_CONN and self.cfg_qos > 0)
 
     ####
     self.D("Sent message '{}'".format(message))
     ####
+    return result.rc, accepted
+
+  def __maybe_start_send_thread(self):
+    if self._send_thread is None:
+      with self._send_queue_cond:
+        if self._send_thread is None and not self._send_thread_stop:
+          self._send_thread = Thread(
+            target=self.__send_loop,
+            name=self._connection_name + '_send',
+            daemon=True
+          )
+          self._send_thread.start()
+        # endif
+      # endwith
+    return
+
+  def __enqueue(self, topic, message):
+    q = self._send_queue
+    with self._send_queue_cond:
+      if self._send_thread_stop:
+        raise ValueError('Message is not queued because the send queue is closed')
+      if len(q) >= self._send_queue_size:
+        if self._send_queue_policy == COMMS.SEND_QUEUE_POLICY.DROP:
+          self.__nr_dropped_sends += 1
+          return False
+        elif self._send_queue_policy == COMMS.SEND_QUEUE_POLICY.ERROR:
+          raise ValueError('Message is not queued because the send queue is full ({} messages)'.format(len(q)))
+        # block until the sender thread drains the queue to the low watermark
+        drained = self._send_queue_cond.wait_for(
+          lambda: len(q) <= self._send_queue_low_watermark or self._send_thread_stop,
+          timeout=self._send_queue_block_timeout
+        )
+        if not drained or self._send_thread_stop:
+          raise ValueError('Message is not queued because the send queue is full ({} messages)'.format(len(q)))
+      # endif queue full
+      q.append((topic, message))
+      self._send_queue_cond.notify_all()
+    return True
+
+  def __send_loop(self):
+    q = self._send_queue
+    while True:
+      with self._send_queue_cond:
+        self._send_queue_cond.wait_for(lambda: len(q) > 0 or self._send_thread_stop)
+        if self._send_thread_stop and (len(q) == 0 or not self.connected):
+          break
+        batch = [q.popleft() for _ in range(min(len(q), self._send_batch_size))]
+        if len(q) <= self._send_queue_low_watermark:
+          self._send_queue_cond.notify_all()
+      # endwith
+
+      nr_sent = 0
+      for topic, message in batch:
+        _, accepted = self.__publish(topic, message)
+        if not accepted:
+          break
+        nr_sent += 1
+      # endfor
+
+      if nr_sent < len(batch):
+        # rejected by paho (no client, QoS 0 while disconnected or paho queue full): keep the order and retry later
+        with self._send_queue_cond:
+          q.extendleft(reversed(batch[nr_sent:]))
+          if self._send_thread_stop:
+            break
+        sleep(0.1)
+      # endif
+    # endwhile
+    return
 
-    if result.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
-      raise ValueError('Message is not queued due to ERR_QUEUE_SIZE')
+  def send(self, message, send_to=None):
+    """
+    Publish a message on the send channel.
+
+    Parameters
+    ----------
+    message : str
+        The message.
+    send_to : str, optional
+        The receiver used to format the send topic. If None, `_send_to` is used.
+        Passing it explicitly makes `send` safe to call from multiple threads.
+    """
+    if send_to is None:
+      send_to = self._send_to
+    topic = self.__get_send_channel_def(send_to)[COMMS.TOPIC]
+
+    if self._send_queue_size <= 0:
+      rc, _ = self.__publish(topic, message)
+      if rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+        raise ValueError('Message is not queued due to ERR_QUEUE_SIZE')
+      return
 
+    # the topic is resolved now as `_send_to` can change before the message is published
+    self.__maybe_start_send_thread()
+    self.__enqueue(topic, message)
     return
 
+  def stop_send_thread(self, flush=True, timeout=5):
+    """
+    Stops the sender thread. Senders blocked on a full queue are released with `ValueError`.
+
+    Parameters
+    ----------
+    flush : bool, optional
+        If True, the queued messages are published before stopping (if connected). Defaults to True
+    timeout : float, optional
+        The maximum time, in seconds, to wait for the sender thread. Defaults to 5
+
+    Returns
+    -------
+    int
+        The number of messages left unsent.
+    """
+    with self._send_queue_cond:
+      self._send_thread_stop = True
+      if not flush:
+        self._send_queue.clear()
+      self._send_queue_cond.notify_all()
+    if self._send_thread is not None:
+      self._send_thread.join(timeout=timeout)
+    return len(self._send_queue)
+
   def release(self):
     try:
       mqttc = self._mqttc
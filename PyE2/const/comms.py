@@ -8,6 +8,7 @@ EE_ADDR = 'EE_ADDR'
 
 HOST = 'HOST'
 TOPIC = 'TOPIC'
+NODE_TOPIC = 'NODE_TOPIC'
 BROKER = 'BROKER'
 PORT = 'PORT'
 USER = 'USER'
@@ -44,6 +45,17 @@ COMMUNICATION_VALID_TYPES = [
 ]
 
 
+class SEND_QUEUE_POLICY:
+  # wait until the queue drains below the low watermark
+  BLOCK = 'block'
+  # drop the new message and count it
+  DROP = 'drop'
+  # raise `ValueError`
+  ERROR = 'error'
+
+  VALID = [BLOCK, DROP, ERROR]
+
+
 class TIMERS:
   TIMER_SEND_BUFFER_PAYLOAD = 'send_buffer_payload'
 
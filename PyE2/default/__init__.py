@@ -1 +1,3 @@
 from .session.mqtt_session import MqttSession
+from .session.async_session import AsyncSession
+from .session.amqp_session import AmqpSession
@@ -0,0 +1,102 @@
+import json
+
+from ...base import GenericSession
+from ...comm import AMQPWrapper
+from ...const import comms as comm_ct
+
+
+class AmqpSession(GenericSession):
+  def __init__(self, *, prefetch_count=100, ack_batch_size=50, publisher_confirms=True, **kwargs) -> None:
+    """
+    A session that talks to the network through an AMQP broker (e.g. RabbitMQ with the MQTT plugin).
+    The messages are pushed by the broker to the session buffers as they arrive, instead of being polled.
+
+    Parameters
+    ----------
+    prefetch_count : int, optional
+        The maximum number of unacknowledged messages the broker pushes to each consumer. Defaults to 100
+    ack_batch_size : int, optional
+        The received messages are acknowledged together every `ack_batch_size` messages
+        (or every few milliseconds). Defaults to 50
+    publisher_confirms : bool, optional
+        If True, the sent commands are confirmed by the broker asynchronously and the rejected ones
+        are sent again. Defaults to True
+    **kwargs
+        See `GenericSession`
+    """
+    self._prefetch_count = prefetch_count
+    self._ack_batch_size = ack_batch_size
+    self._publisher_confirms = publisher_confirms
+    super(AmqpSession, self).__init__(**kwargs)
+    return
+
+  def startup(self):
+    common_kwargs = dict(
+      log=self.log,
+      config=self._config,
+      connection_name=self.name,
+      verbosity=self._verbosity,
+      prefetch_count=self._prefetch_count,
+      ack_batch_size=self._ack_batch_size,
+    )
+
+    self._default_communicator = AMQPWrapper(
+        send_channel_name=comm_ct.COMMUNICATION_CONFIG_CHANNEL,
+        recv_channel_name=comm_ct.COMMUNICATION_PAYLOADS_CHANNEL,
+        comm_type=comm_ct.COMMUNICATION_DEFAULT,
+        recv_buff=self._payload_messages,
+        recv_nodes=self.filter_workers,
+        consumer_group=self._consumer_group,
+        publisher_confirms=self._publisher_confirms,
+        **common_kwargs,
+    )
+
+    self._heartbeats_communicator = AMQPWrapper(
+        recv_channel_name=comm_ct.COMMUNICATION_CTRL_CHANNEL,
+        comm_type=comm_ct.COMMUNICATION_HEARTBEATS,
+        recv_buff=self._hb_messages,
+        # the heartbeats of all the nodes are received, to track which nodes are online
+        **common_kwargs,
+    )
+
+    self._notifications_communicator = AMQPWrapper(
+        recv_channel_name=comm_ct.COMMUNICATION_NOTIF_CHANNEL,
+        comm_type=comm_ct.COMMUNICATION_NOTIFICATIONS,
+        recv_buff=self._notif_messages,
+        recv_nodes=self.filter_workers,
+        **common_kwargs,
+    )
+    return super(AmqpSession, self).startup()
+
+  @property
+  def _communicators(self):
+    return [self._default_communicator, self._heartbeats_communicator, self._notifications_communicator]
+
+  @property
+  def _connected(self):
+    """
+    Check if the session is connected to the communication server.
+    """
+    return all(communicator.connected for communicator in self._communicators)
+
+  def _connect(self) -> None:
+    for communicator in self._communicators:
+      if communicator.connection is None:
+        communicator.server_connect()
+        communicator.subscribe()
+    return
+
+  def _communication_close(self, **kwargs):
+    # wait for the commands still queued (e.g. the pipeline close commands) to be confirmed before disconnecting
+    nr_unsent = self._default_communicator.stop_send_thread(flush=True)
+    if nr_unsent > 0:
+      self.P("{} queued commands could not be sent before closing".format(nr_unsent), color='r', verbosity=1)
+    for communicator in self._communicators:
+      communicator.release()
+    return
+
+  def _send_payload(self, to, msg):
+    payload = json.dumps(msg)
+
+    self._default_communicator.send(payload, send_to=to)
+    return
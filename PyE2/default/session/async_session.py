@@ -0,0 +1,82 @@
+import asyncio
+
+from ...base import Pipeline
+from .mqtt_session import MqttSession
+
+
+class AsyncSession(MqttSession):
+  """
+  A Session to be used from asyncio code.
+  The messages are handled by the same callback threads as in `Session`, but the waits
+  (transactions, nodes, execution results) resolve asyncio futures instead of polling,
+  so a single event loop can drive many concurrent deployments.
+
+  Example:
+  --------
+  ```python
+  async with AsyncSession() as session:
+    pipelines = [
+      await session.create_pipeline_async(node=node, name='my_pipeline', max_wait_time=30)
+      for node in nodes
+    ]
+    ...
+    await asyncio.gather(*[pipeline.deploy_async() for pipeline in pipelines])
+  ```
+  """
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    await self.close_async()
+    return False
+
+  async def create_pipeline_async(self, *, node, name, max_wait_time=0, **kwargs) -> Pipeline:
+    """
+    Awaitable version of `create_pipeline`: waits for the node to appear online without blocking the event loop.
+    See `create_pipeline` for the parameters.
+
+    Returns
+    -------
+    Pipeline
+        A `Pipeline` object.
+    """
+    await self.wait_for_node_async(node, timeout=max_wait_time, verbose=False)
+    return self.create_pipeline(node=node, name=name, max_wait_time=0, **kwargs)
+
+  async def attach_to_pipeline_async(self, *, node, name, max_wait_time=0, **kwargs) -> Pipeline:
+    """
+    Awaitable version of `attach_to_pipeline`: waits for the node to appear online without blocking the event loop.
+    See `attach_to_pipeline` for the parameters.
+
+    Returns
+    -------
+    Pipeline
+        A `Pipeline` object.
+    """
+    await self.wait_for_node_async(node, timeout=max_wait_time, verbose=False)
+    return self.attach_to_pipeline(node=node, name=name, max_wait_time=0, **kwargs)
+
+  async def close_async(self, close_pipelines=False, timeout=10):
+    """
+    Awaitable version of `close`.
+
+    Parameters
+    ----------
+    close_pipelines : bool, optional
+        close all the pipelines created by or attached to this session, by default False
+    timeout : int, optional
+        The timeout for closing each pipeline, by default 10
+    """
+    if close_pipelines:
+      self.P("Closing own pipelines: {}".format([p.name for p in self.own_pipelines]))
+      await asyncio.gather(*[pipeline.close_async(timeout=timeout) for pipeline in self.own_pipelines])
+      self.P("Closed own pipelines.")
+
+    self.close(close_pipelines=False, wait_close=False)
+
+    # the resources are released by the main loop thread
+    main_loop_thread = getattr(self, '_main_loop_thread', None)
+    if main_loop_thread is not None:
+      await asyncio.get_running_loop().run_in_executor(None, main_loop_thread.join)
+    return
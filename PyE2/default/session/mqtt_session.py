@@ -6,7 +6,52 @@ from ...const import comms as comm_ct
 
 
 class MqttSession(GenericSession):
+  def __init__(self, *, multiplex_connection=False, **kwargs) -> None:
+    """
+    Parameters
+    ----------
+    multiplex_connection : bool, optional
+        If True, a single MQTT connection is used for the payloads, heartbeats and notifications channels,
+        the received messages being demultiplexed by topic. This saves two TLS handshakes, sockets and
+        network threads per session. Defaults to False
+    **kwargs
+        See `GenericSession`
+    """
+    self._multiplex_connection = multiplex_connection
+    super(MqttSession, self).__init__(**kwargs)
+    return
+
   def startup(self):
+    if self._multiplex_connection:
+      self._default_communicator = MQTTWrapper(
+          log=self.log,
+          config=self._config,
+          send_channel_name=comm_ct.COMMUNICATION_CONFIG_CHANNEL,
+          recv_channel_name=[
+            comm_ct.COMMUNICATION_PAYLOADS_CHANNEL,
+            comm_ct.COMMUNICATION_CTRL_CHANNEL,
+            comm_ct.COMMUNICATION_NOTIF_CHANNEL,
+          ],
+          comm_type=comm_ct.COMMUNICATION_DEFAULT,
+          recv_buff={
+            comm_ct.COMMUNICATION_PAYLOADS_CHANNEL: self._payload_messages,
+            comm_ct.COMMUNICATION_CTRL_CHANNEL: self._hb_messages,
+            comm_ct.COMMUNICATION_NOTIF_CHANNEL: self._notif_messages,
+          },
+          connection_name=self.name,
+          verbosity=self._verbosity,
+          send_queue_size=self._send_queue_size,
+          send_queue_policy=self._send_queue_policy,
+          recv_nodes=self.filter_workers,
+          # the heartbeats of all the nodes are received, to track which nodes are online
+          recv_nodes_channels=[comm_ct.COMMUNICATION_PAYLOADS_CHANNEL, comm_ct.COMMUNICATION_NOTIF_CHANNEL],
+          consumer_group=self._consumer_group,
+          consumer_group_channels=[comm_ct.COMMUNICATION_PAYLOADS_CHANNEL],
+      )
+      self._heartbeats_communicator = self._default_communicator
+      self._notifications_communicator = self._default_communicator
+      return super(MqttSession, self).startup()
+
     self._default_communicator = MQTTWrapper(
         log=self.log,
         config=self._config,
@@ -16,6 +61,10 @@ class MqttSession(GenericSession):
         recv_buff=self._payload_messages,
         connection_name=self.name,
         verbosity=self._verbosity,
+        send_queue_size=self._send_queue_size,
+        send_queue_policy=self._send_queue_policy,
+        recv_nodes=self.filter_workers,
+        consumer_group=self._consumer_group,
     )
 
     self._heartbeats_communicator = MQTTWrapper(
@@ -36,37 +85,44 @@ class MqttSession(GenericSession):
         recv_buff=self._notif_messages,
         connection_name=self.name,
         verbosity=self._verbosity,
+        recv_nodes=self.filter_workers,
     )
     return super(MqttSession, self).startup()
 
+  @property
+  def _communicators(self):
+    """
+    The distinct communicators of this session (only one in multiplexed mode).
+    """
+    if self._multiplex_connection:
+      return [self._default_communicator]
+    return [self._default_communicator, self._heartbeats_communicator, self._notifications_communicator]
+
   @property
   def _connected(self):
     """
     Check if the session is connected to the communication server.
     """
-    return self._default_communicator.connected and self._heartbeats_communicator.connected and self._notifications_communicator.connected
+    return all(communicator.connected for communicator in self._communicators)
 
   def _connect(self) -> None:
-    if self._default_communicator.connection is None:
-      self._default_communicator.server_connect()
-      self._default_communicator.subscribe()
-    if self._heartbeats_communicator.connection is None:
-      self._heartbeats_communicator.server_connect()
-      self._heartbeats_communicator.subscribe()
-    if self._notifications_communicator.connection is None:
-      self._notifications_communicator.server_connect()
-      self._notifications_communicator.subscribe()
+    for communicator in self._communicators:
+      if communicator.connection is None:
+        communicator.server_connect()
+        communicator.subscribe()
     return
 
   def _communication_close(self, **kwargs):
-    self._default_communicator.release()
-    self._heartbeats_communicator.release()
-    self._notifications_communicator.release()
+    # publish the commands still queued (e.g. the pipeline close commands) before disconnecting
+    nr_unsent = self._default_communicator.stop_send_thread(flush=True)
+    if nr_unsent > 0:
+      self.P("{} queued commands could not be sent before closing".format(nr_unsent), color='r', verbosity=1)
+    for communicator in self._communicators:
+      communicator.release()
     return
 
   def _send_payload(self, to, msg):
     payload = json.dumps(msg)
 
-    self._default_communicator._send_to = to
-    self._default_communicator.send(payload)
+    self._default_communicator.send(payload, send_to=to)
     return
@@ -1 +1 @@
-from .base_formatter import BaseFormatter
\ No newline at end of file
+from .base_formatter import BaseFormatter, identity_decoder
\ No newline at end of file
@@ -4,11 +4,20 @@ from time import time
 from ...const import PAYLOAD_DATA
 
 
-class BaseFormatter(object):
+def identity_decoder(func):
+  """
+  Marks a `_decode_output` implementation that returns the messages unchanged, so decoding skips the formatter.
+  Subclasses that override `_decode_output` without this decorator are not identity formatters.
+  """
+  func.is_identity_decoder = True
+  return func
+
 
+class BaseFormatter(object):
   def __init__(self, log, signature, **kwargs):
     self.signature = signature
     self.log = log
+    self._is_identity = getattr(type(self)._decode_output, 'is_identity_decoder', False)
     super(BaseFormatter, self).__init__()
     return
 
@@ -27,6 +36,7 @@ class BaseFormatter(object):
     """
     return output
 
+  @identity_decoder
   def _decode_output(self, encoded_output):
     """
     Maybe implement
@@ -65,6 +75,11 @@ class BaseFormatter(object):
     if ee_impl is None or (isinstance(ee_impl, str) and ee_impl.lower() != self.signature.lower()):
       return encoded_output
 
+    if self._is_identity:
+      if isinstance(encoded_output, dict):
+        encoded_output[PAYLOAD_DATA.EE_FORMATTER] = ee_impl
+      return encoded_output
+
     self.log.start_timer('decode', section='Formatter_' + str(self.signature))
     try:
       output = self._decode_output(encoded_output)
@@ -22,9 +22,12 @@ def snake_to_camel(name):
 
 
 class ADummyFormatter(BaseFormatter):
+  MAX_DECODED_KEYS = 10000
 
   def __init__(self, **kwargs):
     super(ADummyFormatter, self).__init__(**kwargs)
+    # encoded key -> decoded key, see `_decode_output`
+    self._dct_decoded_keys = {}
     return
 
   def _decode_streams(self, dct_config_streams):
@@ -45,7 +48,11 @@ class ADummyFormatter(BaseFormatter):
     decoded_output = {}
 
     for k, v in encoded_output.items():
-      k_snake_case = camel_to_upper_snake(k)
+      k_snake_case = self._dct_decoded_keys.get(k)
+      if k_snake_case is None:
+        k_snake_case = camel_to_upper_snake(k)
+        if len(self._dct_decoded_keys) < self.MAX_DECODED_KEYS:
+          self._dct_decoded_keys[k] = k_snake_case
       decoded_output[k_snake_case] = v
 
     return decoded_output
@@ -7,10 +7,20 @@ from ...io_formatter.base import BaseFormatter
 
 
 class Cavi2Formatter(BaseFormatter):
+  REQUIRED_KEYS = {'messageID', 'type', 'data', 'metadata', 'sender', 'time', 'category', 'version', 'demoMode'}
+  SENDER_KEYS = {'hostId', 'id', 'instanceId'}
+  TIME_KEYS = {'hostTime', 'deviceTime', 'internetTime'}
+  IMG_KEYS = {'id', 'height', 'width'}
+  IDENTIFIERS_KEYS = {'streamId', 'initiatorId', 'instanceId', 'sessionId', 'payloadId', 'idTags'}
+  METADATA_KEYS = {'sbTotalMessages', 'sbCurrentMessage'}
+  PAYLOAD_METADATA_KEYS = {'sbTotalMessages', 'sbCurrentMessage', 'captureMetadata', 'pluginMetadata'}
+  MAX_DECODE_PLANS = 1024
 
   def __init__(self, log, **kwargs):
     super(Cavi2Formatter, self).__init__(
         log=log, prefix_log='[CAVI2-FMT]', **kwargs)
+    # signature -> keys remapping, see `_get_decode_plan`
+    self._dct_decode_plans = {}
     return
 
   def startup(self):
@@ -158,101 +168,107 @@ class Cavi2Formatter(BaseFormatter):
     assert len(output) == 0
     return encoded_output
 
+  def _get_decode_plan(self, signature):
+    """
+    Returns the decode plan of a signature: for each group of keys of the encoded payload,
+    a dict encoded key -> decoded key, filled as new keys are seen.
+    """
+    plan = self._dct_decode_plans.get(signature)
+    if plan is None:
+      if len(self._dct_decode_plans) >= self.MAX_DECODE_PLANS:
+        self._dct_decode_plans.clear()
+      plan = {group: {} for group in ['value', 'specificValue', 'captureMetadata', 'pluginMetadata', 'metadata']}
+      self._dct_decode_plans[signature] = plan
+    return plan
+
   def _decode_output(self, encoded_output):
-    if 'SB_IMPLEMENTATION' in encoded_output:
-      encoded_output.pop('SB_IMPLEMENTATION')
-    if 'EE_FORMATTER' in encoded_output:
-      encoded_output.pop('EE_FORMATTER')
+    # single pass over the encoded payload, the input is not modified
+    missing_keys = self.REQUIRED_KEYS - encoded_output.keys()
+    if len(missing_keys) > 0:
+      raise KeyError("Missing keys {}".format(missing_keys))
     output = {}
-    encoded_output.pop('messageID')
 
-    event_type = encoded_output.pop('type')
-    ee_event_type = event_type
-    if event_type not in ['notification', 'heartbeat']:
-      ee_event_type = 'payload'
-    output['EE_EVENT_TYPE'] = ee_event_type.upper()
+    event_type = encoded_output['type']
+    is_payload = event_type not in ['notification', 'heartbeat']
+    output['EE_EVENT_TYPE'] = 'PAYLOAD' if is_payload else event_type.upper()
+    plan = self._get_decode_plan(event_type)
 
-    data = encoded_output.pop('data')
-    metadata = encoded_output.pop('metadata')
+    data = encoded_output['data']
+    metadata = encoded_output['metadata']
 
     # 'sender' zone
-    output['EE_ID'] = encoded_output['sender'].pop('hostId')
-    encoded_output['sender'].pop('id')
-    encoded_output['sender'].pop('instanceId')
-    assert len(encoded_output['sender']) == 0
-    encoded_output.pop('sender')
+    sender = encoded_output['sender']
+    assert sender.keys() == self.SENDER_KEYS
+    output['EE_ID'] = sender['hostId']
 
     # 'time' zone
-    output['EE_TIMESTAMP'] = encoded_output['time'].pop('hostTime')
-    encoded_output['time'].pop('deviceTime')
-    encoded_output['time'].pop('internetTime')
-    assert len(encoded_output['time']) == 0
-    encoded_output.pop('time')
+    time = encoded_output['time']
+    assert time.keys() == self.TIME_KEYS
+    output['EE_TIMESTAMP'] = time['hostTime']
 
-    output['EE_TOTAL_MESSAGES'] = metadata.pop('sbTotalMessages')
-    output['EE_MESSAGE_ID'] = metadata.pop('sbCurrentMessage')
+    output['EE_TOTAL_MESSAGES'] = metadata['sbTotalMessages']
+    output['EE_MESSAGE_ID'] = metadata['sbCurrentMessage']
 
-    if event_type not in ['notification', 'heartbeat']:
+    if is_payload:
       output['SIGNATURE'] = event_type.upper()
-      capture_metadata = metadata.pop('captureMetadata')
-      plugin_metadata = metadata.pop('pluginMetadata')
-      for k in list(capture_metadata.keys()):
-        capture_metadata['_C_{}'.format(k)] = capture_metadata.pop(k)
-      for k in list(plugin_metadata.keys()):
-        plugin_metadata['_P_{}'.format(k)] = plugin_metadata.pop(k)
-
-      output['STREAM'] = data['identifiers'].pop('streamId')
-      output['INITIATOR_ID'] = data['identifiers'].pop(
-          'initiatorId', None)  # None is for backward compatibility
-      output['INSTANCE_ID'] = data['identifiers'].pop('instanceId')
-      output['SESSION_ID'] = data['identifiers'].pop(
-          'sessionId', None)  # None is for backward compatibility
-      output['ID'] = data['identifiers'].pop('payloadId')
-      output['ID_TAGS'] = data['identifiers'].pop('idTags', None)
-      assert len(data['identifiers']) == 0
-      data.pop('identifiers')
-      keys = list(data['value'].keys())
-      for k in keys:
-        output[k.upper()] = data['value'].pop(k)
-      assert len(data['value']) == 0
-      data.pop('value')
-      keys = list(data['specificValue'].keys())
-      for k in keys:
-        output[k.upper()] = data['specificValue'].pop(k)
-      assert len(data['specificValue']) == 0
-      data.pop('specificValue')
-
-      img = data['img'].pop('id')
-      img_h = data['img'].pop('height')
-      img_w = data['img'].pop('width')
-      assert len(data['img']) == 0
-      data.pop('img')
-
-      if img is not None:
-        output['IMG'] = img
-        output['IMG_HEIGHT'] = img_h
-        output['IMG_WIDTH'] = img_w
-      # endif
-
-      output['TIMESTAMP_EXECUTION'] = data.pop('time')
+      capture_metadata = metadata['captureMetadata']
+      plugin_metadata = metadata['pluginMetadata']
+
+      identifiers = data['identifiers']
+      output['STREAM'] = identifiers['streamId']
+      output['INITIATOR_ID'] = identifiers.get('initiatorId', None)  # None is for backward compatibility
+      output['INSTANCE_ID'] = identifiers['instanceId']
+      output['SESSION_ID'] = identifiers.get('sessionId', None)  # None is for backward compatibility
+      output['ID'] = identifiers['payloadId']
+      output['ID_TAGS'] = identifiers.get('idTags', None)
+      assert identifiers.keys() <= self.IDENTIFIERS_KEYS
+
+      for group in ['value', 'specificValue']:
+        keys_plan = plan[group]
+        for k, v in data[group].items():
+          decoded_key = keys_plan.get(k)
+          if decoded_key is None:
+            decoded_key = keys_plan[k] = k.upper()
+          output[decoded_key] = v
+      # endfor
 
-      # assert len(data) == 0
+      img = data['img']
+      assert img.keys() == self.IMG_KEYS
+      if img['id'] is not None:
+        output['IMG'] = img['id']
+        output['IMG_HEIGHT'] = img['height']
+        output['IMG_WIDTH'] = img['width']
+      # endif
 
-      output = {**output, **capture_metadata, **plugin_metadata}
+      output['TIMESTAMP_EXECUTION'] = data['time']
+
+      for group, group_metadata, prefix in [
+        ('captureMetadata', capture_metadata, '_C_'),
+        ('pluginMetadata', plugin_metadata, '_P_'),
+      ]:
+        keys_plan = plan[group]
+        for k, v in group_metadata.items():
+          decoded_key = keys_plan.get(k)
+          if decoded_key is None:
+            decoded_key = keys_plan[k] = prefix + k
+          output[decoded_key] = v
+      # endfor
     # endif
 
-    keys = list(metadata.keys())
-    for k in keys:
-      output[k.upper()] = metadata.pop(k)
-
-    # assert len(metadata) == 0
-    encoded_output.pop('category')
-    encoded_output.pop('version')
-    encoded_output.pop('demoMode')
-    # assert len(encoded_output) == 0
-    for k in list(encoded_output.keys()):
-      if k.startswith('EE'):
-        output[k] = encoded_output[k]
+    decoded_metadata_keys = self.PAYLOAD_METADATA_KEYS if is_payload else self.METADATA_KEYS
+    keys_plan = plan['metadata']
+    for k, v in metadata.items():
+      if k in decoded_metadata_keys:
+        continue
+      decoded_key = keys_plan.get(k)
+      if decoded_key is None:
+        decoded_key = keys_plan[k] = k.upper()
+      output[decoded_key] = v
+    # endfor
+
+    for k, v in encoded_output.items():
+      if k.startswith('EE') and k != 'EE_FORMATTER':
+        output[k] = v
     return output
 
 
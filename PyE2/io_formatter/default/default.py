@@ -1,9 +1,8 @@
 # local dependencies
-from ...io_formatter.base import BaseFormatter
+from ...io_formatter.base import BaseFormatter, identity_decoder
 
 
 class DefaultFormatter(BaseFormatter):
-
   def __init__(self, log, **kwargs):
     super(DefaultFormatter, self).__init__(
         log=log, prefix_log='[DEFAULT-FMT]', **kwargs)
@@ -15,6 +14,7 @@ class DefaultFormatter(BaseFormatter):
   def _encode_output(self, output):
     return output
 
+  @identity_decoder
   def _decode_output(self, encoded_output):
     return encoded_output
 
@@ -1,2 +1,4 @@
-from .comm_utils import resolve_domain_or_ip
+from .comm_utils import peek_json_string_field, resolve_domain_or_ip
 from .dotenv import load_dotenv
+from .message_queue import MessageQueue
+from .timer_scheduler import TimerScheduler
@@ -1,4 +1,6 @@
+import re
 import socket
+from functools import lru_cache
 from ipaddress import ip_address, AddressValueError
 
 def resolve_domain_or_ip(url):
@@ -29,9 +31,36 @@ def resolve_domain_or_ip(url):
     return True, ip_of_url, url
   except:
     return False, None, url
-  
-  
-  
+
+
+@lru_cache(maxsize=64)
+def _json_string_field_pattern(key):
+  return re.compile(r'"{}"\s*:\s*"([^"\\]*)"'.format(re.escape(key)))
+
+
+def peek_json_string_field(message, key):
+  """Extracts the value of a string field from a JSON text without parsing it.
+
+  Parameters
+  ----------
+  message : str
+      The JSON text.
+  key : str
+      The key of the field.
+
+  Returns
+  -------
+  str | None
+      The value if the key appears exactly once in the text with a plain string value
+      (no escaped characters), None otherwise (not found, ambiguous or not a simple string).
+      As the key may appear in a nested object, a value is only certain to be the top-level one
+      when the top-level object has this key.
+  """
+  matches = _json_string_field_pattern(key).findall(message)
+  if len(matches) != 1:
+    return None
+  return matches[0]
+
 
 if __name__ == '__main__':
   # Usage:
@@ -41,4 +70,3 @@ if __name__ == '__main__':
     print(f"Cannot connect to {original_url} (IP: {ip})")
   else:
     print(f"Resolved {original_url} to IP: {ip}")
-    
\ No newline at end of file
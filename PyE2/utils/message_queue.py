@@ -0,0 +1,109 @@
+from collections import deque
+from threading import Condition
+
+
+class MessageQueue(object):
+  """
+  Bounded FIFO queue used to pass raw messages from the communication threads
+  to the session callback threads.
+
+  Producers call `append` (same API as `collections.deque`, so the communication
+  wrappers can use it as a `recv_buff`) and consumers block in `popleft` until a
+  message arrives or the queue is closed, instead of polling.
+  """
+
+  def __init__(self, maxlen=None):
+    """
+    Parameters
+    ----------
+    maxlen : int, optional
+        The maximum number of messages kept in the queue. If the queue is full,
+        new messages are dropped and counted in `nr_dropped`. If None, the queue is unbounded.
+        Defaults to None.
+    """
+    self._maxlen = maxlen
+    self._queue = deque()
+    self._cond = Condition()
+    self._closed = False
+    self._nr_dropped = 0
+    return
+
+  def __len__(self):
+    return len(self._queue)
+
+  @property
+  def maxlen(self):
+    return self._maxlen
+
+  @property
+  def depth(self):
+    """
+    The number of messages waiting to be processed.
+    """
+    return len(self._queue)
+
+  @property
+  def nr_dropped(self):
+    """
+    The number of messages dropped because the queue was full.
+    """
+    return self._nr_dropped
+
+  @property
+  def closed(self):
+    return self._closed
+
+  def append(self, message) -> bool:
+    """
+    Add a message to the queue and wake up one waiting consumer.
+
+    Parameters
+    ----------
+    message : Any
+        The message to add.
+
+    Returns
+    -------
+    bool
+        True if the message was queued, False if it was dropped because the queue is full.
+    """
+    with self._cond:
+      if self._maxlen is not None and len(self._queue) >= self._maxlen:
+        self._nr_dropped += 1
+        return False
+      self._queue.append(message)
+      self._cond.notify()
+    return True
+
+  def popleft(self, timeout=None):
+    """
+    Remove and return the oldest message, blocking until one is available.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        The maximum time to wait, in seconds. If None, waits until a message
+        arrives or the queue is closed. Defaults to None.
+
+    Returns
+    -------
+    tuple[bool, Any]
+        (True, message) if a message was available, (False, None) if the wait
+        timed out or the queue was closed and is empty.
+    """
+    with self._cond:
+      if len(self._queue) == 0 and not self._closed:
+        self._cond.wait_for(lambda: len(self._queue) > 0 or self._closed, timeout=timeout)
+      if len(self._queue) == 0:
+        return False, None
+      return True, self._queue.popleft()
+
+  def close(self):
+    """
+    Mark the queue as closed and wake up all waiting consumers.
+    Messages already in the queue can still be retrieved with `popleft`.
+    """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    return
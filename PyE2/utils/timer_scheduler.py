@@ -0,0 +1,157 @@
+import heapq
+from itertools import count
+from threading import Condition, Thread
+from time import monotonic
+
+
+class Timer(object):
+  """
+  Handle of a callback scheduled with `TimerScheduler.schedule`.
+  """
+  __slots__ = ('deadline', 'callback', 'args', 'cancelled', '_scheduler')
+
+  def __init__(self, deadline, callback, args, scheduler=None):
+    self.deadline = deadline
+    self.callback = callback
+    self.args = args
+    self.cancelled = False
+    self._scheduler = scheduler
+    return
+
+  def cancel(self):
+    """
+    Cancel the timer. The callback will not be called if it did not fire already.
+    The references to the callback and its arguments are released immediately.
+    """
+    if self.cancelled:
+      return
+    self.cancelled = True
+    self.callback = None
+    self.args = ()
+    scheduler, self._scheduler = self._scheduler, None
+    if scheduler is not None:
+      scheduler._on_timer_cancelled()
+    return
+
+
+class TimerScheduler(object):
+  """
+  Heap-based scheduler that calls callbacks at their deadlines from a single thread.
+
+  Scheduling and cancelling a timer is O(log n) / O(1) and the thread sleeps until the
+  earliest deadline, so nothing is scanned while no timer expires.
+  The callbacks are called from the scheduler thread, so they should be short and must not block.
+  The cancelled timers are removed from the heap once they are more than half of it.
+  """
+
+  def __init__(self, name='TimerScheduler', log=None):
+    """
+    Parameters
+    ----------
+    name : str, optional
+        The name of the scheduler thread.
+    log : Logger, optional
+        Used to report the exceptions raised by the callbacks.
+    """
+    self._name = name
+    self.log = log
+    self._heap = []
+    self._nr_cancelled = 0
+    self._counter = count()
+    self._cond = Condition()
+    self._thread = None
+    self._closed = False
+    return
+
+  def __len__(self):
+    return len(self._heap)
+
+  def schedule(self, delay, callback, *args) -> Timer:
+    """
+    Call `callback(*args)` after `delay` seconds.
+
+    Parameters
+    ----------
+    delay : float
+        The delay in seconds.
+    callback : Callable
+        The callback.
+
+    Returns
+    -------
+    Timer
+        The timer handle, that can be used to cancel the callback.
+    """
+    return self.schedule_at(monotonic() + delay, callback, *args)
+
+  def schedule_at(self, deadline, callback, *args) -> Timer:
+    """
+    Call `callback(*args)` at `deadline`, a value of `time.monotonic()`.
+
+    Returns
+    -------
+    Timer
+        The timer handle, that can be used to cancel the callback.
+    """
+    timer = Timer(deadline, callback, args, scheduler=self)
+    with self._cond:
+      if self._closed:
+        raise ValueError("The timer scheduler is closed")
+      heapq.heappush(self._heap, (deadline, next(self._counter), timer))
+      if self._thread is None:
+        self._thread = Thread(target=self.__run, name=self._name, daemon=True)
+        self._thread.start()
+      elif self._heap[0][2] is timer:
+        # new earliest deadline
+        self._cond.notify()
+    return timer
+
+  def __run(self):
+    while True:
+      with self._cond:
+        while not self._closed:
+          if len(self._heap) == 0:
+            self._cond.wait()
+            continue
+          wait_time = self._heap[0][0] - monotonic()
+          if wait_time <= 0:
+            break
+          self._cond.wait(wait_time)
+        # endwhile
+        if self._closed:
+          break
+        _, _, timer = heapq.heappop(self._heap)
+        if timer.cancelled:
+          self._nr_cancelled -= 1
+          continue
+        # fired timers cannot be cancelled anymore
+        timer._scheduler = None
+        callback, args = timer.callback, timer.args
+      # endwith
+      try:
+        callback(*args)
+      except Exception as exc:
+        if self.log is not None:
+          self.log.P("Exception in timer callback {}: {}".format(getattr(callback, '__name__', callback), exc), color='r')
+    # endwhile
+    return
+
+  def _on_timer_cancelled(self):
+    with self._cond:
+      self._nr_cancelled += 1
+      if self._nr_cancelled > len(self._heap) // 2:
+        self._heap = [item for item in self._heap if not item[2].cancelled]
+        heapq.heapify(self._heap)
+        self._nr_cancelled = 0
+    return
+
+  def close(self):
+    """
+    Stop the scheduler thread. The pending timers are discarded.
+    """
+    with self._cond:
+      self._closed = True
+      self._heap = []
+      self._nr_cancelled = 0
+      self._cond.notify_all()
+    return
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from PyE2.base import GenericSession
+from PyE2.logging import Logger
+
+
+class LocalSession(GenericSession):
+  """
+  A session without a communication server: the sent commands are recorded and the
+  received messages are pushed directly in the session buffers.
+  """
+
+  def startup(self):
+    self.sent = []
+    return super(LocalSession, self).startup()
+
+  @property
+  def _connected(self):
+    return True
+
+  def _connect(self):
+    return
+
+  def _communication_close(self, **kwargs):
+    return
+
+  def _send_payload(self, to, msg):
+    self.sent.append((to, json.loads(json.dumps(msg))))
+    return
+
+
+@pytest.fixture
+def make_session(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  sessions = []
+
+  def _make(**kwargs):
+    log = Logger(base_folder=str(tmp_path), app_folder='_local_cache', DEBUG=False, show_time=False)
+    kwargs.setdefault('name', 'test_session')
+    kwargs.setdefault('encrypt_comms', False)
+    session = LocalSession(host='localhost', port=1883, user='u', pwd='p', log=log, **kwargs)
+    sessions.append(session)
+    return session
+
+  yield _make
+  for session in sessions:
+    session.close(wait_close=False)
@@ -0,0 +1,276 @@
+from collections import deque
+from types import SimpleNamespace
+
+import pika
+
+from PyE2.comm import AMQPWrapper
+from PyE2.const import COMMS
+from PyE2.const import comms as comm_ct
+from PyE2.utils.message_queue import MessageQueue
+
+
+class _Log:
+  def P(self, *args, **kwargs):
+    return
+
+
+PAYLOADS = comm_ct.COMMUNICATION_PAYLOADS_CHANNEL
+
+
+def _config(**kwargs):
+  config = {
+    'HOST': 'localhost', 'PORT': 5672, 'USER': 'u', 'PASS': 'p',
+    PAYLOADS: {'TOPIC': 'root/payloads', 'NODE_TOPIC': 'root/{}/payloads'},
+  }
+  config.update(kwargs)
+  return config
+
+
+def _wrapper(config=None, **kwargs):
+  return AMQPWrapper(
+    log=_Log(), config=config or _config(), recv_channel_name=PAYLOADS, recv_buff=deque(),
+    connection_name='sess', **kwargs
+  )
+
+
+class _FakeIOLoop:
+  def __init__(self):
+    self.timers = []
+    self.stopped = False
+
+  def add_callback_threadsafe(self, callback):
+    callback()
+
+  def call_later(self, delay, callback):
+    self.timers.append((delay, callback))
+
+  def stop(self):
+    self.stopped = True
+
+
+class _FakeConnection:
+  def __init__(self):
+    self.ioloop = _FakeIOLoop()
+    self.is_closing = False
+    self.is_closed = False
+
+
+class _FakeChannel:
+  """
+  Records the calls and completes the asynchronous ones immediately.
+  """
+  def __init__(self):
+    self.acks = []
+    self.nacks = []
+    self.published = []
+    self.qos = None
+    self.bound = []
+    self.declared = None
+
+  def add_on_close_callback(self, callback):
+    return
+
+  def confirm_delivery(self, ack_nack_callback, callback):
+    callback(None)
+
+  def basic_ack(self, delivery_tag, multiple):
+    self.acks.append((delivery_tag, multiple))
+
+  def basic_nack(self, delivery_tag, multiple, requeue):
+    self.nacks.append((delivery_tag, multiple, requeue))
+
+  def basic_publish(self, exchange, routing_key, body, properties):
+    self.published.append(body)
+
+  def queue_declare(self, queue, durable, exclusive, auto_delete, callback):
+    self.declared = (queue, durable, exclusive, auto_delete)
+    callback(None)
+
+  def queue_bind(self, queue, exchange, routing_key, callback):
+    self.bound.append(routing_key)
+    callback(None)
+
+  def basic_qos(self, prefetch_count, callback):
+    self.qos = prefetch_count
+    callback(None)
+
+  def basic_consume(self, queue, on_message_callback, auto_ack, callback):
+    callback(None)
+    return 'ctag'
+
+
+def _open(wrapper, channel=None):
+  """
+  Simulates the connection and channel opening, as done by the connection thread.
+  """
+  channel = channel or _FakeChannel()
+  if wrapper._connection is None:
+    wrapper._connection = _FakeConnection()
+  wrapper._AMQPWrapper__on_channel_open(channel)
+  return channel
+
+
+def _deliver(wrapper, channel, delivery_tag, body='{}'):
+  method = SimpleNamespace(delivery_tag=delivery_tag)
+  wrapper._AMQPWrapper__on_delivery(channel, method, None, body.encode('utf-8'))
+
+
+def _confirm(wrapper, method_cls, delivery_tag, multiple=False):
+  frame = SimpleNamespace(method=method_cls(delivery_tag=delivery_tag, multiple=multiple))
+  wrapper._AMQPWrapper__on_confirm(frame)
+
+
+def _disconnect(wrapper):
+  wrapper._AMQPWrapper__on_connection_closed(wrapper._connection, 'lost')
+
+
+def _sender(**kwargs):
+  return AMQPWrapper(
+    log=_Log(), config=_config(**{'CONFIG_CHANNEL': {'TOPIC': 'root/{}/config'}}),
+    send_channel_name='CONFIG_CHANNEL', connection_name='sess', **kwargs
+  )
+
+
+def test_private_queue_is_unique_and_exclusive():
+  cfg1 = _wrapper().recv_channel_def
+  cfg2 = _wrapper().recv_channel_def
+  assert cfg1[COMMS.QUEUE].startswith('root.payloads/sess/')
+  assert cfg1[COMMS.QUEUE] != cfg2[COMMS.QUEUE]
+  assert cfg1[COMMS.QUEUE_EXCLUSIVE] is True
+  assert cfg1[COMMS.QUEUE_DURABLE] is False
+  assert cfg1[COMMS.EXCHANGE] == 'amq.topic'
+  assert cfg1[COMMS.ROUTING_KEY] == ['root.payloads']
+
+
+def test_group_queue_is_shared_and_durable():
+  cfg1 = _wrapper(consumer_group='grp').recv_channel_def
+  cfg2 = _wrapper(consumer_group='grp').recv_channel_def
+  assert cfg1[COMMS.QUEUE] == cfg2[COMMS.QUEUE] == 'root.payloads/grp'
+  assert cfg1[COMMS.QUEUE_EXCLUSIVE] is False
+  assert cfg1[COMMS.QUEUE_DURABLE] is True
+
+
+def test_group_queue_has_no_device_suffix():
+  config = _config(**{COMMS.EE_ID: 'dev1'})
+  assert _wrapper(config, consumer_group='grp').recv_channel_def[COMMS.QUEUE] == 'root.payloads/grp'
+  assert _wrapper(config).recv_channel_def[COMMS.QUEUE].startswith('root.payloads/dev1/sess/')
+
+
+def test_group_queue_is_named_after_the_bound_nodes():
+  cfg = _wrapper(consumer_group='grp', recv_nodes=['n1', 'n2']).recv_channel_def
+  same = _wrapper(consumer_group='grp', recv_nodes=['n2', 'n1']).recv_channel_def
+  other = _wrapper(consumer_group='grp', recv_nodes=['n1']).recv_channel_def
+  assert cfg[COMMS.QUEUE].startswith('root.payloads/grp/')
+  # the members with the same nodes share the queue, the others do not widen its bindings
+  assert cfg[COMMS.QUEUE] == same[COMMS.QUEUE]
+  assert other[COMMS.QUEUE] != cfg[COMMS.QUEUE]
+  assert other[COMMS.QUEUE] != 'root.payloads/grp'
+
+
+def test_recv_nodes_bind_per_node_routing_keys():
+  cfg = _wrapper(recv_nodes=['0xai_a.b', 'n2']).recv_channel_def
+  assert cfg[COMMS.ROUTING_KEY] == ['root.0xai_a/b.payloads', 'root.n2.payloads']
+
+
+def test_consumer_prefetch():
+  wrapper = _wrapper(prefetch_count=7)
+  channel = _open(wrapper)
+  wrapper._AMQPWrapper__start_consuming(wrapper.recv_channel_def)
+  assert channel.qos == 7
+  assert channel.bound == ['root.payloads']
+  assert wrapper._subscribed.is_set()
+  assert wrapper.recv_queue == channel.declared[0]
+
+
+def test_acks_are_batched():
+  wrapper = _wrapper(prefetch_count=10, ack_batch_size=3)
+  channel = _open(wrapper)
+  for tag in range(1, 8):
+    _deliver(wrapper, channel, tag, body='m{}'.format(tag))
+  # one multiple ack for each batch, the rest waits for the timer
+  assert channel.acks == [(3, True), (6, True)]
+  assert list(wrapper._recv_buff) == ['m{}'.format(tag) for tag in range(1, 8)]
+
+  _, on_ack_timer = wrapper._connection.ioloop.timers[-1]
+  on_ack_timer()
+  assert channel.acks[-1] == (7, True)
+  on_ack_timer()
+  assert len(channel.acks) == 3
+
+
+def test_messages_dropped_by_a_full_buffer_are_requeued():
+  wrapper = _wrapper(ack_batch_size=10)
+  wrapper._recv_buff = MessageQueue(maxlen=2)
+  channel = _open(wrapper)
+  for tag in range(1, 5):
+    _deliver(wrapper, channel, tag, body='m{}'.format(tag))
+  # the messages taken by the buffer are acknowledged before the rejected one, never together with it
+  assert channel.acks == [(2, True)]
+  assert channel.nacks == [(3, False, True), (4, False, True)]
+  assert wrapper._recv_buff.depth == 2
+
+  ok, msg = wrapper._recv_buff.popleft(timeout=0)
+  assert ok and msg == 'm1'
+  _deliver(wrapper, channel, 5, body='m3')
+  wrapper._AMQPWrapper__flush_acks()
+  assert channel.acks == [(2, True), (5, True)]
+  assert channel.nacks == [(3, False, True), (4, False, True)]
+
+
+def test_no_stale_ack_after_reconnect():
+  wrapper = _wrapper(ack_batch_size=3)
+  channel = _open(wrapper)
+  _deliver(wrapper, channel, 1)
+  _deliver(wrapper, channel, 2)
+  _disconnect(wrapper)
+
+  new_channel = _open(wrapper)
+  # the tags of the old channel are not acknowledged on the new one
+  wrapper._AMQPWrapper__flush_acks()
+  assert channel.acks == [] and new_channel.acks == []
+  # and are not counted in the batches of the new channel
+  _deliver(wrapper, new_channel, 1)
+  _deliver(wrapper, new_channel, 2)
+  assert new_channel.acks == []
+  _deliver(wrapper, new_channel, 3)
+  assert new_channel.acks == [(3, True)]
+
+
+def test_nacked_messages_are_published_again():
+  wrapper = _sender()
+  channel = _open(wrapper)
+  for i in range(4):
+    wrapper.send('m{}'.format(i), send_to='n1')
+  assert channel.published == ['m0', 'm1', 'm2', 'm3']
+  assert wrapper.send_queue_depth == 4
+
+  _confirm(wrapper, pika.spec.Basic.Ack, 2, multiple=True)
+  assert wrapper.send_queue_depth == 2
+  _confirm(wrapper, pika.spec.Basic.Nack, 3)
+  assert channel.published[4:] == ['m2']
+  assert wrapper.send_queue_depth == 2
+  # the message published again gets the next sequence number
+  _confirm(wrapper, pika.spec.Basic.Ack, 5, multiple=True)
+  assert wrapper.send_queue_depth == 0
+
+
+def test_unconfirmed_messages_are_requeued_in_front_on_reconnect():
+  wrapper = _sender()
+  channel = _open(wrapper)
+  wrapper.send('m0', send_to='n1')
+  wrapper.send('m1', send_to='n1')
+  _confirm(wrapper, pika.spec.Basic.Ack, 1)
+  _disconnect(wrapper)
+  assert not wrapper.connected
+  # sent while disconnected, published after the unconfirmed ones
+  wrapper._connection = _FakeConnection()
+  wrapper.send('m2', send_to='n1')
+  assert list(wrapper._publish_queue) == [
+    ('amq.topic', 'root.n1.config', 'm1'), ('amq.topic', 'root.n1.config', 'm2')
+  ]
+
+  new_channel = _open(wrapper)
+  assert new_channel.published == ['m1', 'm2']
+  assert channel.published == ['m0', 'm1']
+  _confirm(wrapper, pika.spec.Basic.Ack, 2, multiple=True)
+  assert wrapper.send_queue_depth == 0
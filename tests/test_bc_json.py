@@ -0,0 +1,96 @@
+import datetime
+import json
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from PyE2.bc.base import (
+  BaseBlockEngine, _ComplexJsonEncoder, _NonCanonicalData, _to_canonical_json_data, replace_nan_inf
+)
+
+
+def _legacy_dumps(data, ensure_ascii=False):
+  # the serialization used before the C encoder fast path
+  return json.dumps(
+    replace_nan_inf(data, inplace=False),
+    sort_keys=True,
+    cls=_ComplexJsonEncoder,
+    separators=(',', ':'),
+    ensure_ascii=ensure_ascii,
+  )
+
+
+def _fast_dumps(data, ensure_ascii=False):
+  return json.dumps(
+    _to_canonical_json_data(data, replace_nan=True, inplace=False),
+    sort_keys=True,
+    separators=(',', ':'),
+    ensure_ascii=ensure_ascii,
+  )
+
+
+def _engine(ensure_ascii=False):
+  # `_dict_to_json` only needs the ascii flag, no keys or logger
+  engine = object.__new__(BaseBlockEngine)
+  engine._BaseBlockEngine__ensure_ascii_payloads = ensure_ascii
+  return engine
+
+
+SAMPLES = [
+  {},
+  {'a': 1, 'b': 'x', 'c': None, 'd': True, 'e': False},
+  {'f': 1.0, 'g': 1.5, 'h': -0.25, 'i': 100.0, 'j': 1e16, 'k': 1.5e-07, 'l': 0.1 + 0.2},
+  {'nan': float('nan'), 'inf': float('inf'), 'ninf': float('-inf')},
+  {'lst': [1.0, float('nan'), float('inf'), 2.5, None, 'x']},
+  {'np_f64': np.float64(1.5), 'np_f64_int': np.float64(3.0), 'np_f32': np.float32(0.5), 'np_f16': np.float16(2.0)},
+  {'np_i64': np.int64(7), 'np_i8': np.int8(-3), 'np_u32': np.uint32(4000000000)},
+  {'np_nan': np.float64('nan'), 'np_inf': np.float32('inf')},
+  {'arr_f': np.array([1.0, 2.5, 3.0]), 'arr_i': np.arange(4), 'arr_2d': np.array([[0.5, 1.0], [2.0, 2.25]])},
+  {'arr_f32': np.array([0.5, 1.0], dtype=np.float32), 'arr_list': [np.array([1, 2]), np.float64(4.0)]},
+  {'text': 'ăîșțâ ÄÖÜ 中文 😀', 'ключ': 'значение', 'esc': 'quote " backslash \\ newline \n tab \t'},
+  {'nested': {'a': {'b': {'c': [1.0, {'d': np.float64(2.0), 'e': [np.int32(1), 2.50]}]}}, 'z': (1.0, 2)}},
+  {'date': datetime.datetime(2024, 1, 2, 3, 4, 5)},
+  {'b': 2, 'a': {'y': 1, 'x': 0}},
+  {2: 'int keys', 1: np.float64(0.5)},
+]
+
+
+@pytest.mark.parametrize('ensure_ascii', [False, True])
+@pytest.mark.parametrize('data', SAMPLES)
+def test_fast_path_matches_legacy(data, ensure_ascii):
+  assert _fast_dumps(deepcopy(data), ensure_ascii) == _legacy_dumps(deepcopy(data), ensure_ascii)
+
+
+@pytest.mark.parametrize('data', SAMPLES)
+def test_dict_to_json_matches_legacy(data):
+  assert _engine()._dict_to_json(deepcopy(data)) == _legacy_dumps(deepcopy(data))
+
+
+def test_numpy_floats_serialized_as_plain_numbers():
+  data = {'a': np.float64(1.5), 'b': [np.float64(2.0)], 'c': np.float32(0.25)}
+  assert _legacy_dumps(data) == '{"a":1.5,"b":[2],"c":0.25}'
+  assert _fast_dumps(data) == '{"a":1.5,"b":[2],"c":0.25}'
+
+
+def test_nan_replaced_inplace():
+  data = {'a': float('nan'), 'b': {'c': float('inf')}, 'd': 1.0}
+  str_data = _engine()._dict_to_json(data, replace_nan=True, inplace=True)
+  assert str_data == '{"a":null,"b":{"c":null},"d":1}'
+  assert data == {'a': None, 'b': {'c': None}, 'd': 1.0}
+
+
+@pytest.mark.parametrize('value', [-0.0, 1.2e+20, np.float64(-0.0)])
+def test_non_canonical_floats_fall_back(value):
+  data = {'v': value}
+  with pytest.raises(_NonCanonicalData):
+    _to_canonical_json_data(data)
+  assert _engine()._dict_to_json(deepcopy(data)) == _legacy_dumps(deepcopy(data))
+
+
+def test_unsupported_types_fall_back():
+  data = {'s': {1, 2}}
+  with pytest.raises(_NonCanonicalData):
+    _to_canonical_json_data(data)
+  with pytest.raises(TypeError):
+    _engine()._dict_to_json(data)
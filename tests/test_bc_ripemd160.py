@@ -0,0 +1,58 @@
+import hashlib
+
+import pytest
+
+from PyE2.bc import base as bc_base
+
+
+def _hashlib_available():
+  try:
+    hashlib.new('ripemd160')
+  except Exception:
+    return False
+  return True
+
+
+BACKENDS = [
+  pytest.param(bc_base.ripemd160_python, id='python'),
+  pytest.param(
+    bc_base.ripemd160_hashlib, id='hashlib',
+    marks=pytest.mark.skipif(not _hashlib_available(), reason='ripemd160 not provided by this OpenSSL build'),
+  ),
+]
+
+# the test vectors from the RIPEMD-160 specification
+VECTORS = [
+  (b'', '9c1185a5c5e9fc54612808977ee8f548b2258d31'),
+  (b'a', '0bdc9d2d256b3ee9daae347be6f4dc835a467ffe'),
+  (b'abc', '8eb208f7e05d987a9b044a8e98c6b087f15a0bfc'),
+  (b'message digest', '5d0689ef49d2fae572b881b123a85ffa21595f36'),
+  (b'abcdefghijklmnopqrstuvwxyz', 'f71c27109c692c1b56bbdceb5b9d2865b3708dbc'),
+  (b'abcdbcdecdefdefgefghfghighijhijkijkljklmklmnlmnomnopnopq', '12a053384a9c0c88e405a06c27dcf49ada62eb2b'),
+  (b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789', 'b0e20b6e3116640286ed3a87a5713079b21f5189'),
+  (b'1234567890' * 8, '9b752e45573d4b39f4dbd3323cab82bf63326bfb'),
+  (b'a' * 1000000, '52783243c1697bdbe16d37f97f68f08325dc1528'),
+]
+
+
+@pytest.mark.parametrize('func', BACKENDS)
+@pytest.mark.parametrize('data, hexdigest', VECTORS, ids=lambda x: str(len(x)) if isinstance(x, bytes) else None)
+def test_ripemd160_vectors(func, data, hexdigest):
+  assert func(data).hex() == hexdigest
+
+
+def test_selected_backend():
+  assert bc_base.RIPEMD160_BACKEND in ('hashlib', 'python')
+  data, hexdigest = bc_base.RIPEMD160_TEST_VECTOR
+  assert bc_base.ripemd160(data).hex() == hexdigest
+  if _hashlib_available():
+    assert bc_base.RIPEMD160_BACKEND == 'hashlib'
+
+
+def test_hash160_cached():
+  data = b'\x02' + bytes(range(32))
+  expected = bc_base.ripemd160_python(hashlib.sha256(data).digest())
+  assert bc_base._hash160(data) == expected
+  hits = bc_base._hash160.cache_info().hits
+  assert bc_base._hash160(data) == expected
+  assert bc_base._hash160.cache_info().hits == hits + 1
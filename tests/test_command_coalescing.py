@@ -0,0 +1,54 @@
+import threading
+import time
+
+
+def _actions(session):
+  return [(to, msg['ACTION']) for to, msg in session.sent]
+
+
+def test_updates_are_coalesced_after_window(make_session):
+  session = make_session(command_coalescing_window=0.1)
+  session._send_command_update_instance_config('n1', 'p', 'SIG', 'i1', {'a': 1})
+  session._send_command_update_instance_config('n1', 'p', 'SIG', 'i2', {'a': 2})
+  assert session.sent == []
+  time.sleep(0.3)
+  assert _actions(session) == [('n1', 'BATCH_UPDATE_PIPELINE_INSTANCE')]
+  assert [u['INSTANCE_ID'] for u in session.sent[0][1]['PAYLOAD']] == ['i1', 'i2']
+
+
+def test_pending_updates_are_sent_before_other_commands(make_session):
+  session = make_session(command_coalescing_window=5)
+  session._send_command_update_instance_config('n1', 'p', 'SIG', 'i1', {'a': 1})
+  session._send_command_update_instance_config('n2', 'p', 'SIG', 'i1', {'a': 1})
+  session._send_command_archive_pipeline('n1', 'p')
+  # only the updates of the node that receives the command are flushed
+  assert _actions(session) == [('n1', 'UPDATE_PIPELINE_INSTANCE'), ('n1', 'ARCHIVE_CONFIG')]
+  session._send_command_delete_pipeline('n2', 'p')
+  assert _actions(session)[2:] == [('n2', 'UPDATE_PIPELINE_INSTANCE'), ('n2', 'DELETE_CONFIG')]
+
+
+def test_commands_wait_for_the_flush_in_progress(make_session):
+  session = make_session(command_coalescing_window=0.05)
+  sending_update = threading.Event()
+  release_update = threading.Event()
+  send_payload = session._send_payload
+
+  def _blocking_send_payload(to, msg):
+    if msg['ACTION'] == 'UPDATE_PIPELINE_INSTANCE':
+      sending_update.set()
+      release_update.wait(timeout=5)
+    send_payload(to, msg)
+    return
+
+  session._send_payload = _blocking_send_payload
+  session._send_command_update_instance_config('n1', 'p', 'SIG', 'i1', {'a': 1})
+  # the timer popped the pending update and is sending it
+  assert sending_update.wait(timeout=2)
+
+  sender = threading.Thread(target=session._send_command_archive_pipeline, args=('n1', 'p'))
+  sender.start()
+  time.sleep(0.2)
+  assert session.sent == []
+  release_update.set()
+  sender.join(timeout=2)
+  assert _actions(session) == [('n1', 'UPDATE_PIPELINE_INSTANCE'), ('n1', 'ARCHIVE_CONFIG')]
@@ -0,0 +1,50 @@
+from PyE2.io_formatter.base import BaseFormatter
+from PyE2.io_formatter.default.default import DefaultFormatter
+
+
+class _Log:
+  def P(self, *args, **kwargs):
+    return
+
+  def start_timer(self, *args, **kwargs):
+    return
+
+  def stop_timer(self, *args, **kwargs):
+    return
+
+
+class _CustomDecoder(DefaultFormatter):
+  def _decode_output(self, encoded_output):
+    return {**encoded_output, 'DECODED': True}
+
+
+class _Subclass(DefaultFormatter):
+  pass
+
+
+def _message(signature):
+  return {'EE_FORMATTER': signature, 'VALUE': 1}
+
+
+def test_default_formatter_is_identity():
+  formatter = DefaultFormatter(log=_Log(), signature='default')
+  message = _message('default')
+  assert formatter.decode_output(message) is message
+
+
+def test_subclass_overriding_decode_is_not_identity():
+  formatter = _CustomDecoder(log=_Log(), signature='custom')
+  assert formatter.decode_output(_message('custom')) == {'EE_FORMATTER': 'custom', 'VALUE': 1, 'DECODED': True}
+
+
+def test_subclass_keeping_decode_is_identity():
+  formatter = _Subclass(log=_Log(), signature='sub')
+  message = _message('sub')
+  assert formatter.decode_output(message) is message
+
+
+def test_other_formatter_messages_are_unchanged():
+  formatter = _CustomDecoder(log=_Log(), signature='custom')
+  message = _message('other')
+  assert formatter.decode_output(message) is message
+  assert BaseFormatter(log=_Log(), signature='base').decode_output(message) is message
@@ -0,0 +1,65 @@
+import json
+from copy import deepcopy
+
+NODE = '0xai_node1'
+
+HB = {
+  'EE_ID': 'node1',
+  'CONFIG_STREAMS': [{
+    'NAME': 'p1', 'TYPE': 'Void', 'URL': 'x',
+    'PLUGINS': [{'SIGNATURE': 'S1', 'INSTANCES': [{'INSTANCE_ID': 'i1', 'PARAM': 1}]}],
+  }],
+}
+
+
+def _on_heartbeat(session, hb, node=NODE):
+  session._GenericSession__on_heartbeat(deepcopy(hb), node, None, None, None)
+
+
+def _pipeline(session, name='p1', node=NODE):
+  return session._dct_online_nodes_pipelines[node][name]
+
+
+def test_unchanged_config_is_not_resynced(make_session, monkeypatch):
+  session = make_session()
+  _on_heartbeat(session, HB)
+  pipeline = _pipeline(session)
+  calls = []
+  monkeypatch.setattr(pipeline, '_sync_configuration_with_remote', lambda config: calls.append(config))
+  _on_heartbeat(session, HB)
+  assert calls == []
+  hb = deepcopy(HB)
+  hb['CONFIG_STREAMS'][0]['URL'] = 'y'
+  _on_heartbeat(session, hb)
+  assert len(calls) == 1
+
+
+def test_diverged_local_state_is_reset_from_heartbeat(make_session):
+  session = make_session()
+  _on_heartbeat(session, HB)
+  pipeline = _pipeline(session)
+  instance = pipeline.lst_plugin_instances[0]
+
+  # the local config changed (e.g. a confirmed update), the same heartbeat must reset it
+  pipeline.config = {**pipeline.config, 'URL': 'local'}
+  instance.config = {**instance.config, 'PARAM': 2}
+  _on_heartbeat(session, HB)
+  assert pipeline.config['URL'] == 'x'
+  assert instance.config['PARAM'] == 1
+
+  # an instance removed locally is restored
+  pipeline._Pipeline__remove_plugin_instance(instance)
+  assert pipeline.lst_plugin_instances == []
+  _on_heartbeat(session, HB)
+  assert [i.instance_id for i in pipeline.lst_plugin_instances] == ['i1']
+
+
+def test_lazy_heartbeats_are_plain_dicts_in_user_callback(make_session):
+  received = []
+  session = make_session(lazy_heartbeats=True, on_heartbeat=lambda sess, node, hb: received.append(hb))
+  encoded = session.log.compress_text(json.dumps({'CONFIG_STREAMS': HB['CONFIG_STREAMS'], 'CPU': 'x'}))
+  hb = {'EE_ID': 'node1', 'HEARTBEAT_VERSION': 'v2', 'ENCODED_DATA': encoded}
+  _on_heartbeat(session, hb)
+  assert len(received) == 1
+  assert type(received[0]) is dict
+  assert received[0]['CPU'] == 'x' and received[0]['EE_ID'] == 'node1'
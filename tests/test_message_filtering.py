@@ -0,0 +1,81 @@
+import json
+import time
+from copy import deepcopy
+
+from PyE2.utils import peek_json_string_field
+
+NODE = '0xai_node1'
+OTHER = '0xai_node2'
+
+HB = {
+  'EE_ID': 'node1',
+  'CONFIG_STREAMS': [{
+    'NAME': 'p1', 'TYPE': 'Void',
+    'PLUGINS': [{'SIGNATURE': 'S1', 'INSTANCES': [{'INSTANCE_ID': 'i1'}]}],
+  }],
+}
+
+
+def _payload(sender, **fields):
+  return {
+    'EE_SENDER': sender, 'EE_ID': 'node', 'EE_PAYLOAD_PATH': ['node', 'p1', 'S1', 'i1'], **fields,
+  }
+
+
+def _wait(predicate, timeout=2):
+  end = time.time() + timeout
+  while time.time() < end and not predicate():
+    time.sleep(0.01)
+  return predicate()
+
+
+def test_peek_json_string_field():
+  message = json.dumps({'EE_SENDER': '0xai_a', 'DATA': {'X': 1}})
+  assert peek_json_string_field(message, 'EE_SENDER') == '0xai_a'
+  assert peek_json_string_field('{"EE_SENDER" : "0xai_a"}', 'EE_SENDER') == '0xai_a'
+  assert peek_json_string_field(message, 'MISSING') is None
+  # ambiguous: the key also appears in a nested object
+  nested = json.dumps({'EE_SENDER': '0xai_a', 'INNER': {'EE_SENDER': '0xai_b'}})
+  assert peek_json_string_field(nested, 'EE_SENDER') is None
+  # not a plain string value
+  assert peek_json_string_field(json.dumps({'EE_SENDER': 'a"b'}), 'EE_SENDER') is None
+  assert peek_json_string_field(json.dumps({'EE_SENDER': 1}), 'EE_SENDER') is None
+
+
+def test_filtered_payloads_dropped_before_parsing(make_session, monkeypatch):
+  received = []
+  session = make_session(filter_workers=[NODE], on_payload=lambda sess, node, *args: received.append(node))
+  is_filtered = session._GenericSession__is_filtered_raw_message
+  assert is_filtered(json.dumps(_payload(OTHER)))
+  assert not is_filtered(json.dumps(_payload(NODE)))
+  # no cheap sender: left to the full parsing
+  assert not is_filtered(json.dumps({'DATA': 1}))
+
+  decoded = []
+  decode = session._GenericSession__decode_message
+  monkeypatch.setattr(session, '_GenericSession__decode_message', lambda msg: decoded.append(msg) or decode(msg))
+  session._payload_messages.append(json.dumps(_payload(OTHER)))
+  session._payload_messages.append(json.dumps(_payload(NODE)))
+  assert _wait(lambda: len(received) == 1)
+  assert received == [NODE]
+  assert len(decoded) == 1 and OTHER not in decoded[0]
+
+
+def test_payload_keys_only_restrict_user_callbacks(make_session):
+  session_payloads = []
+  session = make_session(
+    payload_keys=['A'],
+    on_payload=lambda sess, node, pipeline, signature, instance, payload: session_payloads.append(payload),
+  )
+  session._GenericSession__on_heartbeat(deepcopy(HB), NODE, None, None, None)
+  pipeline = session._dct_online_nodes_pipelines[NODE]['p1']
+  session._GenericSession__register_own_pipeline(pipeline)
+  instance = pipeline.lst_plugin_instances[0]
+  user_payloads, internal_payloads = [], []
+  instance.on_data_callbacks.append(lambda pipeline, payload: user_payloads.append(payload))
+  instance.temporary_on_data_callbacks['wait'] = lambda pipeline, payload: internal_payloads.append(payload)
+
+  session._GenericSession__on_payload(_payload(NODE, A=1, B=2), NODE, 'p1', 'S1', 'i1')
+  assert 'B' not in user_payloads[0] and user_payloads[0]['A'] == 1
+  assert 'B' not in session_payloads[0] and session_payloads[0]['EE_SENDER'] == NODE
+  assert internal_payloads[0]['B'] == 2
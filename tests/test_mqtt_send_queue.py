@@ -0,0 +1,83 @@
+import time
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from PyE2.comm import MQTTWrapper
+
+
+class _Log:
+  def P(self, *args, **kwargs):
+    return
+
+
+class _FakeClient:
+  def __init__(self, rc):
+    self.rc = rc
+    self.published = []
+
+  def publish(self, topic, payload, qos):
+    self.published.append((topic, payload))
+    return SimpleNamespace(rc=self.rc)
+
+
+def _wrapper(qos, client, **kwargs):
+  config = {
+    'HOST': 'localhost', 'PORT': 1883, 'USER': 'u', 'PASS': 'p', 'QOS': qos,
+    'CONFIG_CHANNEL': {'TOPIC': 'root/{}/config'},
+  }
+  wrapper = MQTTWrapper(log=_Log(), config=config, send_channel_name='CONFIG_CHANNEL', send_queue_size=10, **kwargs)
+  wrapper._mqttc = client
+  return wrapper
+
+
+def _wait(predicate, timeout=2):
+  end = time.time() + timeout
+  while time.time() < end and not predicate():
+    time.sleep(0.01)
+  return predicate()
+
+
+def test_no_conn_with_qos_is_handed_off_once():
+  client = _FakeClient(mqtt.MQTT_ERR_NO_CONN)
+  wrapper = _wrapper(1, client)
+  for i in range(5):
+    wrapper.send('msg{}'.format(i), send_to='n1')
+  assert _wait(lambda: wrapper.send_queue_depth == 0)
+  time.sleep(0.3)
+  # paho keeps QoS>0 messages while disconnected, so they must not be published again
+  assert [m for _, m in client.published] == ['msg{}'.format(i) for i in range(5)]
+  assert client.published[0][0] == 'root/n1/config'
+  wrapper.stop_send_thread(flush=False)
+
+
+@pytest.mark.parametrize('qos, rc', [(0, mqtt.MQTT_ERR_NO_CONN), (1, mqtt.MQTT_ERR_QUEUE_SIZE)])
+def test_rejected_messages_are_requeued_in_order(qos, rc):
+  client = _FakeClient(rc)
+  wrapper = _wrapper(qos, client)
+  for i in range(3):
+    wrapper.send('msg{}'.format(i), send_to='n1')
+  assert _wait(lambda: len(client.published) >= 2)
+  assert wrapper.send_queue_depth == 3
+  client.rc = mqtt.MQTT_ERR_SUCCESS
+  assert _wait(lambda: wrapper.send_queue_depth == 0)
+  assert [m for _, m in client.published[-3:]] == ['msg0', 'msg1', 'msg2']
+  wrapper.stop_send_thread(flush=False)
+
+
+def test_block_policy_times_out():
+  wrapper = _wrapper(0, None, send_queue_block_timeout=0.2)
+  # no client: nothing is accepted and the queue fills up
+  for i in range(10):
+    wrapper.send('msg{}'.format(i), send_to='n1')
+  start = time.time()
+  with pytest.raises(ValueError):
+    wrapper.send('one too many', send_to='n1')
+  assert 0.15 < time.time() - start < 2
+  assert wrapper.stop_send_thread(flush=False) == 0
+
+
+def test_block_timeout_default_is_finite():
+  wrapper = _wrapper(0, None)
+  assert wrapper._send_queue_block_timeout is not None
@@ -0,0 +1,80 @@
+from collections import deque
+
+from PyE2.comm import MQTTWrapper
+from PyE2.const import comms as comm_ct
+
+
+class _Log:
+  def P(self, *args, **kwargs):
+    return
+
+
+PAYLOADS = comm_ct.COMMUNICATION_PAYLOADS_CHANNEL
+CTRL = comm_ct.COMMUNICATION_CTRL_CHANNEL
+NOTIF = comm_ct.COMMUNICATION_NOTIF_CHANNEL
+
+
+def _config():
+  return {
+    'HOST': 'localhost', 'PORT': 1883, 'USER': 'u', 'PASS': 'p', 'QOS': 1,
+    PAYLOADS: {'TOPIC': 'root/payloads', 'NODE_TOPIC': 'root/{}/payloads'},
+    CTRL: {'TOPIC': 'root/ctrl', 'NODE_TOPIC': 'root/{}/ctrl'},
+    NOTIF: {'TOPIC': 'root/notif', 'NODE_TOPIC': 'root/{}/notif'},
+  }
+
+
+def _wrapper(recv_channel_name, **kwargs):
+  if isinstance(recv_channel_name, list):
+    recv_buff = {channel_name: deque() for channel_name in recv_channel_name}
+  else:
+    recv_buff = deque()
+  return MQTTWrapper(
+    log=_Log(), config=_config(), recv_channel_name=recv_channel_name, recv_buff=recv_buff, **kwargs
+  )
+
+
+def _topics(recv_channel_name, **kwargs):
+  wrapper = _wrapper(recv_channel_name, **kwargs)
+  return wrapper._MQTTWrapper__get_subscription_topics()
+
+
+def test_without_recv_nodes_the_channel_topic_is_used():
+  assert _topics(PAYLOADS) == ['root/payloads']
+
+
+def test_recv_nodes_subscribe_per_node_topics():
+  assert _topics(PAYLOADS, recv_nodes=['n1', 'n2']) == ['root/n1/payloads', 'root/n2/payloads']
+
+
+def test_recv_channel_def_uses_per_node_topics():
+  wrapper = _wrapper(NOTIF, recv_nodes=['n1'])
+  channel_def = wrapper.recv_channel_def
+  assert channel_def['TOPIC'] == ['root/n1/notif']
+  assert 'NODE_TOPIC' not in channel_def
+
+
+def test_recv_nodes_channels_keep_the_heartbeats_of_all_nodes():
+  topics = _topics(
+    [PAYLOADS, CTRL, NOTIF],
+    recv_nodes=['n1'],
+    recv_nodes_channels=[PAYLOADS, NOTIF],
+  )
+  assert topics == ['root/n1/payloads', 'root/ctrl', 'root/n1/notif']
+
+
+def test_consumer_group_shares_only_its_channels():
+  topics = _topics(
+    [PAYLOADS, CTRL, NOTIF],
+    consumer_group='grp',
+    consumer_group_channels=[PAYLOADS],
+  )
+  assert topics == ['$share/grp/root/payloads', 'root/ctrl', 'root/notif']
+
+
+def test_consumer_group_shares_all_channels_by_default():
+  assert _topics([PAYLOADS, CTRL], consumer_group='grp') == ['$share/grp/root/payloads', '$share/grp/root/ctrl']
+
+
+def test_consumer_group_with_recv_nodes():
+  topics = _topics(PAYLOADS, recv_nodes=['n1', 'n2'], consumer_group='grp')
+  assert topics == ['$share/grp/root/n1/payloads', '$share/grp/root/n2/payloads']
@@ -0,0 +1,137 @@
+import json
+from threading import Thread
+
+import numpy as np
+import pytest
+
+from PyE2.base.node_registry import MetricsRingBuffer, NodeRegistry
+from PyE2.base.payload import LazyHeartbeat
+
+
+def test_seen_names_and_addresses():
+  registry = NodeRegistry(initial_capacity=2)
+  registry.seen('addr1', 'node1')
+  registry.seen('addr2', 'node2')
+  registry.seen('addr3')
+  assert len(registry) == 3 and 'addr3' in registry
+  assert registry.get_address('node1') == 'addr1'
+  assert registry.get_name('addr2') == 'node2'
+  assert registry.get_names() == {'addr1': 'node1', 'addr2': 'node2', 'addr3': None}
+  # renamed node: the old name does not resolve anymore
+  registry.seen('addr1', 'node1b')
+  assert registry.get_address('node1') is None
+  assert registry.get_address('node1b') == 'addr1'
+
+
+def test_active_nodes_by_recency(monkeypatch):
+  registry = NodeRegistry()
+  now = [1000.0]
+  monkeypatch.setattr('PyE2.base.node_registry.tm', lambda: now[0])
+  registry.seen('a')
+  now[0] += 10
+  registry.seen('b')
+  now[0] += 10
+  registry.seen('c')
+  assert registry.get_active_nodes(timeout=15) == ['b', 'c']
+  registry.seen('a')
+  assert registry.get_active_nodes(timeout=15) == ['b', 'c', 'a']
+  assert registry.is_active('a', 5) and not registry.is_active('b', 5)
+  assert not registry.is_active('unknown', 5)
+  assert registry.get_last_seen('a') == now[0]
+
+
+def test_allowed_supervisors_and_metrics():
+  registry = NodeRegistry(initial_capacity=1)
+  registry.seen('a')
+  registry.seen('b')
+  registry.update_heartbeat('a', {'EE_IS_SUPER': True, 'CPU_USED': 12.5, 'COMM_STATS': {'IN_KB': 3}})
+  registry.update_heartbeat('b', {'CPU_USED': 'n/a', 'DEVICE_LOG': list(range(10))})
+  registry.set_allowed('b', True)
+  assert registry.get_allowed_nodes(60) == ['b']
+  assert registry.get_active_supervisors(60) == ['a']
+  addresses, columns = registry.get_metrics(metrics=['CPU_USED', 'IN_KB'])
+  assert addresses == ['a', 'b']
+  assert columns['CPU_USED'][0] == 12.5 and np.isnan(columns['CPU_USED'][1])
+  assert columns['IN_KB'][0] == 3
+  # the bulky fields are not kept by default
+  assert 'DEVICE_LOG' not in registry.get_last_heartbeat('b')
+
+
+def test_heavy_fields_capped():
+  registry = NodeRegistry(keep_heavy_fields=True, heavy_fields_max_len=3)
+  registry.update_heartbeat('a', {'DEVICE_LOG': list(range(10))})
+  assert registry.get_last_heartbeat('a')['DEVICE_LOG'] == [7, 8, 9]
+
+
+def test_lazy_heartbeat_decoded_on_query():
+  decoded = []
+
+  def _decode(data):
+    decoded.append(data)
+    return json.loads(data)
+
+  registry = NodeRegistry()
+  heartbeat = LazyHeartbeat({'ENCODED_DATA': json.dumps({'CPU_USED': 7})}, _decode)
+  registry.seen('a')
+  registry.update_heartbeat('a', heartbeat)
+  assert decoded == []
+  _, columns = registry.get_metrics(metrics=['CPU_USED'])
+  assert columns['CPU_USED'][0] == 7
+  assert len(decoded) == 1
+
+
+def test_concurrent_growth_does_not_lose_writes():
+  registry = NodeRegistry(initial_capacity=1)
+  nr_threads, nr_nodes = 8, 200
+
+  def _worker(idx):
+    for i in range(nr_nodes):
+      addr = 'n{}_{}'.format(idx, i)
+      registry.seen(addr)
+      registry.set_allowed(addr, True)
+      registry.update_heartbeat(addr, {'CPU_USED': i})
+  threads = [Thread(target=_worker, args=(idx,)) for idx in range(nr_threads)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(registry) == nr_threads * nr_nodes
+  assert len(registry.get_allowed_nodes(60)) == nr_threads * nr_nodes
+  addresses, columns = registry.get_metrics(metrics=['CPU_USED'])
+  assert not np.isnan(columns['CPU_USED']).any()
+  assert all(int(addr.split('_')[1]) == value for addr, value in zip(addresses, columns['CPU_USED']))
+
+
+def test_ring_buffer_wraps_in_chronological_order():
+  buffer = MetricsRingBuffer(size=3, nr_metrics=2)
+  assert len(buffer) == 0
+  for t in range(5):
+    buffer.append(float(t), [t, 10 * t])
+  assert len(buffer) == 3
+  times, values = buffer.get()
+  assert times.tolist() == [2.0, 3.0, 4.0]
+  assert values[:, 1].tolist() == [20, 30, 40]
+  times, values = buffer.get(window=1.5, now=4.0)
+  assert times.tolist() == [3.0, 4.0]
+  # the returned arrays are copies
+  values[:] = -1
+  assert buffer.get()[1][0, 0] == 2
+
+
+def test_history_stats(monkeypatch):
+  registry = NodeRegistry(history_size=4)
+  now = [100.0]
+  monkeypatch.setattr('PyE2.base.node_registry.tm', lambda: now[0])
+  for i, value in enumerate([1, 2, 4, None, 8, 16]):
+    now[0] = 100.0 + i
+    registry.update_heartbeat('a', {'NR_PAYLOADS': value})
+  times, values = registry.get_history('a', 'NR_PAYLOADS')
+  assert times.tolist() == [102.0, 103.0, 104.0, 105.0]
+  assert registry.get_history_stat('a', 'NR_PAYLOADS', 'last') == 16
+  assert registry.get_history_stat('a', 'NR_PAYLOADS', 'min') == 4
+  assert registry.get_history_stat('a', 'NR_PAYLOADS', 'mean') == pytest.approx(28 / 3)
+  assert registry.get_history_stat('a', 'NR_PAYLOADS', 'rate') == pytest.approx((16 - 4) / 3)
+  assert registry.get_history_stat('a', 'NR_PAYLOADS', 'max', window=2.5) == 16
+  assert np.isnan(registry.get_history_stat('unknown', 'NR_PAYLOADS'))
+  with pytest.raises(ValueError):
+    registry.get_history_stat('a', 'NR_PAYLOADS', 'median')
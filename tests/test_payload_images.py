@@ -0,0 +1,75 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+
+from PyE2 import Payload
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _b64_png(value):
+  buffer = io.BytesIO()
+  Image.fromarray(np.full((4, 5, 3), value, dtype=np.uint8)).save(buffer, format='PNG')
+  return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_images_decoded_once_and_cached():
+  payload = Payload({'IMG': [_b64_png(10), None, _b64_png(20)]})
+  images = payload.get_images_as_np(read_only=True)
+  assert images[1] is None
+  assert images[0].shape == (4, 5, 3) and images[2][0, 0, 0] == 20
+  again = payload.get_images_as_np(read_only=True)
+  assert again[0] is images[0] and again[2] is images[2]
+  # the list itself is not shared
+  assert again is not images
+
+
+def test_images_are_writable_copies_by_default(monkeypatch):
+  payload = Payload({'IMG': _b64_png(10)})
+  image = payload.get_images_as_np()[0]
+  assert image.flags.writeable
+  image[0, 0, 0] = 255
+  # the next call is served from the cache, not affected by the edit
+  monkeypatch.setattr(payload, '_np_image_from_b64', None)
+  again = payload.get_images_as_np()[0]
+  assert again is not image and again[0, 0, 0] == 10
+
+
+def test_read_only_images_are_shared():
+  payload = Payload({'IMG': _b64_png(10)})
+  image = payload.get_images_as_np(read_only=True)[0]
+  with pytest.raises(ValueError):
+    image[0, 0, 0] = 255
+  assert payload.get_images_as_np(read_only=True)[0] is image
+  assert payload.get_images_as_np()[0] is not image
+
+
+def test_uncached_images_are_writable_and_fresh():
+  payload = Payload({'IMG': _b64_png(10)})
+  cached = payload.get_images_as_np(read_only=True)[0]
+  image = payload.get_images_as_np(use_cache=False)[0]
+  assert image is not cached and image.flags.writeable
+  image[0, 0, 0] = 255
+  assert payload.get_images_as_np()[0][0, 0, 0] == 10
+
+
+def test_cache_invalidated_when_source_changes():
+  payload = Payload({'IMG': _b64_png(10)})
+  first = payload.get_images_as_np(read_only=True)[0]
+  payload['IMG'] = _b64_png(30)
+  second = payload.get_images_as_np(read_only=True)[0]
+  assert second is not first and second[0, 0, 0] == 30
+
+
+def test_parallel_decoding_matches_sequential():
+  lst_b64 = [_b64_png(v) for v in range(0, 80, 10)]
+  sequential = Payload({'IMG': lst_b64}).get_images_as_np(use_cache=False)
+  parallel = Payload({'IMG': lst_b64}).get_images_as_np(num_workers=4, use_cache=False)
+  assert all(np.array_equal(a, b) for a, b in zip(sequential, parallel))
+
+
+def test_unknown_backend():
+  with pytest.raises(ValueError):
+    Payload({'IMG': _b64_png(1)}).get_images_as_np(backend='unknown')
@@ -0,0 +1,68 @@
+import gc
+import time
+import weakref
+from threading import Event
+
+from PyE2.utils import TimerScheduler
+
+
+class _Log:
+  def __init__(self):
+    self.messages = []
+
+  def P(self, msg, **kwargs):
+    self.messages.append(msg)
+
+
+def test_callbacks_fire_in_deadline_order():
+  scheduler = TimerScheduler()
+  fired = []
+  done = Event()
+  scheduler.schedule(0.15, lambda: (fired.append(3), done.set()))
+  scheduler.schedule(0.05, fired.append, 1)
+  scheduler.schedule(0.10, fired.append, 2)
+  assert done.wait(2)
+  assert fired == [1, 2, 3]
+  scheduler.close()
+
+
+def test_cancelled_timer_does_not_fire_and_is_released():
+  class Target:
+    pass
+  target = Target()
+  ref = weakref.ref(target)
+  fired = []
+  scheduler = TimerScheduler()
+  timer = scheduler.schedule(0.05, fired.append, target)
+  timer.cancel()
+  del target
+  gc.collect()
+  # the cancelled timer does not keep its arguments alive until the deadline
+  assert ref() is None
+  time.sleep(0.15)
+  assert fired == []
+  scheduler.close()
+
+
+def test_cancelled_timers_are_removed_from_heap():
+  scheduler = TimerScheduler()
+  timers = [scheduler.schedule(60, lambda: None) for _ in range(100)]
+  for timer in timers[:90]:
+    timer.cancel()
+  assert len(scheduler) <= 20
+  scheduler.close()
+
+
+def test_callback_exceptions_are_logged():
+  log = _Log()
+  scheduler = TimerScheduler(log=log)
+  done = Event()
+
+  def _fail():
+    raise RuntimeError("boom")
+
+  scheduler.schedule(0.01, _fail)
+  scheduler.schedule(0.05, done.set)
+  assert done.wait(2)
+  assert len(log.messages) == 1 and 'boom' in log.messages[0]
+  scheduler.close()
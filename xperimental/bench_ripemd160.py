@@ -0,0 +1,32 @@
+"""
+Compares the RIPEMD-160 backends of `PyE2.bc` and the cached HASH160 on public key sized inputs.
+
+  python xperimental/bench_ripemd160.py
+"""
+import os
+import timeit
+from hashlib import sha256
+
+from PyE2.bc import base as bc_base
+
+
+def bench(name, func, number):
+  seconds = min(timeit.repeat(func, number=number, repeat=5))
+  print("{:<28} {:>10.2f} us/call".format(name, seconds / number * 1e6))
+  return
+
+
+if __name__ == '__main__':
+  pk = b'\x02' + os.urandom(32)
+  digest = sha256(pk).digest()
+  print("Selected backend: {}".format(bc_base.RIPEMD160_BACKEND))
+
+  bench('ripemd160_python', lambda: bc_base.ripemd160_python(digest), number=2000)
+  try:
+    bc_base.ripemd160_hashlib(digest)
+    bench('ripemd160_hashlib', lambda: bc_base.ripemd160_hashlib(digest), number=200000)
+  except Exception as e:
+    print("ripemd160_hashlib not available: {}".format(e))
+
+  bench('hash160 (uncached)', lambda: bc_base.ripemd160(sha256(pk).digest()), number=200000)
+  bench('_hash160 (cached)', lambda: bc_base._hash160(pk), number=200000)